@@ -0,0 +1,50 @@
+# actions.py
+
+import numpy as np
+import pandas as pd
+
+
+def clean_actions(values):
+    return pd.Series(values, dtype=object).fillna('').astype(str).str.strip().to_numpy()
+
+
+def apply_actions(df, actions):
+    # Fill the 'Action' column from the per-item delta; only that column is rebuilt
+    df = df.copy(deep=False)
+    if actions:
+        df['Action'] = df['Name'].map(actions).astype(object).fillna('').to_numpy()
+    else:
+        df['Action'] = ''
+    return df
+
+
+def record_actions(actions, shown_df, grid_df):
+    # Store what changed between the rows shown in the grid and what came back from it.
+    # Rows are matched by item name, not position: the grid returns its rows sorted and filtered
+    # the way the user left them. Non-empty actions are kept per item name, cleared actions are dropped.
+    # Returns the number of items changed.
+    if grid_df is None or len(grid_df) == 0:
+        return 0
+    shown_names = clean_actions(shown_df['Name'].to_numpy())
+    before = pd.Series(clean_actions(shown_df['Action'].to_numpy()), index=shown_names)
+    before = before[~before.index.duplicated()]
+
+    names = clean_actions(grid_df['Name'].to_numpy())
+    after = clean_actions(grid_df['Action'].to_numpy())
+    known = (names != '') & pd.Index(names).isin(before.index)
+    previous = before.reindex(names).to_numpy(dtype=object)
+
+    # A name shown on several rows takes the action of the row that was edited
+    changed = np.flatnonzero(known & (previous != after))
+    updates = dict(zip(names[changed], after[changed]))
+    for name, action in updates.items():
+        if action:
+            actions[name] = action
+        else:
+            actions.pop(name, None)
+    return len(updates)
+
+
+def group_by_action(df):
+    # One group-by pass instead of a boolean mask per action
+    return [(action, action_df) for action, action_df in df.groupby('Action', sort=False)]
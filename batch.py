@@ -0,0 +1,197 @@
+# batch.py
+#
+# Headless batch mode: process a directory of stocktake exports without the Streamlit app.
+#
+#     python batch.py exports/ reports/ --workers 8
+
+import argparse
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from catalog import DEFAULT_CATALOG_PATH, get_catalog
+from export import write_orders_xlsx
+from history import DEFAULT_HISTORY_DIR, HistoryStore
+from instrumentation import RunMetrics, configure_logging, get_logger
+from ingest import read_stocktake
+from reconcile import DEFAULT_MAPPINGS_PATH, MappingStore, apply_mappings
+from reorder import orders_by_supplier
+from variance import DEFAULT_THRESHOLDS, VARIANCE_DROP_COLUMNS, VarianceBands
+
+STOCKTAKE_EXTENSIONS = ('.xls', '.xlsx')
+
+SUMMARY_COLUMNS = ['Site', 'File', 'Status', 'Rows', 'Variance Rows', 'Items To Order', 'Seconds', 'Error']
+
+logger = get_logger('batch')
+
+
+def slugify(text):
+    return re.sub(r'[^A-Za-z0-9]+', '_', str(text)).strip('_').lower() or 'unnamed'
+
+
+def find_stocktakes(input_dir):
+    return sorted(
+        os.path.join(input_dir, name) for name in os.listdir(input_dir)
+        if name.lower().endswith(STOCKTAKE_EXTENSIONS) and not name.startswith('~$')
+    )
+
+
+def site_name(path):
+    return slugify(os.path.splitext(os.path.basename(path))[0])
+
+
+def site_collisions(paths):
+    # Files whose names slugify to the same site ('Soho.xlsx' and 'soho.xls') would write the same report
+    # directory and history partition from different worker processes; none of them is processed
+    by_site = {}
+    for path in paths:
+        by_site.setdefault(site_name(path), []).append(path)
+    return {site: site_paths for site, site_paths in by_site.items() if len(site_paths) > 1}
+
+
+########################################################################################################
+##########################                    PER-FILE WORK             ################################
+########################################################################################################
+
+def variance_report(df, thresholds=DEFAULT_THRESHOLDS):
+    # Gains then losses, largest first, with the band each row fell into
+    bands = VarianceBands(df, thresholds)
+    columns = [column for column in df.columns if column not in VARIANCE_DROP_COLUMNS]
+    labels = np.asarray(bands.labels(), dtype=object)
+
+    report = pd.concat([bands.positive(columns), bands.negative(columns)])
+    report['Band'] = np.concatenate([labels[bands.positive_rows], labels[bands.negative_rows]])
+    return report
+
+
+def process_stocktake(path, output_dir, catalog_path, mappings_path, thresholds, history_dir=None, count_date=None):
+    site = site_name(path)
+    summary = dict.fromkeys(SUMMARY_COLUMNS, '')
+    summary.update({'Site': site, 'File': path})
+    metrics = RunMetrics(run=f'batch:{site}')
+
+    try:
+        catalog = get_catalog(catalog_path)
+        with metrics.stage('ingest'):
+            df = read_stocktake(path)
+            df = apply_mappings(df, MappingStore(mappings_path).mappings())
+        metrics.count('rows', len(df))
+        if history_dir is not None:
+            with metrics.stage('history'):
+                HistoryStore(history_dir).append(df, site, count_date)
+
+        site_dir = os.path.join(output_dir, site)
+        os.makedirs(site_dir, exist_ok=True)
+
+        with metrics.stage('filter'):
+            report = variance_report(df, thresholds)
+        with metrics.stage('write'):
+            report.to_csv(os.path.join(site_dir, 'variance.csv'), index=False)
+
+        with metrics.stage('reorder'):
+            supplier_orders = orders_by_supplier(df, catalog.par_table, catalog.suppliers)
+        with metrics.stage('write'):
+            for supplier, supplier_order_df in supplier_orders.items():
+                supplier_order_df.to_csv(os.path.join(site_dir, f'orders_{slugify(supplier)}.csv'), index=False)
+            with open(os.path.join(site_dir, 'orders.xlsx'), 'wb') as handle:
+                write_orders_xlsx(supplier_orders, handle)
+
+        summary.update({
+            'Status': 'ok',
+            'Rows': len(df),
+            'Variance Rows': len(report),
+            'Items To Order': sum(len(orders) for orders in supplier_orders.values()),
+        })
+    except Exception as error:
+        # One bad export must not stop the rest of the night's run
+        summary.update({'Status': 'error', 'Error': f'{type(error).__name__}: {error}'})
+        logger.error('stocktake failed', extra={'site': site, 'file': path, 'error': summary['Error']})
+    summary['Seconds'] = round(metrics.finish()['total_ms'] / 1000, 3)
+    return summary
+
+
+def run_batch(input_dir, output_dir, workers=None, catalog_path=DEFAULT_CATALOG_PATH,
+              mappings_path=DEFAULT_MAPPINGS_PATH, thresholds=DEFAULT_THRESHOLDS, history_dir=None, count_date=None):
+    paths = find_stocktakes(input_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    summaries = []
+    collisions = site_collisions(paths)
+    for site, site_paths in collisions.items():
+        logger.error('site name collision', extra={'site': site, 'files': site_paths})
+        for path in site_paths:
+            others = ', '.join(os.path.basename(other) for other in site_paths if other != path)
+            summary = dict.fromkeys(SUMMARY_COLUMNS, '')
+            summary.update({'Site': site, 'File': path, 'Status': 'error',
+                            'Error': f"Site name '{site}' is shared with {others}; rename the files so each site is unique"})
+            summaries.append(summary)
+    paths = [path for path in paths if site_name(path) not in collisions]
+
+    if workers == 1:
+        for path in paths:
+            summaries.append(process_stocktake(path, output_dir, catalog_path, mappings_path, thresholds,
+                                               history_dir, count_date))
+    else:
+        # One file per task; each worker process builds the catalog once and reuses it
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(process_stocktake, path, output_dir, catalog_path, mappings_path, thresholds,
+                                       history_dir, count_date)
+                       for path in paths]
+            for future in as_completed(futures):
+                summaries.append(future.result())
+
+    summary_df = pd.DataFrame(summaries, columns=SUMMARY_COLUMNS).sort_values('Site', kind='stable')
+    summary_df.to_csv(os.path.join(output_dir, 'summary.csv'), index=False)
+    return summary_df
+
+
+########################################################################################################
+##########################                    COMMAND LINE              ################################
+########################################################################################################
+
+def parse_thresholds(text):
+    return tuple(float(value) for value in text.split(','))
+
+
+def parse_count_date(text):
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{text!r} is not an ISO date (YYYY-MM-DD)') from None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build order lists and variance reports for a directory of stocktakes.')
+    parser.add_argument('input_dir', help='directory containing .xls/.xlsx stocktake exports')
+    parser.add_argument('output_dir', help='directory for per-site reports')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per core)')
+    parser.add_argument('--catalog', default=DEFAULT_CATALOG_PATH, help='catalog CSV or SQLite file')
+    parser.add_argument('--mappings', default=DEFAULT_MAPPINGS_PATH, help='accepted name mappings JSON')
+    parser.add_argument('--thresholds', type=parse_thresholds, default=DEFAULT_THRESHOLDS,
+                        help='comma-separated variance band edges, e.g. 5,10,20,30')
+    parser.add_argument('--history', nargs='?', const=DEFAULT_HISTORY_DIR, default=None, metavar='DIR',
+                        help='also append each stocktake to the history store (site = file name)')
+    parser.add_argument('--count-date', type=parse_count_date, default=None,
+                        help='count date for the history store, YYYY-MM-DD (default: today)')
+    parser.add_argument('--log-level', default='WARNING', help='structured log level (DEBUG, INFO, WARNING, ...)')
+    args = parser.parse_args(argv)
+    configure_logging(args.log_level)
+
+    summary_df = run_batch(args.input_dir, args.output_dir, workers=args.workers, catalog_path=args.catalog,
+                           mappings_path=args.mappings, thresholds=args.thresholds, history_dir=args.history,
+                           count_date=args.count_date)
+
+    failed = summary_df[summary_df['Status'] == 'error']
+    print(f"Processed {len(summary_df)} stocktakes, {len(failed)} failed.")
+    for _, row in failed.iterrows():
+        print(f"  {row['File']}: {row['Error']}")
+    return 1 if len(failed) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+# benchmark.py
+#
+# Time and peak-memory benchmarks for the stocktake data path on synthetic exports.
+#
+#     python benchmark.py --sizes 1000,10000,100000 --save-baseline   # record a baseline
+#     python benchmark.py --sizes 1000,10000,100000                   # compare, exit 1 on regression, 2 without a baseline
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+from catalog import get_catalog
+from reconcile import apply_mappings, reconcile_names
+from reorder import orders_by_supplier
+from stocktake_generator import BENCHMARK_DIR, cached_stocktake_bytes
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+
+# A run fails when a metric exceeds its baseline by more than this fraction
+DEFAULT_THRESHOLD = 0.25
+
+# Timings below this many seconds are too noisy to fail a run on
+MIN_SECONDS = 0.005
+
+
+def app_functions():
+    # Imported lazily: inventory_app pulls in Streamlit, which is slow to import
+    import inventory_app
+    return inventory_app
+
+
+########################################################################################################
+##########################                    MEASUREMENT               ################################
+########################################################################################################
+
+def measure(function, repeat=3):
+    # Best-of-N wall time, then one extra run under tracemalloc for the peak allocation
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(seconds), 'peak_mb': peak / (1024 * 1024)}
+
+
+def benchmark_size(n_rows, repeat=3, seed=0):
+    app = app_functions()
+    catalog = get_catalog()
+    items_info = catalog.items_info()
+    data = cached_stocktake_bytes(n_rows, seed=seed, names=catalog.names)
+
+    # Inputs for the later stages come from one untimed load
+    df = app.load_and_filter_excel(BytesIO(data))
+
+    def data_path():
+        # Everything main() computes for an upload, without rendering
+        loaded = app.load_and_filter_excel(BytesIO(data))
+        loaded = apply_mappings(loaded, {})
+        reconcile_names(loaded, catalog)
+        app.filter_data_for_second_table(loaded)
+        orders_by_supplier(loaded, catalog.par_table, catalog.suppliers)
+
+    cases = {
+        'load_and_filter_excel': lambda: app.load_and_filter_excel(BytesIO(data)),
+        'filter_data_for_second_table': lambda: app.filter_data_for_second_table(df),
+        'check_inventory_needs': lambda: app.check_inventory_needs(df, items_info),
+        'main_data_path': data_path,
+    }
+    return {name: measure(case, repeat=repeat) for name, case in cases.items()}
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=3, seed=0):
+    results = {}
+    for n_rows in sizes:
+        for name, result in benchmark_size(n_rows, repeat=repeat, seed=seed).items():
+            results[f'{name}[{n_rows}]'] = result
+    return results
+
+
+########################################################################################################
+##########################                    BASELINES                 ################################
+########################################################################################################
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    # Returns a list of (case, metric, baseline, current) that regressed beyond the threshold
+    regressions = []
+    for case, current in results.items():
+        previous = baseline.get(case)
+        if previous is None:
+            continue
+        for metric, value in current.items():
+            before = previous.get(metric)
+            if before is None:
+                continue
+            if metric == 'seconds' and max(before, value) < MIN_SECONDS:
+                continue
+            if value > before * (1 + threshold):
+                regressions.append((case, metric, before, value))
+    return regressions
+
+
+def save_baseline(results, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as handle:
+        json.dump({'machine': platform.platform(), 'python': platform.python_version(), 'results': results},
+                  handle, indent=1, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)['results']
+
+
+def print_results(results, baseline=None):
+    print(f"{'case':<44}{'seconds':>12}{'peak MB':>12}{'vs baseline':>14}")
+    for case, result in results.items():
+        change = ''
+        if baseline and case in baseline and baseline[case]['seconds'] > 0:
+            change = f"{result['seconds'] / baseline[case]['seconds'] - 1:+.0%}"
+        print(f"{case:<44}{result['seconds']:>12.4f}{result['peak_mb']:>12.1f}{change:>14}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the stocktake data path.')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='comma-separated item row counts (1000 up to 1000000)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case (best is kept)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed slowdown / memory growth as a fraction, e.g. 0.25')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = run_benchmarks(sizes, repeat=args.repeat, seed=args.seed)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as handle:
+            json.dump(results, handle, indent=1)
+
+    if args.save_baseline:
+        print_results(results)
+        save_baseline(results, args.baseline)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline) if os.path.exists(args.baseline) else None
+    print_results(results, baseline)
+    if baseline is None:
+        # Nothing was compared, so a regression gate must not pass
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return 2
+
+    regressions = compare(results, baseline, args.threshold)
+    for case, metric, before, value in regressions:
+        print(f"REGRESSION {case} {metric}: {before:.4f} -> {value:.4f}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+# catalog.py
+
+import csv
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from ingest import clean_name
+from packs import order_multiples, parse_pack_sizes
+
+DEFAULT_CATALOG_PATH = os.environ.get(
+    'INVENTORY_CATALOG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog.csv'))
+
+# SQLite catalogs keep the same three columns in this table
+SQLITE_TABLE = 'catalog'
+
+
+########################################################################################################
+##########################                    LOAD RECORDS              ################################
+########################################################################################################
+
+def read_catalog_records(path):
+    # Returns (name, par_level, supplier) tuples in file order
+    if path.endswith(('.db', '.sqlite', '.sqlite3')):
+        connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            return connection.execute(
+                f'SELECT name, par_level, supplier FROM {SQLITE_TABLE} ORDER BY rowid').fetchall()
+        finally:
+            connection.close()
+
+    with open(path, newline='', encoding='utf-8') as handle:
+        return [(row['name'], row['par_level'], row['supplier']) for row in csv.DictReader(handle)]
+
+
+########################################################################################################
+##########################                    INDEXED CATALOG           ################################
+########################################################################################################
+
+class Catalog:
+    def __init__(self, records, version=None):
+        self.version = version
+
+        # Exact names as written in the source, and the cleaned names stocktake exports use.
+        # A repeated (cleaned) name keeps its first position and its last values, like a dict literal.
+        rows = {}
+        raw_names = {}
+        self.duplicates = []
+        for name, par_level, supplier in records:
+            key = clean_name(name)
+            if key in rows:
+                self.duplicates.append(key)
+            rows[key] = (par_level, supplier)
+            raw_names.setdefault(key, name)
+
+        # Column-oriented storage: one array per field, suppliers stored as small integer codes
+        self.names = np.array(list(rows), dtype=object)
+        self.raw_names = np.array([raw_names[key] for key in rows], dtype=object)
+        self.par_levels = pd.to_numeric(pd.Series([par for par, _ in rows.values()], dtype=object),
+                                        errors='coerce').to_numpy(dtype=np.float64)
+        supplier_values = [supplier or None for _, supplier in rows.values()]
+        codes, uniques = pd.factorize(pd.Series(supplier_values, dtype=object), use_na_sentinel=True)
+        self.supplier_codes = codes.astype(np.int16)
+        self.suppliers = [str(supplier) for supplier in uniques]
+
+        # Indexes: exact name, normalized name and supplier -> row positions
+        self.by_name = {name: row for row, name in enumerate(self.raw_names)}
+        self.by_normalized = {name: row for row, name in enumerate(self.names)}
+        self.by_supplier = {supplier: np.flatnonzero(self.supplier_codes == code)
+                            for code, supplier in enumerate(self.suppliers)}
+
+        # Pack count, unit size and case size parsed from every name, once per catalog version
+        self.packs = parse_pack_sizes(self.names)
+
+        # Join-ready table for the reorder engine, built once with the catalog.
+        # case_size is the multiple each supplier's orders are rounded up to.
+        self.par_table = pd.DataFrame({
+            'Item': self.names,
+            'par_level': self.par_levels,
+            'supplier': pd.Series(supplier_values, dtype=object),
+            'case_size': order_multiples(self.packs['case_size'], supplier_values),
+        }).dropna(subset=['par_level', 'supplier']).reset_index(drop=True)
+
+        self._items_info = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.by_name or clean_name(name) in self.by_normalized
+
+    def lookup(self, name):
+        # Exact match first, then the whitespace-normalized form
+        row = self.by_name.get(name)
+        if row is None:
+            row = self.by_normalized.get(clean_name(name))
+        if row is None:
+            return None
+        return self._record(row)
+
+    def supplier_items(self, supplier):
+        return [self._record(row) for row in self.by_supplier.get(supplier, ())]
+
+    def items_info(self):
+        # Dict view in the shape the rest of the app used for items_info, built once
+        if self._items_info is None:
+            self._items_info = {self.names[row]: self._info(row) for row in range(len(self))}
+        return self._items_info
+
+    def _info(self, row):
+        code = self.supplier_codes[row]
+        par_level = self.par_levels[row]
+        return {'par_level': None if np.isnan(par_level) else float(par_level),
+                'supplier': self.suppliers[code] if code >= 0 else None}
+
+    def _record(self, row):
+        return dict(self._info(row), name=self.names[row])
+
+
+########################################################################################################
+##########################                    PROCESS-WIDE CACHE        ################################
+########################################################################################################
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def catalog_version(path):
+    stat = os.stat(path)
+    return f'{stat.st_mtime_ns}-{stat.st_size}'
+
+
+def get_catalog(path=DEFAULT_CATALOG_PATH):
+    # Built once per process and shared by every session; rebuilt only when the file changes
+    path = os.path.abspath(path)
+    version = catalog_version(path)
+    with _catalogs_lock:
+        catalog = _catalogs.get(path)
+        if catalog is None or catalog.version != version:
+            catalog = Catalog(read_catalog_records(path), version=version)
+            _catalogs[path] = catalog
+    return catalog
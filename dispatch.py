@@ -0,0 +1,512 @@
+# dispatch.py
+#
+# Sends every supplier's order concurrently. Suppliers are routed to a pluggable transport
+# (SMTP e-mail or an HTTP webhook) by a JSON config, see dispatch.example.json.
+
+import asyncio
+import hashlib
+import io
+import json
+import os
+import random
+import smtplib
+import ssl
+import threading
+import time
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+from export import write_orders_csv
+from instrumentation import get_logger
+from reorder import ORDER_COLUMNS
+
+logger = get_logger('dispatch')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG_PATH = os.environ.get('INVENTORY_DISPATCH_CONFIG', os.path.join(BASE_DIR, 'dispatch.json'))
+
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 8.0
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_POOL_SIZE = 4
+
+DELIVERY_COLUMNS = ['Site', 'Supplier', 'Items', 'Status', 'Attempts', 'Seconds', 'Detail']
+
+
+# One lock per delivery log, held from reading which orders were sent until the new deliveries are
+# logged, so two "Send orders" clicks (in one session or two) cannot both find an order unsent
+_log_locks = {}
+_log_locks_lock = threading.Lock()
+
+
+def log_lock(path):
+    with _log_locks_lock:
+        return _log_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+class DeliveryError(Exception):
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def idempotency_key(message):
+    # Same site, count date, supplier and order lines -> same key, so a retried or repeated send can be
+    # recognised by the supplier and skipped here when the delivery log already has it as sent
+    orders = message['orders'][['Item', 'Quantity Needed']]
+    digest = hashlib.sha256(f"{message['site']}\0{message['count_date']}\0{message['supplier']}\0".encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(orders, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:32]
+
+
+def route_value(route, name):
+    value = route.get(name)
+    if not value:
+        raise DeliveryError(f"route has no '{name}'", retryable=False)
+    return value
+
+
+def order_payload(message):
+    return {
+        'site': message['site'],
+        'supplier': message['supplier'],
+        'count_date': str(message['count_date']),
+        'items': [{'item': item, 'quantity': float(quantity)}
+                  for item, quantity in message['orders'][['Item', 'Quantity Needed']].itertuples(index=False, name=None)],
+    }
+
+
+########################################################################################################
+##########################                    RATE LIMITING             ################################
+########################################################################################################
+
+class RateLimiter:
+    # Token bucket: `rate` sends per second on average, bursts of up to `burst`
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+########################################################################################################
+##########################                    HTTP WEBHOOK TRANSPORT    ################################
+########################################################################################################
+
+class HttpConnectionPool:
+    # Keep-alive HTTP/1.1 connections per host, at most `max_per_host` in use at once
+    def __init__(self, max_per_host=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self._idle = {}
+        self._limits = {}
+
+    async def request(self, method, url, body=b'', headers=None):
+        parts = urlsplit(url)
+        secure = parts.scheme == 'https'
+        key = (parts.scheme, parts.hostname, parts.port or (443 if secure else 80))
+        path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+
+        limit = self._limits.setdefault(key, asyncio.Semaphore(self.max_per_host))
+        async with limit:
+            idle = self._idle.setdefault(key, [])
+            reused = bool(idle)
+            connection = idle.pop() if reused else await self._connect(key, secure)
+            try:
+                try:
+                    status, data, keep_alive = await asyncio.wait_for(
+                        self._roundtrip(connection, method, parts.netloc, path, body, headers or {}), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    if not reused:
+                        raise
+                    # The server closed this idle connection; retry once on a fresh one
+                    connection[1].close()
+                    connection = await self._connect(key, secure)
+                    status, data, keep_alive = await asyncio.wait_for(
+                        self._roundtrip(connection, method, parts.netloc, path, body, headers or {}), self.timeout)
+            except BaseException:
+                connection[1].close()
+                raise
+
+            if keep_alive:
+                idle.append(connection)
+            else:
+                connection[1].close()
+            return status, data
+
+    async def _connect(self, key, secure):
+        return await asyncio.wait_for(
+            asyncio.open_connection(key[1], key[2], ssl=ssl.create_default_context() if secure else None),
+            self.timeout)
+
+    @staticmethod
+    async def _roundtrip(connection, method, host, path, body, headers):
+        reader, writer = connection
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {host}', f'Content-Length: {len(body)}',
+                 'Connection: keep-alive']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed before response')
+        status_parts = status_line.split()
+        if len(status_parts) < 2 or not status_parts[1].isdigit():
+            raise ValueError(f'malformed status line {status_line[:80]!r}')
+        status = int(status_parts[1])
+
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        keep_alive = response_headers.get('connection', '').lower() != 'close'
+        if 'content-length' in response_headers:
+            data = await reader.readexactly(int(response_headers['content-length']))
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            data = b''.join(chunks)
+        else:
+            data = await reader.read()
+            keep_alive = False
+        return status, data, keep_alive
+
+    async def close(self):
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+
+class WebhookTransport:
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, headers=None):
+        self.pool = HttpConnectionPool(max_per_host=pool_size, timeout=timeout)
+        self.headers = dict(headers or {})
+
+    async def send(self, message, route):
+        url = route_value(route, 'url')
+        body = json.dumps(order_payload(message)).encode('utf-8')
+        # A retry after a timeout may repeat an order the supplier already received; the key lets them drop it
+        headers = dict(self.headers, **{'Content-Type': 'application/json', 'Idempotency-Key': message['key']})
+        try:
+            status, data = await self.pool.request('POST', url, body, headers)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as error:
+            raise DeliveryError(f'{type(error).__name__}: {error}') from error
+        except ValueError as error:
+            # Unparseable response: the order may have arrived, so it is not sent again
+            raise DeliveryError(f'bad response: {error}', retryable=False) from error
+
+        if status >= 500 or status == 429:
+            raise DeliveryError(f'HTTP {status}')
+        if status >= 400:
+            raise DeliveryError(f'HTTP {status}: {data[:200].decode("utf-8", "replace")}', retryable=False)
+        return f'HTTP {status}'
+
+    async def close(self):
+        await self.pool.close()
+
+
+########################################################################################################
+##########################                    SMTP TRANSPORT            ################################
+########################################################################################################
+
+class SmtpTransport:
+    # smtplib is blocking, so sends run in worker threads over a pool of open SMTP sessions
+    def __init__(self, host='localhost', port=25, sender='orders@localhost', pool_size=2, starttls=False,
+                 username=None, password=None, timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.starttls = starttls
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self._idle = []
+        self._idle_lock = threading.Lock()
+        self._slots = asyncio.Semaphore(pool_size)
+
+    def _connect(self):
+        session = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            session.starttls(context=ssl.create_default_context())
+        if self.username:
+            session.login(self.username, self.password or '')
+        return session
+
+    def _checkout(self):
+        with self._idle_lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _checkin(self, session):
+        with self._idle_lock:
+            self._idle.append(session)
+
+    def _build(self, message, route):
+        recipients = route_value(route, 'to')
+        email = EmailMessage()
+        email['From'] = self.sender
+        email['To'] = recipients if isinstance(recipients, str) else ', '.join(recipients)
+        email['Message-ID'] = f"<{message['key']}@{self.sender.rpartition('@')[2] or 'localhost'}>"
+        email['Subject'] = f"Order from {message['site']} for {message['count_date']}"
+        lines = [f"{item}: {quantity:g}"
+                 for item, quantity in message['orders'][['Item', 'Quantity Needed']].itertuples(index=False, name=None)]
+        email.set_content(f"Order for {message['supplier']}\n\n" + '\n'.join(lines) + '\n')
+
+        attachment = io.BytesIO()
+        write_orders_csv({message['supplier']: message['orders']}, attachment)
+        email.add_attachment(attachment.getvalue(), maintype='text', subtype='csv', filename='order.csv')
+        return email
+
+    def _send_blocking(self, email):
+        session, reused = self._checkout()
+        try:
+            try:
+                refused = session.send_message(email)
+            except smtplib.SMTPServerDisconnected:
+                if not reused:
+                    raise
+                # The server dropped this idle session; retry once on a fresh one
+                session.close()
+                session = self._connect()
+                refused = session.send_message(email)
+        except BaseException:
+            session.close()
+            raise
+        self._checkin(session)
+        return refused
+
+    async def send(self, message, route):
+        email = self._build(message, route)
+        async with self._slots:
+            try:
+                refused = await asyncio.to_thread(self._send_blocking, email)
+            except smtplib.SMTPResponseException as error:
+                raise DeliveryError(f'SMTP {error.smtp_code}', retryable=400 <= error.smtp_code < 500) from error
+            except smtplib.SMTPRecipientsRefused as error:
+                raise DeliveryError(f'refused recipients: {", ".join(error.recipients)}', retryable=False) from error
+            except (smtplib.SMTPException, OSError) as error:
+                raise DeliveryError(f'{type(error).__name__}: {error}') from error
+        if refused:
+            raise DeliveryError(f'refused recipients: {", ".join(refused)}', retryable=False)
+        return f"sent to {email['To']}"
+
+    async def close(self):
+        with self._idle_lock:
+            sessions, self._idle = self._idle, []
+        for session in sessions:
+            try:
+                await asyncio.to_thread(session.quit)
+            except (smtplib.SMTPException, OSError):
+                session.close()
+
+
+TRANSPORT_TYPES = {'webhook': WebhookTransport, 'smtp': SmtpTransport}
+
+
+########################################################################################################
+##########################                    DISPATCHER                ################################
+########################################################################################################
+
+class Dispatcher:
+    def __init__(self, transports, routes, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, log_path=None, resend=False):
+        # transports: name -> transport; routes: supplier -> {'transport': name, ...address, rate_per_minute}.
+        # Orders the delivery log already has as sent are skipped unless resend is set.
+        self.transports = transports
+        self.routes = routes
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.log_path = log_path
+        self.resend = resend
+        self.limiters = {supplier: RateLimiter(route['rate_per_minute'] / 60.0, burst=route.get('burst', 1))
+                         for supplier, route in routes.items() if route.get('rate_per_minute')}
+
+    async def send_one(self, message, sent=None):
+        # sent: idempotency key -> time of an earlier successful delivery, from the delivery log
+        supplier = message['supplier']
+        message = dict(message, key=idempotency_key(message))
+        record = dict.fromkeys(DELIVERY_COLUMNS, '')
+        record.update({'Site': message['site'], 'Supplier': supplier, 'Items': len(message['orders']), 'Attempts': 0,
+                       'Key': message['key']})
+        start = time.perf_counter()
+
+        route = self.routes.get(supplier)
+        if route is None or route.get('transport') not in self.transports:
+            record.update({'Status': 'skipped', 'Detail': 'no route configured', 'Seconds': 0.0})
+            return self._record(record)
+        if len(message['orders']) == 0:
+            record.update({'Status': 'skipped', 'Detail': 'nothing to order', 'Seconds': 0.0})
+            return self._record(record)
+        if sent and message['key'] in sent and not self.resend:
+            record.update({'Status': 'skipped', 'Detail': f"already sent at {sent[message['key']]}", 'Seconds': 0.0})
+            return self._record(record)
+
+        transport = self.transports[route['transport']]
+        limiter = self.limiters.get(supplier)
+        for attempt in range(1, self.max_attempts + 1):
+            record['Attempts'] = attempt
+            if limiter is not None:
+                await limiter.acquire()
+            try:
+                record['Detail'] = await transport.send(message, route)
+                record['Status'] = 'sent'
+                break
+            except Exception as error:
+                # Anything a transport did not classify is a bug or a bad route, not worth retrying
+                if not isinstance(error, DeliveryError):
+                    logger.exception('order send error', extra={'site': message['site'], 'supplier': supplier})
+                    error = DeliveryError(f'{type(error).__name__}: {error}', retryable=False)
+                record.update({'Status': 'failed', 'Detail': str(error)})
+                if not error.retryable or attempt == self.max_attempts:
+                    break
+                # Exponential backoff with full jitter
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+                logger.info('order send retry', extra={'site': message['site'], 'supplier': supplier,
+                                                       'attempt': attempt, 'delay': round(delay, 3),
+                                                       'error': str(error)})
+                await asyncio.sleep(delay)
+
+        record['Seconds'] = round(time.perf_counter() - start, 3)
+        return self._record(record)
+
+    def _record(self, record):
+        record['At'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        level = 'info' if record['Status'] != 'failed' else 'error'
+        getattr(logger, level)('order delivery', extra={key.lower(): value for key, value in record.items()})
+        if self.log_path:
+            try:
+                with open(self.log_path, 'a', encoding='utf-8') as handle:
+                    handle.write(json.dumps(record) + '\n')
+            except OSError as error:
+                # The delivery itself stands; only the log line is lost
+                logger.error('delivery log write failed', extra={'path': self.log_path, 'error': str(error)})
+        return record
+
+    def sent_keys(self):
+        # Idempotency key -> time of every delivery the log has as sent
+        sent = {}
+        if not self.log_path or not os.path.exists(self.log_path):
+            return sent
+        with open(self.log_path, encoding='utf-8') as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and record.get('Status') == 'sent' and record.get('Key'):
+                    sent[record['Key']] = record.get('At', '')
+        return sent
+
+    async def dispatch(self, messages):
+        if not self.log_path:
+            return await self._dispatch(messages)
+        lock = log_lock(self.log_path)
+        # Waited for in a worker thread, so this event loop is not blocked meanwhile
+        await asyncio.to_thread(lock.acquire)
+        try:
+            return await self._dispatch(messages)
+        finally:
+            lock.release()
+
+    async def _dispatch(self, messages):
+        # Every supplier (and site) at once: the run takes as long as the slowest delivery.
+        # A failure outside the send loop still leaves a record for every other supplier.
+        sent = self.sent_keys()
+        results = await asyncio.gather(*(self.send_one(message, sent) for message in messages), return_exceptions=True)
+        records = []
+        for message, result in zip(messages, results):
+            if isinstance(result, Exception):
+                record = dict.fromkeys(DELIVERY_COLUMNS, '')
+                record.update({'Site': message['site'], 'Supplier': message['supplier'],
+                               'Items': len(message['orders']), 'Attempts': 0, 'Status': 'failed',
+                               'Detail': f'{type(result).__name__}: {result}'})
+                result = self._record(record)
+            elif isinstance(result, BaseException):
+                raise result
+            records.append(result)
+        return records
+
+    async def close(self):
+        await asyncio.gather(*(transport.close() for transport in self.transports.values()))
+
+
+def order_messages(orders_by_site, count_date):
+    # orders_by_site: site -> {supplier: order DataFrame}
+    return [{'site': site, 'supplier': supplier, 'count_date': count_date, 'orders': orders[ORDER_COLUMNS]}
+            for site, supplier_orders in orders_by_site.items() for supplier, orders in supplier_orders.items()]
+
+
+########################################################################################################
+##########################                    CONFIG                    ################################
+########################################################################################################
+
+def load_dispatch_config(path=DEFAULT_CONFIG_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def build_dispatcher(config, resend=False):
+    transports = {}
+    for name, options in config.get('transports', {}).items():
+        options = dict(options)
+        transport_type = options.pop('type')
+        password_env = options.pop('password_env', None)
+        if password_env:
+            options['password'] = os.environ.get(password_env)
+        transports[name] = TRANSPORT_TYPES[transport_type](**options)
+
+    defaults = config.get('defaults', {})
+    # A relative log path is anchored next to the app, like the other stores, not to the working directory
+    log_path = defaults.get('log_path')
+    if log_path:
+        log_path = os.path.join(BASE_DIR, log_path)
+    return Dispatcher(transports, config.get('suppliers', {}),
+                      max_attempts=defaults.get('max_attempts', DEFAULT_MAX_ATTEMPTS),
+                      base_delay=defaults.get('base_delay', DEFAULT_BASE_DELAY),
+                      max_delay=defaults.get('max_delay', DEFAULT_MAX_DELAY),
+                      log_path=log_path, resend=resend)
+
+
+async def dispatch_async(orders_by_site, count_date, config, resend=False):
+    dispatcher = build_dispatcher(config, resend)
+    try:
+        return await dispatcher.dispatch(order_messages(orders_by_site, count_date))
+    finally:
+        await dispatcher.close()
+
+
+def dispatch_orders(orders_by_site, count_date, config, resend=False):
+    # Blocking entry point for the app and batch mode
+    return asyncio.run(dispatch_async(orders_by_site, count_date, config, resend))
@@ -0,0 +1,168 @@
+# dispatch_standins.py
+#
+# Local stand-ins for supplier endpoints, for trying out order dispatch without real suppliers.
+#
+#     python dispatch_standins.py --http-port 8099 --smtp-port 1025
+
+import argparse
+import asyncio
+import json
+
+
+class LocalWebhookServer:
+    # Accepts keep-alive HTTP POSTs and records their JSON bodies and Idempotency-Key headers.
+    # fail_first answers the first N requests per path with fail_status; delay slows every response.
+    def __init__(self, host='127.0.0.1', port=0, fail_first=0, delay=0.0, fail_status='503 Service Unavailable'):
+        self.host = host
+        self.port = port
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.delay = delay
+        self.received = []
+        self.connections = 0
+        self._attempts = {}
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def url(self, path='/orders'):
+        return f'http://{self.host}:{self.port}{path}'
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                path = request_line.split()[1].decode()
+                length, key = 0, None
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    if name.strip().lower() == 'content-length':
+                        length = int(value)
+                    elif name.strip().lower() == 'idempotency-key':
+                        key = value.strip()
+                body = await reader.readexactly(length)
+
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                attempt = self._attempts[path] = self._attempts.get(path, 0) + 1
+                if attempt <= self.fail_first:
+                    status, reply = self.fail_status, b'busy'
+                else:
+                    status, reply = '200 OK', b'ok'
+                    self.received.append({'path': path, 'key': key, 'body': json.loads(body or b'null')})
+                writer.write(f'HTTP/1.1 {status}\r\nContent-Length: {len(reply)}\r\n\r\n'.encode() + reply)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class LocalSmtpServer:
+    # Just enough SMTP to accept messages from smtplib and keep them in memory; recipients in `refuse`
+    # are rejected with 550
+    def __init__(self, host='127.0.0.1', port=0, delay=0.0, refuse=()):
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.refuse = set(refuse)
+        self.received = []
+        self.connections = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+
+        async def reply(line):
+            writer.write(f'{line}\r\n'.encode())
+            await writer.drain()
+
+        await reply('220 localhost stand-in ready')
+        envelope = {'from': None, 'to': []}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode('latin-1').strip()
+                verb = command[:4].upper()
+                if verb in ('EHLO', 'HELO'):
+                    await reply('250 localhost')
+                elif verb == 'MAIL':
+                    envelope = {'from': command[10:].strip('<> '), 'to': []}
+                    await reply('250 OK')
+                elif verb == 'RCPT':
+                    recipient = command[8:].strip('<> ')
+                    if recipient in self.refuse:
+                        await reply('550 No such user')
+                        continue
+                    envelope['to'].append(recipient)
+                    await reply('250 OK')
+                elif verb == 'DATA':
+                    await reply('354 End data with <CR><LF>.<CR><LF>')
+                    data = await reader.readuntil(b'\r\n.\r\n')
+                    if self.delay:
+                        await asyncio.sleep(self.delay)
+                    self.received.append(dict(envelope, data=data[:-5].decode('utf-8', 'replace')))
+                    await reply('250 OK queued')
+                elif verb in ('RSET', 'NOOP'):
+                    await reply('250 OK')
+                elif verb == 'QUIT':
+                    await reply('221 Bye')
+                    break
+                else:
+                    await reply('502 Command not implemented')
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(http_port, smtp_port):
+    webhook = await LocalWebhookServer(port=http_port).start()
+    smtp = await LocalSmtpServer(port=smtp_port).start()
+    print(f"Webhook stand-in on {webhook.url('/')}, SMTP stand-in on 127.0.0.1:{smtp.port}")
+    try:
+        while True:
+            await asyncio.sleep(5)
+            print(f"received {len(webhook.received)} webhook orders, {len(smtp.received)} e-mails")
+    finally:
+        await webhook.stop()
+        await smtp.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run local stand-in supplier endpoints.')
+    parser.add_argument('--http-port', type=int, default=8099)
+    parser.add_argument('--smtp-port', type=int, default=1025)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.http_port, args.smtp_port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+# export.py
+
+import csv
+import io
+import re
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from reorder import ORDER_COLUMNS
+
+# Bytes of generated downloads kept in memory across reruns and sessions
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+# A4 in points, and the layout of the PDF order sheets
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 40
+LINE_HEIGHT = 14
+ITEM_CHARS = 80
+
+
+def orders_key(supplier_orders):
+    # Content hash of every supplier's order table, so identical orders share one download
+    digest = 0
+    for supplier, orders in supplier_orders.items():
+        rows = int(pd.util.hash_pandas_object(orders, index=False).sum()) if len(orders) else 0
+        digest = hash((digest, supplier, rows, len(orders)))
+    return format(digest & 0xFFFFFFFFFFFFFFFF, '016x')
+
+
+def sheet_title(supplier, used):
+    # Excel sheet names: at most 31 characters, no []:*?/\ and unique within the workbook
+    title = re.sub(r'[\[\]:*?/\\]', ' ', str(supplier)).strip()[:31] or 'Supplier'
+    base, suffix = title, 2
+    while title.lower() in used:
+        title = f'{base[:28]} {suffix}'
+        suffix += 1
+    used.add(title.lower())
+    return title
+
+
+def order_rows(orders):
+    # Plain Python rows, produced lazily so writers never hold a second copy of the table
+    for item, quantity, supplier in orders[ORDER_COLUMNS].itertuples(index=False, name=None):
+        yield item, float(quantity), supplier
+
+
+########################################################################################################
+##########################                    STREAMING WRITERS         ################################
+########################################################################################################
+
+def write_orders_xlsx(supplier_orders, target):
+    # openpyxl write-only mode flushes rows as they are appended, so memory does not grow with the rows
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    used = set()
+    for supplier, orders in supplier_orders.items():
+        sheet = workbook.create_sheet(sheet_title(supplier, used))
+        sheet.append(['Item', 'Quantity Needed'])
+        for item, quantity, _ in order_rows(orders):
+            sheet.append([item, quantity])
+    if not supplier_orders:
+        workbook.create_sheet('Orders').append(['Item', 'Quantity Needed'])
+    workbook.save(target)
+
+
+def write_orders_csv(supplier_orders, target):
+    text = io.TextIOWrapper(target, encoding='utf-8', newline='', write_through=True)
+    try:
+        writer = csv.writer(text)
+        writer.writerow(['Supplier', 'Item', 'Quantity Needed'])
+        for supplier, orders in supplier_orders.items():
+            for item, quantity, _ in order_rows(orders):
+                writer.writerow([supplier, item, f'{quantity:g}'])
+    finally:
+        # Leave the caller's buffer open
+        text.detach()
+
+
+def pdf_text(text):
+    text = str(text).replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return text.encode('latin-1', errors='replace').decode('latin-1')
+
+
+def write_orders_pdf(supplier_orders, target, title='Order list'):
+    # Minimal text-only PDF, one or more pages per supplier, written page by page.
+    # Only object offsets are kept in memory until the cross-reference table is written.
+    offsets = {}
+    position = [0]
+
+    def emit(data):
+        data = data.encode('latin-1') if isinstance(data, str) else data
+        target.write(data)
+        position[0] += len(data)
+
+    def emit_object(number, body):
+        offsets[number] = position[0]
+        emit(f'{number} 0 obj\n')
+        emit(body)
+        emit('\nendobj\n')
+
+    emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    # 1: catalog, 2: page tree (written last, once the pages are known), 3: font
+    emit_object(1, '<< /Type /Catalog /Pages 2 0 R >>')
+    emit_object(3, '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+
+    pages = []
+    next_number = [4]
+    rows_per_page = (PAGE_HEIGHT - 2 * MARGIN) // LINE_HEIGHT - 3
+
+    def write_page(heading, lines):
+        y = PAGE_HEIGHT - MARGIN
+        commands = ['BT', '/F1 13 Tf', f'{MARGIN} {y} Td', f'({pdf_text(heading)}) Tj', '/F1 10 Tf']
+        commands.append(f'0 -{LINE_HEIGHT * 2} Td')
+        for item, quantity in lines:
+            commands.append(f'({pdf_text(item[:ITEM_CHARS])}) Tj')
+            commands.append(f'{PAGE_WIDTH - 2 * MARGIN - 60} 0 Td ({pdf_text(quantity)}) Tj '
+                            f'-{PAGE_WIDTH - 2 * MARGIN - 60} -{LINE_HEIGHT} Td')
+        commands.append('ET')
+        stream = '\n'.join(commands).encode('latin-1', errors='replace')
+
+        content_number, page_number = next_number[0], next_number[0] + 1
+        next_number[0] += 2
+        emit_object(content_number, f'<< /Length {len(stream)} >>\nstream\n'.encode('latin-1') + stream + b'\nendstream')
+        emit_object(page_number, f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+                                 f'/Resources << /Font << /F1 3 0 R >> >> /Contents {content_number} 0 R >>')
+        pages.append(page_number)
+
+    for supplier, orders in supplier_orders.items():
+        heading = f'{title} - {supplier}'
+        lines = [('Item', 'Quantity')]
+        for item, quantity, _ in order_rows(orders):
+            lines.append((item, f'{quantity:g}'))
+            if len(lines) == rows_per_page:
+                write_page(heading, lines)
+                lines = [('Item', 'Quantity')]
+        if len(lines) > 1 or len(orders) == 0:
+            write_page(heading, lines if len(orders) else [('Nothing to order', '')])
+    if not pages:
+        write_page(title, [('Nothing to order', '')])
+
+    kids = ' '.join(f'{number} 0 R' for number in pages)
+    emit_object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>')
+
+    xref_at = position[0]
+    count = next_number[0]
+    emit(f'xref\n0 {count}\n0000000000 65535 f \n')
+    for number in range(1, count):
+        emit(f'{offsets[number]:010d} 00000 n \n')
+    emit(f'trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n')
+
+
+EXPORT_FORMATS = {
+    'xlsx': (write_orders_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': (write_orders_csv, 'text/csv'),
+    'pdf': (write_orders_pdf, 'application/pdf'),
+}
+
+
+########################################################################################################
+##########################                    EXPORT CACHE              ################################
+########################################################################################################
+
+class ExportCache:
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get_or_build(self, supplier_orders, file_format, key=None):
+        # Build each (orders, format) download once; later reruns and sessions get the cached bytes
+        key = (key or orders_key(supplier_orders), file_format)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+
+        writer, _ = EXPORT_FORMATS[file_format]
+        buffer = io.BytesIO()
+        writer(supplier_orders, buffer)
+        data = buffer.getvalue()
+
+        with self._lock:
+            if len(data) <= self.max_bytes and key not in self._entries:
+                self._entries[key] = data
+                self._bytes += len(data)
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= len(evicted)
+        return data
+
+
+# Shared by every session in the process
+export_cache = ExportCache()
@@ -0,0 +1,244 @@
+# history.py
+
+import os
+import re
+import threading
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_HISTORY_DIR = os.environ.get(
+    'INVENTORY_HISTORY_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.stocktake_history'))
+
+# Columns kept for every count; Name is the SKU key
+HISTORY_METRICS = ['Diff Cost', 'Close Qty', 'Usage Qty', 'Wastage Qty']
+
+# Number of most recent counts kept per SKU for rolling variance queries
+DEFAULT_WINDOW = 12
+
+TREND_COLUMNS = ['Name', 'Counts', 'Last Count', 'Window Counts', 'Window Diff Cost', 'Mean Diff Cost',
+                 'Total Diff Cost', 'Total Usage Qty', 'Total Wastage Qty']
+
+
+def partition_value(text):
+    # Safe directory name for hive-style partitions
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', str(text)).strip('_') or 'default'
+
+
+def count_date_value(count_date=None):
+    # ISO date string for the count_date partition; anything else would nest directories or break the
+    # string ordering of dates the aggregates rely on
+    if count_date is None:
+        return date.today().isoformat()
+    if isinstance(count_date, datetime):
+        count_date = count_date.date()
+    if isinstance(count_date, date):
+        return count_date.isoformat()
+    try:
+        return date.fromisoformat(str(count_date)).isoformat()
+    except ValueError:
+        raise ValueError(f"Count date must be an ISO date (YYYY-MM-DD), got {count_date!r}.") from None
+
+
+def temp_path(path):
+    # Dot-prefixed, so pyarrow's dataset discovery skips it while it is written or if a crash leaves it behind
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f'.{name}.{os.getpid()}.tmp')
+
+
+def frame_id(df):
+    return format(int(pd.util.hash_pandas_object(df, index=False).sum()) & 0xFFFFFFFFFFFFFFFF, '016x')
+
+
+def count_snapshot(df):
+    # Per-SKU metrics of one count; repeated names within an export are summed
+    snapshot = pd.DataFrame({'Name': df['Name'].astype(str).to_numpy()})
+    for metric in HISTORY_METRICS:
+        values = df[metric] if metric in df.columns else np.nan
+        snapshot[metric] = pd.to_numeric(pd.Series(values, index=df.index), errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    return snapshot.groupby('Name', sort=False, as_index=False).sum(min_count=1)
+
+
+########################################################################################################
+##########################                    ROLLING AGGREGATES        ################################
+########################################################################################################
+
+def window_columns(window):
+    return [f'Diff Cost w{i}' for i in range(window)]
+
+
+def empty_aggregates(window):
+    columns = ['Name', 'Counts', 'Last Count'] + [f'Total {metric}' for metric in HISTORY_METRICS] + window_columns(window)
+    return pd.DataFrame({column: pd.Series(dtype=object if column in ('Name', 'Last Count') else np.float64)
+                         for column in columns})
+
+
+def update_aggregates(aggregates, snapshot, count_date, window):
+    # Fold one count into the per-SKU aggregates without touching any earlier counts.
+    # The window holds each SKU's last `window` Diff Cost values, oldest first.
+    names = pd.Index(aggregates['Name'])
+    new_names = snapshot.loc[~snapshot['Name'].isin(names), 'Name']
+    if len(new_names):
+        added = empty_aggregates(window).reindex(range(len(new_names)))
+        added['Name'] = new_names.to_numpy()
+        added['Counts'] = 0.0
+        aggregates = pd.concat([aggregates, added], ignore_index=True)
+        names = pd.Index(aggregates['Name'])
+
+    rows = names.get_indexer(snapshot['Name'])
+    aggregates = aggregates.reset_index(drop=True)
+
+    counts = aggregates['Counts'].to_numpy(dtype=np.float64, copy=True)
+    counts[rows] += 1
+    aggregates['Counts'] = counts
+    last_count = aggregates['Last Count'].to_numpy(dtype=object, copy=True)
+    last_count[rows] = count_date
+    aggregates['Last Count'] = last_count
+    for metric in HISTORY_METRICS:
+        totals = aggregates[f'Total {metric}'].to_numpy(dtype=np.float64, copy=True)
+        totals[rows] = np.nansum([totals[rows], snapshot[metric].to_numpy()], axis=0)
+        aggregates[f'Total {metric}'] = totals
+
+    columns = window_columns(window)
+    windows = aggregates[columns].to_numpy(dtype=np.float64, copy=True)
+    windows[rows, :-1] = windows[rows, 1:]
+    windows[rows, -1] = snapshot['Diff Cost'].to_numpy()
+    aggregates[columns] = windows
+    return aggregates
+
+
+########################################################################################################
+##########################                    HISTORY STORE             ################################
+########################################################################################################
+
+class HistoryStore:
+    def __init__(self, root=DEFAULT_HISTORY_DIR, window=DEFAULT_WINDOW):
+        self.root = root
+        self.window = window
+        self.counts_dir = os.path.join(root, 'counts')
+        self.aggregates_dir = os.path.join(root, 'aggregates')
+        self._lock = threading.Lock()
+
+    # ---------------------------------------------------------------- paths
+
+    def _partition_dir(self, site, count_date):
+        return os.path.join(self.counts_dir, f'site={partition_value(site)}', f'count_date={count_date}')
+
+    def _aggregates_path(self, site):
+        return os.path.join(self.aggregates_dir, f'site={partition_value(site)}.parquet')
+
+    # ---------------------------------------------------------------- writes
+
+    def append(self, df, site, count_date=None, upload_id=None):
+        # Returns False when this exact upload is already stored for the site and date
+        count_date = count_date_value(count_date)
+        upload_id = upload_id or frame_id(df)
+
+        partition = self._partition_dir(site, count_date)
+        path = os.path.join(partition, f'{upload_id}.parquet')
+
+        with self._lock:
+            if os.path.exists(path):
+                return False
+            snapshot = count_snapshot(df)
+
+            # A different upload for the same site and date is a recount and replaces the earlier one
+            replaced = [name for name in os.listdir(partition) if not name.startswith('.')] \
+                if os.path.isdir(partition) else []
+            os.makedirs(partition, exist_ok=True)
+            tmp_path = temp_path(path)
+            snapshot.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+            for name in replaced:
+                os.remove(os.path.join(partition, name))
+
+            aggregates = self.aggregates(site)
+            last_count = aggregates['Last Count'].max() if len(aggregates) else None
+            if replaced or (last_count is not None and count_date < last_count):
+                # Recounts and back-filled dates change earlier windows, so only then rescan this site
+                aggregates = self._rebuild_aggregates(site)
+            else:
+                aggregates = update_aggregates(aggregates, snapshot, count_date, self.window)
+            self._write_aggregates(site, aggregates)
+        return True
+
+    def _write_aggregates(self, site, aggregates):
+        os.makedirs(self.aggregates_dir, exist_ok=True)
+        path = self._aggregates_path(site)
+        tmp_path = temp_path(path)
+        aggregates.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def _rebuild_aggregates(self, site):
+        aggregates = empty_aggregates(self.window)
+        history = self.load(site=site)
+        for count_date, snapshot in history.groupby('count_date', sort=True):
+            aggregates = update_aggregates(aggregates, snapshot, count_date, self.window)
+        return aggregates
+
+    # ---------------------------------------------------------------- reads
+
+    def aggregates(self, site):
+        path = self._aggregates_path(site)
+        if not os.path.exists(path):
+            return empty_aggregates(self.window)
+        aggregates = pd.read_parquet(path)
+        if len(window_columns(self.window)) != sum(column.startswith('Diff Cost w') for column in aggregates.columns):
+            # Window size changed since the aggregates were written
+            aggregates = self._rebuild_aggregates(site)
+            self._write_aggregates(site, aggregates)
+        return aggregates
+
+    def load(self, site=None, start=None, end=None, columns=None):
+        # Partition-pruned read of raw counts; dates are ISO strings or date objects
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        if not os.path.isdir(self.counts_dir):
+            return pd.DataFrame(columns=['Name'] + HISTORY_METRICS + ['site', 'count_date'])
+
+        partitioning = ds.partitioning(pa.schema([('site', pa.string()), ('count_date', pa.string())]),
+                                       flavor='hive')
+        dataset = ds.dataset(self.counts_dir, format='parquet', partitioning=partitioning)
+
+        expression = None
+        for condition in (
+            ds.field('site') == partition_value(site) if site is not None else None,
+            ds.field('count_date') >= str(start) if start is not None else None,
+            ds.field('count_date') <= str(end) if end is not None else None,
+        ):
+            if condition is not None:
+                expression = condition if expression is None else expression & condition
+
+        if columns is not None:
+            columns = list(dict.fromkeys(['Name'] + list(columns) + ['site', 'count_date']))
+        return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+    def sku_trends(self, site, last_n=None):
+        # Per-SKU variance over the last N counts, answered from the aggregates alone
+        last_n = self.window if last_n is None else max(1, min(last_n, self.window))
+        aggregates = self.aggregates(site)
+        recent = aggregates[window_columns(self.window)[-last_n:]].to_numpy(dtype=np.float64)
+
+        counted = (~np.isnan(recent)).sum(axis=1)
+        window_total = np.nansum(recent, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            window_mean = np.where(counted > 0, window_total / counted, np.nan)
+
+        trends = pd.DataFrame({
+            'Name': aggregates['Name'].to_numpy(),
+            'Counts': aggregates['Counts'].to_numpy(dtype=np.int64),
+            'Last Count': aggregates['Last Count'].to_numpy(),
+            'Window Counts': counted,
+            'Window Diff Cost': window_total,
+            'Mean Diff Cost': window_mean,
+            'Total Diff Cost': aggregates['Total Diff Cost'].to_numpy(),
+            'Total Usage Qty': aggregates['Total Usage Qty'].to_numpy(),
+            'Total Wastage Qty': aggregates['Total Wastage Qty'].to_numpy(),
+        }, columns=TREND_COLUMNS)
+        return trends.sort_values('Window Diff Cost', key=np.abs, ascending=False, ignore_index=True)
+
+
+# Shared by every session in the process
+history_store = HistoryStore()
@@ -0,0 +1,278 @@
+# ingest.py
+
+import struct
+import zipfile
+import zlib
+from io import BytesIO
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import get_logger
+
+logger = get_logger('ingest')
+
+# Columns read from the stocktake export. Anything else in the sheet is never materialised.
+TEXT_COLUMNS = ['Name']
+NUMERIC_COLUMNS = ['Close Qty', 'Diff Cost', 'Open Val', 'Req', 'Close Val',
+                   'Diff Qty Last', 'Diff Weight AVG', 'Wastage Qty', 'Usage Qty']
+REQUIRED_COLUMNS = ['Name', 'Close Qty']
+
+# In-memory schema of a loaded stocktake. Names repeat across sections and sites, so they are
+# stored once as categories; measures are nullable float32, with <NA> where the sheet had no number.
+NAME_DTYPE = 'category'
+NUMERIC_DTYPE = 'Float32'
+
+SUBTOTAL_PREFIX = 'SUBTOTAL (this section)'
+
+XLS_MAGIC = b'\xd0\xcf\x11\xe0'
+XLSX_MAGIC = b'PK\x03\x04'
+
+
+def clean_name(value):
+    # Trim and collapse internal whitespace, same as the old regex clean-up
+    if value is None:
+        return ''
+    return ' '.join(str(value).split())
+
+
+def to_number(value):
+    # Cell value -> float, or None when it is not numeric (section headers, blanks, text)
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return None if value != value else float(value)
+    if isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            return None
+        return None if number != number else number
+    return None
+
+
+########################################################################################################
+##########################                    COLUMN SELECTION          ################################
+########################################################################################################
+
+def select_columns(header, usecols):
+    header = ['' if cell is None else str(cell) for cell in header]
+
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"The {', '.join(repr(m) for m in missing)} column does not exist in the uploaded file.")
+
+    # Keep sheet order; the first occurrence wins for duplicated headers
+    positions = {}
+    for position, column in enumerate(header):
+        if column in usecols and column not in positions:
+            positions[column] = position
+    return positions
+
+
+########################################################################################################
+##########################                    READERS                   ################################
+########################################################################################################
+
+def unreadable(file_format, error):
+    # Corrupt or truncated uploads surface as the same ValueError the app already shows to the user
+    return ValueError(f"The uploaded file is not a readable .{file_format} workbook "
+                      f"(it may be corrupt or truncated): {error}")
+
+
+def read_xlsx(data, usecols):
+    # calamine parses the sheet natively, several times faster than openpyxl, which builds a Python
+    # cell object for every cell of every column; openpyxl is the fallback when it is not installed
+    try:
+        from python_calamine import CalamineError
+    except ImportError:
+        return read_xlsx_openpyxl(data, usecols)
+
+    try:
+        return read_xlsx_calamine(data, usecols)
+    except (CalamineError, zipfile.BadZipFile, zlib.error, KeyError, EOFError, OSError) as error:
+        raise unreadable('xlsx', error) from error
+
+
+def read_xlsx_calamine(data, usecols):
+    from python_calamine import CalamineWorkbook
+
+    rows = CalamineWorkbook.from_filelike(BytesIO(data)).get_sheet_by_index(0).to_python(skip_empty_area=False)
+    if not rows:
+        raise ValueError("The uploaded file is empty.")
+    positions = select_columns(rows[0], usecols)
+
+    # Only the needed columns are pulled out of the parsed rows; empty cells come back as ''
+    raw = {column: [row[position] if position < len(row) else '' for row in rows[1:]]
+           for column, position in positions.items()}
+    return build_frame(keep_rows(raw))
+
+
+def read_xlsx_openpyxl(data, usecols):
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    try:
+        return read_xlsx_rows(data, usecols)
+    except (zipfile.BadZipFile, zlib.error, InvalidFileException, KeyError, EOFError, OSError) as error:
+        raise unreadable('xlsx', error) from error
+
+
+def read_xlsx_rows(data, usecols):
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(BytesIO(data), read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise ValueError("The uploaded file is empty.")
+        positions = select_columns(header, usecols)
+
+        columns = list(positions)
+        pick = itemgetter(*positions.values())
+        name_at = columns.index('Name')
+        qty_at = columns.index('Close Qty')
+        width = max(positions.values()) + 1
+
+        # Stream the sheet row by row, keeping only the selected cells of wanted rows
+        kept = {column: [] for column in columns}
+        appenders = [kept[column].append for column in columns]
+        for row in rows:
+            if len(row) < width:
+                row = tuple(row) + (None,) * (width - len(row))
+            values = pick(row) if len(columns) > 1 else (pick(row),)
+
+            close_qty = to_number(values[qty_at])
+            if close_qty is None:
+                continue
+            name = clean_name(values[name_at])
+            if name.startswith(SUBTOTAL_PREFIX):
+                continue
+
+            for at, (append, value) in enumerate(zip(appenders, values)):
+                if at == name_at:
+                    append(name)
+                elif at == qty_at:
+                    append(close_qty)
+                else:
+                    append(value)
+    finally:
+        workbook.close()
+
+    return build_frame(kept)
+
+
+def read_xls(data, usecols):
+    import xlrd
+    from xlrd.compdoc import CompDocError
+
+    try:
+        workbook = xlrd.open_workbook(file_contents=data, on_demand=True)
+        try:
+            sheet = workbook.sheet_by_index(0)
+            if sheet.nrows == 0:
+                raise ValueError("The uploaded file is empty.")
+            positions = select_columns(sheet.row_values(0), usecols)
+
+            # .xls is column addressable, so only the needed columns are pulled out of the sheet
+            raw = {column: sheet.col_values(position, start_rowx=1) for column, position in positions.items()}
+        finally:
+            workbook.release_resources()
+    except (xlrd.XLRDError, CompDocError, struct.error, IndexError, EOFError, OSError) as error:
+        raise unreadable('xls', error) from error
+    return build_frame(keep_rows(raw))
+
+
+def keep_rows(raw):
+    # Drop section headers, blanks and subtotals (no numeric 'Close Qty', or a SUBTOTAL name) from whole columns
+    close_qty = pd.to_numeric(pd.Series(raw['Close Qty'], dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+    names = np.array([clean_name(value) for value in raw['Name']], dtype=object)
+    keep = ~np.isnan(close_qty) & ~pd.Series(names, dtype=object).str.startswith(SUBTOTAL_PREFIX).to_numpy(dtype=bool)
+
+    kept = {}
+    for column, values in raw.items():
+        if column == 'Name':
+            kept[column] = names[keep]
+        elif column == 'Close Qty':
+            kept[column] = close_qty[keep]
+        else:
+            kept[column] = np.asarray(values, dtype=object)[keep]
+    return kept
+
+
+def build_frame(kept):
+    # Apply the declared dtypes once, on the already filtered columns
+    frame = {}
+    for column, values in kept.items():
+        if column in TEXT_COLUMNS:
+            frame[column] = pd.Series(np.asarray(values, dtype=object), dtype=NAME_DTYPE)
+        else:
+            frame[column] = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').astype(NUMERIC_DTYPE)
+    return pd.DataFrame(frame)
+
+
+########################################################################################################
+##########################                    MEMORY REPORT             ################################
+########################################################################################################
+
+def legacy_frame(df):
+    # The frame as the old pandas loader held it: every column object dtype, blanks filled with ''
+    return pd.DataFrame({column: df[column].astype(object).where(df[column].notna(), '') for column in df.columns})
+
+
+def memory_report(df):
+    # Bytes per column for the compact schema against the old all-object representation
+    compact = df.memory_usage(index=False, deep=True)
+    legacy = legacy_frame(df).memory_usage(index=False, deep=True)
+    report = pd.DataFrame({
+        'Column': list(df.columns) + ['Total'],
+        'Dtype': [str(dtype) for dtype in df.dtypes] + [''],
+        'Compact Bytes': list(compact) + [int(compact.sum())],
+        'Legacy Bytes': list(legacy) + [int(legacy.sum())],
+    })
+    report['Ratio'] = (report['Legacy Bytes'] / report['Compact Bytes'].clip(lower=1)).round(1)
+    return report
+
+
+########################################################################################################
+##########################                    ENTRY POINT               ################################
+########################################################################################################
+
+def read_stocktake(file, usecols=None):
+    if usecols is None:
+        usecols = TEXT_COLUMNS + NUMERIC_COLUMNS
+    usecols = set(usecols) | set(REQUIRED_COLUMNS)
+
+    if hasattr(file, 'read'):
+        data = file.read()
+    else:
+        with open(file, 'rb') as handle:
+            data = handle.read()
+
+    # Pick the reader from the file signature; uploads from the cache carry no file name
+    if data.startswith(XLSX_MAGIC):
+        file_format, df = 'xlsx', read_xlsx(data, usecols)
+    elif data.startswith(XLS_MAGIC):
+        file_format, df = 'xls', read_xls(data, usecols)
+    else:
+        raise ValueError("The uploaded file is not an .xls or .xlsx workbook.")
+
+    logger.debug('stocktake read', extra={'format': file_format, 'bytes': len(data), 'rows': len(df),
+                                          'columns': list(df.columns),
+                                          'frame_bytes': int(df.memory_usage(index=False, deep=True).sum())})
+    return df
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Show how much memory a loaded stocktake takes.')
+    parser.add_argument('file', help='.xls or .xlsx stocktake export')
+    args = parser.parse_args(argv)
+    print(memory_report(read_stocktake(args.file)).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
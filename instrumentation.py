@@ -0,0 +1,109 @@
+# instrumentation.py
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+LOGGER_NAME = 'inventory'
+
+DEFAULT_LOG_LEVEL = os.environ.get('INVENTORY_LOG_LEVEL', 'INFO')
+
+# When set, every run's timings are appended to this JSON-lines file
+TIMINGS_FILE = os.environ.get('INVENTORY_TIMINGS_FILE')
+
+# LogRecord attributes that are not user supplied 'extra' fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def get_logger(name):
+    return logging.getLogger(LOGGER_NAME).getChild(name)
+
+
+########################################################################################################
+##########################                    STRUCTURED LOGGING        ################################
+########################################################################################################
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line: timestamp, level, logger, message and any extra fields
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_configure_lock = threading.Lock()
+
+
+def configure_logging(level=DEFAULT_LOG_LEVEL):
+    # Safe to call on every Streamlit rerun; the handler is only attached once
+    logger = logging.getLogger(LOGGER_NAME)
+    with _configure_lock:
+        logger.setLevel(level)
+        if not any(getattr(handler, '_inventory_handler', False) for handler in logger.handlers):
+            handler = logging.StreamHandler()
+            handler.setFormatter(JsonFormatter())
+            handler._inventory_handler = True
+            logger.addHandler(handler)
+            logger.propagate = False
+    return logger
+
+
+########################################################################################################
+##########################                    RUN METRICS               ################################
+########################################################################################################
+
+class RunMetrics:
+    def __init__(self, run='app'):
+        self.run = run
+        self.started = time.time()
+        self.timings = {}
+        self.counters = {}
+        self.logger = get_logger('metrics')
+
+    @contextmanager
+    def stage(self, name):
+        # Time a pipeline stage; repeated stages of the same name add up
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            self.logger.debug('stage finished', extra={'run': self.run, 'stage': name,
+                                                       'ms': round(elapsed * 1000, 3)})
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        return {
+            'run': self.run,
+            'started': round(self.started, 3),
+            'timings_ms': {name: round(seconds * 1000, 3) for name, seconds in self.timings.items()},
+            'total_ms': round(sum(self.timings.values()) * 1000, 3),
+            'counters': dict(self.counters),
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=1)
+
+    def finish(self, timings_file=TIMINGS_FILE):
+        # Log the run as one structured record and optionally append it to the timings file
+        metrics = self.to_dict()
+        self.logger.info('run finished', extra=metrics)
+        if timings_file:
+            with open(timings_file, 'a', encoding='utf-8') as handle:
+                handle.write(json.dumps(metrics) + '\n')
+        return metrics
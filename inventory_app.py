@@ -6,10 +6,25 @@ from datetime import datetime
 import time
 import base64
 from st_aggrid import AgGrid, GridOptionsBuilder
+from actions import apply_actions, group_by_action, record_actions
+from catalog import get_catalog
+from dispatch import DELIVERY_COLUMNS, dispatch_orders, load_dispatch_config
+from export import EXPORT_FORMATS, export_cache
+from history import frame_id, history_store
+from instrumentation import RunMetrics, configure_logging
+from ingest import memory_report, read_stocktake
 from login_page import login_page
+from paging import DEFAULT_PAGE_SIZE, paged_aggrid, paged_dataframe
+from par_levels import usage_par_table
+from reconcile import apply_mappings, mapping_store, missing_from_stocktake, reconcile_names
+from recount import RecountSession
+from result_cache import result_cache
+from reorder import compute_reorder, group_orders_by_supplier
+from upload_cache import hash_upload, upload_cache
+from variance import DEFAULT_THRESHOLDS, VARIANCE_DROP_COLUMNS, VarianceBands
 
 
-st.set_page_config(layout='wide')
+configure_logging()
 
 
 
@@ -37,35 +52,19 @@ st.set_page_config(layout='wide')
 ########################################################################################################
 
 def load_and_filter_excel(file):
-    # Load the Excel file without specifying the header
-    df = pd.read_excel(file, header=None)
-    
-    # Assuming the header starts from the first row, set the first row as the column names
-    df.columns = df.iloc[0]
-    df = df[1:]  # Exclude the first row which is now the header
-
-    # Clean 'Name' column by trimming leading and trailing whitespace
-    # and replacing multiple internal spaces with a single space
-    df['Name'] = df['Name'].astype(str).str.strip().replace(r'\s+', ' ', regex=True)
-
-    # Ensure that 'Close Qty' column exists
-    if 'Close Qty' in df.columns:
-        # Convert 'Close Qty' column to numeric values, coercing errors to NaN for non-numeric values
-        df['Close Qty'] = pd.to_numeric(df['Close Qty'], errors='coerce')
-
-        # Drop rows with NaN values in the "Close Qty" column, if needed
-        df.dropna(subset=['Close Qty'], inplace=True)
+    # Stream only the columns the app uses with declared dtypes,
+    # dropping subtotal and non-numeric 'Close Qty' rows while reading
+    try:
+        return read_stocktake(file)
+    except ValueError as error:
+        st.error(str(error))
+        return None
 
-        # Remove rows starting with 'SUBTOTAL (this section)'
-        df = df[~df['Name'].str.startswith('SUBTOTAL (this section)')]
 
-        # Replace 'None' values with empty string
-        df = df.fillna('')
-    else:
-        st.error("The 'Close Qty' column does not exist in the uploaded file.")
-        return None
-    
-    return df
+def load_stocktake(uploaded_file):
+    # Reuse the parsed frame when the same bytes were uploaded before (this rerun, another session or on disk)
+    data = uploaded_file.getvalue()
+    return upload_cache.get_or_load(data, lambda: load_and_filter_excel(BytesIO(data)))
 
 
 
@@ -96,42 +95,26 @@ def highlight_products(df):
 ##########################           FILTER DATA FOR SECOND TABLE       ################################
 ########################################################################################################
 
-def filter_data_for_second_table(df):
-    # Ensure 'Diff Cost' is numeric
-    if 'Diff Cost' in df.columns:
-        df['Diff Cost'] = pd.to_numeric(df['Diff Cost'], errors='coerce')
-    
-    # Filter based on 'Diff Cost' conditions (positive variances)
-    filtered_df_pos_1 = df[(df['Diff Cost'] >= 5) & (df['Diff Cost'] <= 10)]
-    filtered_df_pos_2 = df[(df['Diff Cost'] > 10) & (df['Diff Cost'] <= 20)]
-    filtered_df_pos_3 = df[(df['Diff Cost'] > 20) & (df['Diff Cost'] <= 30)]
-    filtered_df_pos_4 = df[df['Diff Cost'] > 30]
-
-    # Filter based on 'Diff Cost' conditions (negative variances)
-    filtered_df_neg_1 = df[(df['Diff Cost'] <= -5) & (df['Diff Cost'] > -10)]
-    filtered_df_neg_2 = df[(df['Diff Cost'] <= -10) & (df['Diff Cost'] > -20)]
-    filtered_df_neg_3 = df[(df['Diff Cost'] <= -20) & (df['Diff Cost'] > -30)]
-    filtered_df_neg_4 = df[df['Diff Cost'] <= -30]
-
-    # Combine filtered DataFrames for positive and negative variances
-    combined_filtered_df_pos = pd.concat([filtered_df_pos_1, filtered_df_pos_2, filtered_df_pos_3, filtered_df_pos_4])
-    combined_filtered_df_neg = pd.concat([filtered_df_neg_1, filtered_df_neg_2, filtered_df_neg_3, filtered_df_neg_4])
-
-    # Create an empty DataFrame for spacing
-    empty_space_df = pd.DataFrame(index=range(5), columns=df.columns).fillna("")
-    
-    # Combine all DataFrames with the empty DataFrame in between
-    combined_filtered_sorted_df = pd.concat([combined_filtered_df_pos.sort_values(by='Diff Cost', ascending=False),
+def filter_data_for_second_table(df, thresholds=DEFAULT_THRESHOLDS, bands=None):
+    # Assign every row its variance band in one pass (or reuse bands patched by a recount);
+    # the caller's df is not modified
+    if bands is None:
+        bands = VarianceBands(df, thresholds)
+
+    # Keep only the columns shown in the second table
+    columns = [column for column in df.columns if column not in VARIANCE_DROP_COLUMNS]
+
+    # Blank rows for spacing, typed like the data so the columns keep their dtypes
+    empty_space_df = df[columns].iloc[:0].reindex(range(5))
+
+    # Positive variances (largest first), spacing, then negative variances (largest loss first)
+    combined_filtered_sorted_df = pd.concat([bands.positive(columns),
                                              empty_space_df,
-                                             combined_filtered_df_neg.sort_values(by='Diff Cost', ascending=True)])
+                                             bands.negative(columns)])
 
     # Add an extra column 
     combined_filtered_sorted_df['Action'] = ""
 
-    # Remove specific columns
-    columns_to_remove = ['Open Val', 'Req', 'Close Val', 'Diff Qty Last', 'Diff Weight AVG', 'Wastage Qty', 'Usage Qty']
-    combined_filtered_sorted_df = combined_filtered_sorted_df.drop(columns=columns_to_remove)
-    
     return combined_filtered_sorted_df
 
 
@@ -141,175 +124,33 @@ def filter_data_for_second_table(df):
 
 
 
-# Define dictionary containing information about items
-items_info = {
-    # AMATHUS ORDER LIST
-    'Cider - sassy 0%, 275ML': {'par_level': 12.0, 'supplier': 'Amathus'},
-    'Cider - Sassy Apple 330ml, 330ML': {'par_level': 36.0, 'supplier': 'Amathus'},
-    'Bar - Luxardo Cherries 400g, 400GR': {'par_level': 0.5, 'supplier': 'Amathus'},
-    'Cordial - Bottle green Elderflower 500ML, 500ML': {'par_level': 0.5, 'supplier': 'Amathus'},
-    'Cordial - Bottle Green Ginger & Lemongrass 50cl, 500ML	': {'par_level': 0.7, 'supplier': 'Amathus'},
-
-    'CJuice - Cloudy Apple [Eager] 1000ML, 1000ML': {'par_level': 8.0, 'supplier': 'Amathus'},
-    'Juice - Cranberry [Ocean Spray] 1000ML SUB, 1000ML': {'par_level': 6.0, 'supplier': 'Amathus'},
-    'Juice - Orange [Eager] 1000ML, 1000ML': {'par_level': 10.0, 'supplier': 'Amathus'},
-    'Juice - Pineapple [Eager] 1000ML, 1000ML': {'par_level': 15.0, 'supplier': 'Amathus'},
-    'Juice - Pink Grapefruit [Eager] 1000ML, 1000ML': {'par_level': 7.0, 'supplier': 'Amathus'},
-    'Juice - Tomato [Eager] 1000ML, 1000ML': {'par_level': 12.0, 'supplier': 'Amathus'},
-    'Crodino N/A Aperitif 175ml (1 x 175ML)': {'par_level': 12.0, 'supplier': 'Amathus'},
-
-    'Fever-Tree - Elderflower Tonic 24 x 200ML (1 x 200ML)': {'par_level': 12.0, 'supplier': 'Amathus'},
-    'Fever-Tree - Ginger Ale 200ML (1 x 200ML)': {'par_level': 48.0, 'supplier': 'Amathus'},
-    'Fever-Tree - Ginger Beer 200ML (1 x 200ML)': {'par_level': 48.0, 'supplier': 'Amathus'},
-    'Fever-Tree - Ginger Ale 200ML (1 x 200ML)': {'par_level': 240.0, 'supplier': 'Amathus'},
-    'Fever-Tree - Lemonade 24 x 200ML (1 x 200ML)': {'par_level': 72.0, 'supplier':  'Amathus'},
-    'Fever-Tree - Soda 24 x 200ML (1 x 200ML)': {'par_level': 120.0, 'supplier': 'Amathus'},
-    'Fever-Tree - Refreshingly Light Tonic 200ML, 200ML': {'par_level': 24.0, 'supplier': 'Amathus'},
-    'Fever-Tree - Tonic 24 x 200ML (1 x 200ML)': {'par_level': 120.0, 'supplier': 'Amathus'},
-
-    'Coca-Cola - Coke Glass Bottles 24 x 20CL (Amathus) (1 x 200ML)': {'par_level': 144.0, 'supplier': 'Amathus'},
-    'Coca-Cola - Diet Coke Glass Bottles 24 x 20CL (Amathus) (1 x 200ML)': {'par_level': 144.0, 'supplier': 'Amathus'},
-    'REAL - Sparkling Tea Peony Blush 750ml, 750ML': {'par_level': 2.0, 'supplier': 'Amathus'},
-
-
-    'APERITIF - Aperol 11% 700ML (1 x 700ML))': {'par_level': 10.0, 'supplier': 'Amathus'},
-    'APERITIF - Botivo (Non-Alcoholic) (1 x 500ML))': {'par_level': 0.6, 'supplier': 'Amathus'},
-    'APERITIF - Campari 25% 700ML (1 x 700ML))': {'par_level': 8.0, 'supplier': 'Amathus'},
-    'APERITIF - Pentire Coastal Spritz (1 x 500ML)': {'par_level': 2.0, 'supplier': 'Amathus'},
-
-    'Bitters - Angostura 44.7% 200ML, 200ML': {'par_level': 1.5, 'supplier': 'Amathus'},
-    'Bitters - Angostura Orange 28% 100ML (1 x 100ML)': {'par_level': 0.5, 'supplier': 'Amathus'},
-
-    'COGNAC - Courvoisier VS 700ML, 700ML': {'par_level': 0.5, 'supplier': 'Amathus'},
-    'COGNAC - H By Hine 40% VSOP 700ML, 700ML': {'par_level': 0.4, 'supplier': 'Amathus'},
-    'COGNAC - Martell VS 40% 700ML, 700ML': {'par_level': 0.5, 'supplier': 'Amathus'},
-
-    'DIGESTIF - Absinthe Pernod 68% 700ML (1 x 700ML)': {'par_level': 0.5, 'supplier': 'Amathus'},
-    'DIGESTIF - Amaro Montenegro Liquore Italiano 23% 700ML (1 x 700ML)': {'par_level': 0.5, 'supplier': 'Amathus'},
-    'DIGESTIF - Fernet Branca 39% 700ML, 700ML': {'par_level': 0.5, 'supplier': 'Amathus'},
-
-
-    'GIN - Beefeater Gin 40% 700ML (1 x 700ML)': {'par_level': 10.0, 'supplier': 'Amathus'},
-    'GIN - Beefeater Twenty Four Gin 45% 700ML, 700ML': {'par_level': 0.5, 'supplier': 'Amathus'},
-    'GIN - Hendricks 41.4% 700ML (1 x 700ML)': {'par_level': 1.0, 'supplier': 'Amathus'},
-    'GIN - Malfy Con Arancia 700ML (1 x 700ML)': {'par_level': 0.8, 'supplier': 'Amathus'},
-    'GIN - Malfy Rosa 700ML (1 x 700ML)': {'par_level': 0.8, 'supplier': 'Amathus'},
-    'GIN - Monkey 47 47% 500ML (1 x 500ML)': {'par_level': 0.8, 'supplier': 'Amathus'},
-
-    'GRAPPA - Marolo Grappa di Moscato NV 700ML, 700ML	': {'par_level': 0.5, 'supplier': 'Amathus'},
-
-    'DIGESTIF - Benedictine 40% 700ML, 700ML': {'par_level': 0.5, 'supplier': 'Amathus'},
-    'LIQUEUR - Antica Sambuca Classic (SUB) 700ML (1 x 700ML)': {'par_level': 0.5, 'supplier': 'Amathus'},
-    'LIQUEUR - Baileys Irish Cream 17% 700ML (1 x 700ML)': {'par_level': 0.7, 'supplier': 'Amathus'},
-    'LIQUEUR - Cartron Creme de Peche de Vigne 18% 500ML (1 x 500ML)': {'par_level': 6.0, 'supplier': 'Amathus'},
-    'LIQUEUR - Chambord Raspberry 16.5% 700ML, 700ML': {'par_level': 0.3, 'supplier': 'Amathus'},
-    'LIQUEUR - Chartreuse Green 55% 700ML, 700ML': {'par_level': 0.3, 'supplier': 'Amathus'},
-    'LIQUEUR - Chartreuse Yellow 40% 700ML, 700ML': {'par_level': 0.3, 'supplier': 'Amathus'},
-    'LIQUEUR - Cointreau 40% 700ML, 700ML': {'par_level': 0.5, 'supplier': 'Amathus'},
-    'LIQUEUR - Cointreau 40% 700ML, 700ML': {'par_level': 0.5, 'supplier': 'Amathus'},
-    'LIQUEUR - Cartron Curacao Triple Sec 25% 700ML (1 x 700ML)': {'par_level': 8.0, 'supplier': 'Amathus'},
-    'LIQUEUR - Jagermeister 35% 700ML, 700ML': {'par_level': 0.7, 'supplier': 'Amathus'},
-    'LIQUEUR - Disaronno 28% 700ML (1 x 700ML)': {'par_level': 0.8, 'supplier': 'Amathus'},
-    'LIQUEUR - Kahlua 20% 700ML (1 x 700ML)': {'par_level': 8.0, 'supplier': 'Amathus'},
-    'LIQUEUR - Luxardo Limoncello 27% 70cl (1 x 700ML)': {'par_level': 1.0, 'supplier': 'Amathus'},
-    'LIQUEUR - Lyres Amaretti': {'par_level': 0.4, 'supplier': 'Amathus'},
-    'LIQUEUR - Lyres Coffee Originale (Non-Alcoholic) 700ml, 700ML': {'par_level': 0.4, 'supplier': 'Amathus'},
-    'LIQUEUR - Pimms No. 1 The Original 25% 700ML, 700ML': {'par_level': 0.8, 'supplier': 'Amathus'},
-    'PISCO - 1615 Quebranta 40% 700ML, 700ML': {'par_level': 0.5, 'supplier': 'Amathus'},
-    'LIQUEUR - Parafante fig leaf liqueur (1 x 700ML)': {'par_level': 4.0, 'supplier': 'Amathus'},
+def compare_names(df, catalog, reconciliation=None):
+    # Propose the closest catalog item for every stocktake name the catalog does not know.
+    # reconciliation: (proposals, missing names) already computed, e.g. by another session
+    if reconciliation is None:
+        reconciliation = (reconcile_names(df, catalog), missing_from_stocktake(df, catalog))
+    proposals, missing_in_df = reconciliation
 
+    with st.expander(f"Name reconciliation: {len(proposals)} unmatched names, "
+                     f"{len(missing_in_df)} catalog items not in this stocktake"):
+        if proposals.empty:
+            st.write("All names in the stocktake are present in the catalog.")
+        else:
+            edited = st.data_editor(
+                proposals,
+                disabled=['Name', 'Score'],
+                column_config={'Suggested Match': st.column_config.SelectboxColumn(options=list(catalog.names))},
+                hide_index=True,
+                key='reconcile_editor',
+            )
+            if st.button('Save accepted matches'):
+                accepted = edited[edited['Accept'] & edited['Suggested Match'].isin(catalog.by_normalized)]
+                mapping_store.accept(zip(accepted['Name'], accepted['Suggested Match']))
+                st.rerun()
 
-    'Plantation Pineapple Stiggins Fancy Rum 70CL (1 x 700ML)': {'par_level': 3.0, 'supplier': 'Amathus'},
-    'RUM - Chairmans Reserved Spiced Rum - 700ML, 700ML': {'par_level': 0.6, 'supplier': 'Amathus'},
-    'RUM - El Dorado 12yr 40% 700ML, 700ML': {'par_level': 0.3, 'supplier': 'Amathus'},
-    'RUM - Gosling Black Seal 40% 700ML (1 x 700ML)': {'par_level': 0.6, 'supplier': 'Amathus'},
-    'RUM - Havana Club 3yr 40% 700ML (1 x 700ML)': {'par_level': 8.0, 'supplier': 'Amathus'},
-    'RUM - Havana Club Anejo Especial 40% 700ML (1 x 700ML)': {'par_level': 8.0, 'supplier': 'Amathus'},
-    'RUM - Havana Club 7yr 40% 700ML, 700ML': {'par_level': 0.4, 'supplier': 'Amathus'},
-    'RUM - Havana Spiced, 700ML': {'par_level': 0.4, 'supplier': 'Amathus'},
-    'RUM - Wray & Nephew Overproof 63% 700ML, 700ML': {'par_level': 0.5, 'supplier': 'Amathus'},
-    'SCOTCH - The Glenlivet Carribean Reserve, 700ML': {'par_level': 0.5, 'supplier': 'Amathus'},
-
-
-    'MEZCAL - Del Maguey Vida Puebla 42% 700ML (1 x 700ML)': {'par_level': 6.0, 'supplier': 'Amathus'},
-    'TEQUILA - Cabrito Blanco 40% 100% Agave 700ML (1 x 700ML)': {'par_level': 12.0, 'supplier': 'Amathus'},
-    'TEQUILA - Cabrito Reposado 40% 100% Agave 700ML (1 x 700ML)': {'par_level': 12.0, 'supplier': 'Amathus'},
-    'TEQUILA - Patron Anejo 40% 700ML (1 x 700ML)': {'par_level': 0.5, 'supplier': 'Amathus'},
-    'TEQUILA Cazcabel Coffee 70cl (1 x 700ML)': {'par_level': 0.8, 'supplier': 'Amathus'},
-
-
-    'VERMOUTH - Dolin Chambery Rouge 16% 750ML (1 x 750ML)': {'par_level': 2.0, 'supplier': 'Amathus'},
-    'VERMOUTH - Lillet Rose (1 x 750ML)': {'par_level': 3.0, 'supplier': 'Amathus'},
-
-
-    'VODKA - Absolut Blue 40% 700ML (1 x 700ML)': {'par_level': 10.0, 'supplier': 'Amathus'},
-    'VODKA - Absolut Vanilla 40% 700ML (1 x 700ML)': {'par_level': 0.6, 'supplier': 'Amathus'},
-    'VODKA - Belvedere 40% 700ML, 700ML': {'par_level': 0.4, 'supplier': 'Amathus'},
-
-
-
-    'BOURBON - Wild Turkey 81 - 40.5% 700ML (1 x 700ML)': {'par_level': 8.0, 'supplier': 'Amathus'},
-    'BOURBON - Wild Turkey 101 50.5% 700ML, 700ML': {'par_level': 0.4, 'supplier': 'Amathus'},
-    'BOURBON - Woodford Reserve 43.2% 700ML (1 x 700ML)': {'par_level': 0.5, 'supplier': 'Amathus'},
-    'IRISH - Jameson 40% 700ML (1 x 700ML)': {'par_level': 0.6, 'supplier': 'Amathus'},
-    'JAPANESE - Suntory Hibiki Harmony 43% max 1 per order 700ML (1 x 700ML)': {'par_level': 0.6, 'supplier': 'Amathus'},
-    'JAPANESE - Nikka from the Barrel 51.4% 500ML, 500ML': {'par_level': 0.5, 'supplier': 'Amathus'},
-    'RYE - Rittenhouse BIB 50% 100 proof 750ML, 750ML': {'par_level': 0.4, 'supplier': 'Amathus'},
-    'RYE - Wild Turkey 40.5% 700ML, 700ML': {'par_level': 0.4, 'supplier': 'Amathus'},
-    'SCOTCH - Ardbeg 10yr 46% 700ML, 700ML': {'par_level': 0.4, 'supplier': 'Amathus'},
-    'SCOTCH - Chivas Regal 12yr 40% 700ML (1 x 700ML)': {'par_level': 0.8, 'supplier': 'Amathus'},
-    'SCOTCH - Glenfiddich 12yr 40% 700ML, 700ML': {'par_level': 0.5, 'supplier': 'Amathus'},
-    'SCOTCH - Old Pulteney 12yr 40% 700ML, 700ML': {'par_level': 0.3, 'supplier': 'Amathus'},
-    'TENNESSEE - Jack Daniels 40% 700ML (1 x 700ML)': {'par_level': 0.8, 'supplier': 'Amathus'},
-    'WHISKY - Redbreast 12yo, 700ML': {'par_level': 0.3, 'supplier': 'Amathus'},
-
-
-    'NV 10-Year-Old Tawny Port, Sandeman 75cl (1 x 750ML)': {'par_level': 0.6, 'supplier': 'Amathus'},
-
-
-    # BIERCRAFT ORDER
-    'Ale - Beavertown Neck Oil 330ML, 330ML': {'par_level': 18, 'supplier': 'Biercraft'},
-    'Ale - Farmhouse Ale, Hop Hand Fallacy, Lost & Grounded 440ml Can, 440ML	': {'par_level': 18, 'supplier': 'Biercraft'},
-    'Ale - Beavertown Neck Oil 330ML, 330ML': {'par_level': 18, 'supplier': 'Biercraft'},
-    'Ale - Neck Oil - 30L, 1LT': {'par_level': 1000.0, 'supplier': 'Biercraft'},
-    'Power Plant Natural Lager 330ML (1 x 330ML)': {'par_level': 200.0, 'supplier': 'Biercraft'},
-    'Stout - Guinness 50L, 1LT': {'par_level': 150.0, 'supplier': 'Biercraft'},
-    'Lager - Lucky Saint 0.5% 330ml, 330ML': {'par_level': 24.0, 'supplier': 'Biercraft'},
-
-
-    # LOST AND GROUNDED ORDER
-    'Pale Ale - Lost and Grounded Pale Ale (Wanna Go to the Sun) 30L, 30LT': {'par_level': 5.0, 'supplier': 'Lost and Grounded'},
-    'Lager - Lost and Grounded Helles 30L, 30LT': {'par_level': 6.0, 'supplier': 'Lost and Grounded'},
-
-    # STORES SUPPLY WAREHOUSE
-    'Agua de Madre - Pink Grapefruit + Lime Water Kefir - Case - 12 x 330ml Cans, 330ML': {'par_level': 144.0, 'supplier': 'Stores Supply Warehouse'},
-    'Karma - Gingerella Can 24 x 250ML, 250ML': {'par_level': 24.0, 'supplier': 'Stores Supply Warehouse'},
-    'LA Brewery Kombucha - Ginger - Case - 12 x 330ml, 330ML': {'par_level': 72.0, 'supplier': 'Stores Supply Warehouse'},
-    'Sparkling Mate, Charitea CASE 24 x 330ML, 330ML': {'par_level': 24.0, 'supplier': 'Stores Supply Warehouse'}
-
-}
-
-
-def compare_names(df, items_info):
-    # Convert DataFrame names to a set for efficient comparison
-    df_names = set(df['Name'].astype(str).str.strip())
-    
-    # Convert items_info keys to a set
-    items_info_names = set(items_info.keys())
-    
-    # Find names in df not in items_info
-    missing_in_items_info = df_names - items_info_names
-    if missing_in_items_info:
-        print("Names in df but not in items_info:", missing_in_items_info)
-    else:
-        print("All names in df are present in items_info.")
-    
-    # Find names in items_info not in df
-    missing_in_df = items_info_names - df_names
-    if missing_in_df:
-        print("Names in items_info but not in df:", missing_in_df)
-    else:
-        print("All names in items_info are present in df.")
+        if missing_in_df:
+            st.write("Catalog items not in this stocktake:")
+            st.dataframe(pd.DataFrame({'Name': missing_in_df}))
 
 
 
@@ -318,33 +159,8 @@ def compare_names(df, items_info):
 ########################################################################################################
 
 def check_inventory_needs(df, items_info):
-    items_to_order = []
-
-    for item, info in items_info.items():
-        par_level = info.get('par_level')
-        supplier = info.get('supplier')
-
-        if par_level is None or supplier is None:
-            # Skip items with missing information
-            continue
-
-        item_row = df[df['Name'] == item]
-        if not item_row.empty:
-            close_qty = item_row['Close Qty'].iloc[0]
-            # Check if the 'Close Qty' value is numeric
-            if pd.notnull(close_qty) and isinstance(close_qty, (int, float)):
-                if close_qty < par_level:
-                    quantity_needed = par_level - close_qty
-                    items_to_order.append({'Item': item, 'Quantity Needed': quantity_needed, 'Supplier': supplier})
-            else:
-                # Skip items with non-numeric or missing 'Close Qty'
-                continue
-        else:
-            # Skip items not found in the DataFrame
-            continue
-
-    items_to_order_df = pd.DataFrame(items_to_order)
-    return items_to_order_df
+    # Single join-based pass over 'Close Qty' for every item in items_info
+    return compute_reorder(df, items_info)
 
 
 
@@ -352,6 +168,23 @@ def check_inventory_needs(df, items_info):
 ##########################                    MAIN FUNCTION             ################################
 ########################################################################################################
 
+def show_performance_panel(metrics, df=None):
+    # Optional per-stage timings and counters for this rerun, plus a JSON export
+    if not st.sidebar.checkbox("Show performance panel"):
+        return
+    with st.sidebar.expander("Performance", expanded=True):
+        timings = metrics.to_dict()
+        st.dataframe(pd.DataFrame({'Stage': list(timings['timings_ms']), 'ms': list(timings['timings_ms'].values())}),
+                     hide_index=True)
+        st.dataframe(pd.DataFrame({'Counter': list(timings['counters']), 'Value': list(timings['counters'].values())}),
+                     hide_index=True)
+        st.download_button("Download timings (JSON)", metrics.to_json(), file_name='timings.json',
+                           mime='application/json')
+        if df is not None:
+            st.write("Stocktake memory, compact schema vs. all-object frame:")
+            st.dataframe(memory_report(df), hide_index=True)
+
+
 def main():
     st.title('Good morning!')
 
@@ -361,108 +194,195 @@ def main():
     if 'actions_for_items' not in st.session_state:
         st.session_state.actions_for_items = {}
 
+    # Results of the last upload in this session, patched rather than recomputed for a corrected recount
+    if 'recount' not in st.session_state:
+        st.session_state.recount = RecountSession()
+
     if uploaded_file is not None:
-        df = load_and_filter_excel(uploaded_file)
-        compare_names(df, items_info)
+        metrics = RunMetrics()
+
+        with metrics.stage('ingest'):
+            hits_before = upload_cache.hit_counts()['hits']
+            df = load_stocktake(uploaded_file)
+            metrics.count('cache_hits', upload_cache.hit_counts()['hits'] - hits_before)
+        if df is None:
+            metrics.finish()
+            return
+        metrics.count('rows', len(df))
+        metrics.count('frame_bytes', int(df.memory_usage(index=False, deep=True).sum()))
+
+        # Product catalog, loaded once per process and shared across sessions
+        catalog = get_catalog()
+
+        # Rename export names to catalog names accepted on earlier uploads, then reconcile the rest
+        upload_id = hash_upload(uploaded_file.getvalue())
+        with metrics.stage('reconcile'):
+            mappings = mapping_store.mappings()
+            mappings_key = hash(frozenset(mappings.items()))
+            df = apply_mappings(df, mappings)
+
+            # Derived results are shared by every session that opens the same file with the same catalog
+            # and accepted mappings; concurrent sessions wait for one computation instead of repeating it
+            reconciliation = result_cache.get_or_compute(
+                upload_id, catalog.version, ('reconcile', mappings_key),
+                lambda: (reconcile_names(df, catalog), missing_from_stocktake(df, catalog)))
+            compare_names(df, catalog, reconciliation)
+
+        # Diff against the previous upload, so a recount only re-bands and re-orders the lines that changed
+        recount = st.session_state.recount
+        recount.incremental = st.sidebar.checkbox("Recount mode", value=True,
+                                                  help="Only recompute lines that changed since the previous upload")
+        with metrics.stage('recount'):
+            df = recount.load(df, (upload_id, mappings_key))
+        if recount.diff is not None:
+            metrics.count('recount_changed_rows', len(recount.diff))
+
+        cache_stats = upload_cache.hit_counts()
+        st.sidebar.caption(f"Upload cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+        result_stats = result_cache.hit_counts()
+        st.sidebar.caption(f"Result cache: {result_stats['hits']} hits, {result_stats['misses']} misses, "
+                           f"{result_stats['entries']} results")
+
+        # File the cleaned stocktake in the history store only once the manager has set its site and date,
+        # so reruns with the sidebar defaults never add counts to the trends or the usage-based par levels
+        site = st.sidebar.text_input("Site", value="default")
+        count_date = st.sidebar.date_input("Count date", value=datetime.today())
+        with metrics.stage('history'):
+            if st.sidebar.button("Save to history", help="File this stocktake under the site and count date above"):
+                if history_store.append(df, site, count_date, upload_id=upload_id):
+                    st.sidebar.success(f"Saved to history for {site} on {count_date}.")
+                else:
+                    st.sidebar.info(f"This stocktake is already in the history for {site} on {count_date}.")
+
+            with st.expander("Variance trends"):
+                last_n = st.slider("Last N counts", min_value=1, max_value=history_store.window, value=history_store.window)
+                paged_dataframe(history_store.sku_trends(site, last_n), 'trends', searchable=True)
 
         st.write("Original dataset:")
-        # Display the original dataframe with full width in the first row
-        st.dataframe(df)  # Display the DataFrame without styling for simplicity
+        # Display the original dataframe one page at a time; the full frame stays on the server
+        with metrics.stage('render'):
+            paged_dataframe(df, 'original', searchable=True)
 
         # with first_row_cols[1]:
         st.write("Filtered dataset:")
-        # Display each filtered table in a column
-        filtered_df = filter_data_for_second_table(df)
-        st.dataframe(filtered_df)
-        # st.dataframe(filtered_df)
-
+        # Display each filtered table in a column, with the actions already entered this session
+        actions_for_items = st.session_state.actions_for_items
+        with metrics.stage('filter'):
+            # The cached computations leave the session alone; whichever session computed the bands,
+            # this one keeps them so its next recount is patched from them
+            bands = result_cache.get_or_compute(
+                upload_id, catalog.version, ('bands', mappings_key, DEFAULT_THRESHOLDS),
+                lambda: recount.compute_bands(DEFAULT_THRESHOLDS))
+            recount.store_bands(DEFAULT_THRESHOLDS, bands)
+            variance_df = result_cache.get_or_compute(
+                upload_id, catalog.version, ('variance', mappings_key, DEFAULT_THRESHOLDS),
+                lambda: filter_data_for_second_table(df, bands=bands))
+            filtered_df = apply_actions(variance_df, actions_for_items)
+        metrics.count('variance_rows', len(filtered_df))
+
+        grid_result = None
         if not filtered_df.empty:
-            # Render AgGrid for user to make edits, before submitting
-            grid_result = AgGrid(filtered_df, editable=True, key='grid1')
+            # Render AgGrid for user to make edits, before submitting (current page only)
+            with metrics.stage('render'):
+                grid_start, grid_result = paged_aggrid(filtered_df, 'grid1', editable=True)
 
+            # Keep the edits as a per-item delta so they survive reruns and re-uploads
+            grid_df = grid_result['data']
+            shown_df = filtered_df.iloc[grid_start:grid_start + DEFAULT_PAGE_SIZE]
+            if record_actions(actions_for_items, shown_df, grid_df):
+                filtered_df = apply_actions(filtered_df, actions_for_items)
 
 
-        if st.button('Submit'):
-            # Use the data from the grid after submitting
-            edited_df = grid_result['data']
-            edited_df['Action'] = edited_df['Action'].astype(str)
 
-            # Assuming 'Action' is the column based on which you are separating the tables
-            unique_actions = edited_df['Action'].unique()
+        # Remember the submit for this upload, so paging through the action tables (a rerun in which
+        # the button reads False) keeps them on screen
+        if st.button('Submit'):
+            st.session_state.submitted_upload = upload_id
+        if st.session_state.get('submitted_upload') == upload_id and grid_result is not None:
+            # Split the filtered table by action in a single group-by pass
+            action_groups = group_by_action(filtered_df)
 
             # Calculate the number of columns needed based on the number of unique actions
-            columns = st.columns(max(len(unique_actions), 1))
+            columns = st.columns(max(len(action_groups), 1))
 
             # Iterate over each unique action to display separate dataframes
-            for i, action in enumerate(unique_actions):
-                action_df = edited_df[edited_df['Action'] == action]
-
-                with columns[i]:
-                    st.write(f"Data for Action: {action}")
-                    st.dataframe(action_df, height=300)  # Corrected line
+            with metrics.stage('render'):
+                for i, (action, action_df) in enumerate(action_groups):
+                    with columns[i]:
+                        st.write(f"Data for Action: {action}")
+                        paged_dataframe(action_df, f'action_{i}', height=300)
         else:
             st.write("No data matches the filtering criteria.")
 
 
-        # Check inventory needs and generate order list
-        items_to_order = []
-        for item, info in items_info.items():
-            par_level = info.get('par_level')
-            supplier = info.get('supplier')
-
-            if par_level is None or supplier is None:
-                print(f"Skipping item {item}: Missing par_level or supplier.")
-                continue
-
-            item_row = df[df['Name'] == item]
-            if not item_row.empty:
-                close_qty = item_row['Close Qty'].iloc[0]
-                print(f"Item: {item}, Close Qty: {close_qty}, Par Level: {par_level}")
-                if pd.notnull(close_qty) and isinstance(close_qty, (int, float)):
-                    if close_qty < par_level:
-                        print(f"Item {item} needs ordering.")
-                        quantity_needed = par_level - close_qty
-                        items_to_order.append({'Item': item, 'Quantity Needed': quantity_needed, 'Supplier': supplier})
-                else:
-                    print(f"Skipping item {item}: Close Qty is not numeric.")
-            else:
-                print(f"Skipping item {item}: No data found.")
-            
-
         # Display the table containing items that need to be ordered
         st.write("Items to Order:")
-        
-        # Group items by supplier
-        grouped_by_supplier = {}
-        for item, info in items_info.items():
-            supplier = info['supplier']
-            if supplier not in grouped_by_supplier:
-                grouped_by_supplier[supplier] = []
-            grouped_by_supplier[supplier].append((item, info))
+
+        # Par levels: fixed catalog values, or derived from this site's usage history
+        par_table = catalog.par_table
+        if st.sidebar.checkbox("Usage-based par levels"):
+            with metrics.stage('par_levels'):
+                usage_history = history_store.load(site=site, columns=['Usage Qty', 'Wastage Qty'])
+                par_table = usage_par_table(catalog.par_table, usage_history)
+            with st.expander("Par levels"):
+                st.dataframe(par_table)
+
+        # Compute order quantities for all suppliers in one pass, grouped by supplier
+        with metrics.stage('reorder'):
+            par_key = 'catalog' if par_table is catalog.par_table else frame_id(par_table)
+            orders = result_cache.get_or_compute(
+                upload_id, catalog.version, ('orders', mappings_key, par_key),
+                lambda: recount.compute_orders(par_table))
+            recount.store_orders(par_table, orders)
+            supplier_orders = group_orders_by_supplier(orders, catalog.suppliers)
+        metrics.count('matched_items', int(df['Name'].isin(catalog.by_normalized).sum()))
+        metrics.count('items_to_order', sum(len(orders) for orders in supplier_orders.values()))
 
         # Create layout for the ordering tables
-        ordering_tables_cols = st.columns(len(grouped_by_supplier))
+        ordering_tables_cols = st.columns(len(supplier_orders))
 
         # Display separate tables for items from each supplier next to each other
-        for i, (supplier, items) in enumerate(grouped_by_supplier.items()):
-            with ordering_tables_cols[i]:
-                st.subheader(f"Order List for {supplier}")
-                items_info_supplier = {item: info for item, info in items}
-                supplier_order_df = check_inventory_needs(df, items_info_supplier)
-                st.dataframe(supplier_order_df)
-
-# Initialize session state for login status
-if 'logged_in' not in st.session_state:
-    st.session_state['logged_in'] = False
-
-# Conditional logic to display the login page or the main app content
-if not st.session_state['logged_in']:
-    login_page()  # Show login page if not logged in
-else:
-    main()
-
-
-
-
-
-
+        with metrics.stage('render'):
+            for i, (supplier, supplier_order_df) in enumerate(supplier_orders.items()):
+                with ordering_tables_cols[i]:
+                    st.subheader(f"Order List for {supplier}")
+                    st.dataframe(supplier_order_df)
+
+        # Order downloads, built once per distinct set of orders and shared across reruns and sessions
+        with metrics.stage('export'):
+            download_cols = st.columns(len(EXPORT_FORMATS))
+            for i, (file_format, (_, mime)) in enumerate(EXPORT_FORMATS.items()):
+                with download_cols[i]:
+                    st.download_button(f"Download orders ({file_format.upper()})",
+                                       export_cache.get_or_build(supplier_orders, file_format),
+                                       file_name=f'orders_{count_date}.{file_format}', mime=mime)
+
+        # Send every supplier's order at once through the transports in dispatch.json
+        dispatch_config = load_dispatch_config()
+        if dispatch_config is None:
+            st.caption("Copy dispatch.example.json to dispatch.json to send orders to suppliers from here.")
+        else:
+            # Orders already in the delivery log as sent are skipped, so a second click does not repeat them
+            resend = st.checkbox("Resend orders already sent")
+        if dispatch_config is not None and st.button("Send orders"):
+            with metrics.stage('dispatch'):
+                deliveries = dispatch_orders({site: supplier_orders}, count_date, dispatch_config, resend=resend)
+            metrics.count('orders_sent', sum(record['Status'] == 'sent' for record in deliveries))
+            st.dataframe(pd.DataFrame(deliveries, columns=DELIVERY_COLUMNS + ['At']))
+
+        metrics.finish()
+        show_performance_panel(metrics, df)
+
+# Only run the app when Streamlit executes this file, so benchmarks and tools can import it
+if __name__ == '__main__':
+    st.set_page_config(layout='wide')
+
+    # Initialize session state for login status
+    if 'logged_in' not in st.session_state:
+        st.session_state['logged_in'] = False
+
+    # Conditional logic to display the login page or the main app content
+    if not st.session_state['logged_in']:
+        login_page()  # Show login page if not logged in
+    else:
+        main()
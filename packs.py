@@ -0,0 +1,120 @@
+# packs.py
+#
+# Pack sizes from the free-text item names, e.g.
+#   'Fever-Tree - Tonic 24 x 200ML (1 x 200ML)'   cases of 24, counted in 200ML bottles
+#   'Ale - Neck Oil - 30L, 1LT'                    30L kegs, counted in litres
+#   'Lager - Lost and Grounded Helles 30L, 30LT'   30L kegs, counted in kegs
+
+import re
+
+import numpy as np
+import pandas as pd
+
+PACK_COLUMNS = ['pack_count', 'unit_size', 'unit', 'stock_size', 'case_size']
+
+# Unit as written -> (base unit, size of one unit in the base unit)
+UNITS = {
+    'ml': ('ml', 1.0), 'cl': ('ml', 10.0), 'l': ('ml', 1000.0), 'lt': ('ml', 1000.0), 'ltr': ('ml', 1000.0),
+    'g': ('g', 1.0), 'gr': ('g', 1.0), 'kg': ('g', 1000.0),
+}
+
+# How each supplier sells: 'case' rounds orders up to whole cases or kegs, 'unit' to whole stock units
+# (bottles, litres, ...), None leaves the quantities as computed
+SUPPLIER_ROUNDING = {
+    'Amathus': 'case',
+    'Biercraft': 'case',
+    'Lost and Grounded': 'case',
+    'Stores Supply Warehouse': 'case',
+}
+DEFAULT_ROUNDING = 'unit'
+
+# One pass per name: the first size in the name, with its 'N x' pack count when there is one, then the
+# stock unit the export counts in, written as a trailing ', 700ML' or '(1 x 700ML)'
+PACK_PATTERN = re.compile(
+    r'(?i)^(?:.*?\b(?:(?P<pack_count>\d+)\s*x\s*)?(?P<size>\d+(?:\.\d+)?)\s*(?P<unit>ML|CL|LTR|LT|L|KG|GR|G)\b)?'
+    r'.*?(?:(?:,\s*|\(\s*\d+\s*x\s*)(?P<stock_size>\d+(?:\.\d+)?)\s*(?P<stock_unit>ML|CL|LTR|LT|L|KG|GR|G)\b\)*)?\s*$'
+)
+
+
+# Regex groups holding numbers; the others hold units
+NUMBER_GROUPS = ('pack_count', 'size', 'stock_size')
+
+
+def base_units(sizes, units):
+    # (size in ml or g, base unit); NaN / None where the name had no size
+    units = pd.Series(units, dtype=object)
+    scale = units.map({unit: factor for unit, (_, factor) in UNITS.items()}).to_numpy(dtype=np.float64)
+    base = units.map({unit: base for unit, (base, _) in UNITS.items()}).to_numpy(dtype=object)
+    return np.asarray(sizes, dtype=np.float64) * scale, base
+
+
+def extract_parts(names):
+    # One regex pass over all names, numbers as floats and units lower-cased. RE2 through pyarrow
+    # when it is installed (about twice as fast as pandas' str.extract), Python's re otherwise.
+    names = np.asarray(names, dtype=object)
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        parts = pd.Series(names, dtype=object).str.extract(PACK_PATTERN)
+        return {field: pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64) if field in NUMBER_GROUPS
+                else values.str.lower().to_numpy(dtype=object) for field, values in parts.items()}
+
+    matches = pc.extract_regex(pa.array(names, type=pa.string(), from_pandas=True), PACK_PATTERN.pattern)
+    parts = {}
+    for i, values in enumerate(matches.flatten()):
+        # Groups that did not take part in the match come back as ''
+        values = pc.if_else(pc.equal(values, ''), pa.scalar(None, pa.string()), values)
+        if matches.type.field(i).name in NUMBER_GROUPS:
+            values = pc.cast(values, pa.float64()).to_numpy(zero_copy_only=False)
+        else:
+            values = pc.utf8_lower(values).to_numpy(zero_copy_only=False)
+        parts[matches.type.field(i).name] = values
+    return parts
+
+
+def parse_pack_sizes(names):
+    # Vectorised over every name: one regex pass, then NumPy arithmetic
+    parts = extract_parts(names)
+
+    pack_count = np.where(np.isnan(parts['pack_count']), 1.0, parts['pack_count'])
+    unit_size, unit = base_units(parts['size'], parts['unit'])
+    stock_size, stock_unit = base_units(parts['stock_size'], parts['stock_unit'])
+
+    # A name with a single size ('Cider - sassy 0%, 275ML') is counted in that size
+    single = np.isnan(stock_size)
+    stock_size[single] = unit_size[single]
+    stock_unit[single] = unit[single]
+
+    # Stock units per case or keg: 24 x 200ML counted in 200ML is 24, a 30L keg counted in 1LT is 30.
+    # Anything that is not a whole multiple of the stock unit is ordered unit by unit.
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = pack_count * unit_size / stock_size
+    whole = np.round(ratio)
+    case_size = np.where((unit == stock_unit) & (whole >= 2) & (np.abs(ratio - whole) < 0.01), whole, 1.0)
+
+    return pd.DataFrame({
+        'pack_count': pack_count,
+        'unit_size': unit_size,
+        'unit': unit,
+        'stock_size': stock_size,
+        'case_size': case_size,
+    }, columns=PACK_COLUMNS)
+
+
+def order_multiples(case_sizes, suppliers, rounding=None):
+    # Order quantities are rounded up to a multiple of this; NaN leaves them unrounded
+    rounding = dict(SUPPLIER_ROUNDING, **(rounding or {}))
+    modes = pd.Series(np.asarray(suppliers, dtype=object)).map(lambda supplier: rounding.get(supplier, DEFAULT_ROUNDING))
+    modes = modes.to_numpy(dtype=object)
+    case_sizes = np.asarray(case_sizes, dtype=np.float64)
+    return np.where(modes == 'case', case_sizes, np.where(modes == 'unit', 1.0, np.nan))
+
+
+def round_up(quantities, multiples):
+    # Whole multiples, tolerant of float noise so 24.0000001 bottles is still one case of 24
+    quantities = np.asarray(quantities, dtype=np.float64)
+    multiples = np.asarray(multiples, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rounded = np.ceil(np.round(quantities / multiples, 6)) * multiples
+    return np.where(multiples > 0, rounded, quantities)
@@ -0,0 +1,60 @@
+# paging.py
+
+import math
+
+import streamlit as st
+from st_aggrid import AgGrid
+
+# Rows sent to the browser per grid page
+DEFAULT_PAGE_SIZE = 50
+
+
+def page_bounds(n_rows, page, page_size=DEFAULT_PAGE_SIZE):
+    # 1-based page -> (start, stop, number of pages), clamped to the frame
+    n_pages = max(1, math.ceil(n_rows / page_size))
+    page = min(max(1, int(page)), n_pages)
+    start = (page - 1) * page_size
+    return start, min(start + page_size, n_rows), n_pages
+
+
+def page_controls(n_rows, key, page_size=DEFAULT_PAGE_SIZE):
+    # Page picker kept in session state; only the chosen slice ever leaves the server
+    n_pages = max(1, math.ceil(n_rows / page_size))
+    page_key = f'{key}_page'
+    if st.session_state.get(page_key, 1) > n_pages:
+        st.session_state[page_key] = n_pages
+
+    controls = st.columns([1, 4])
+    with controls[0]:
+        # No value=: the page lives in session state (clamped above), and Streamlit warns when both are set
+        page = st.number_input('Page', min_value=1, max_value=n_pages, step=1, key=page_key)
+    start, stop, _ = page_bounds(n_rows, page, page_size)
+    with controls[1]:
+        st.caption(f"Rows {start + 1 if n_rows else 0}-{stop} of {n_rows} (page {page} of {n_pages})")
+    return start, stop
+
+
+def search_rows(df, key, column='Name'):
+    # Optional server-side filter so finding a SKU does not mean paging through everything
+    if column not in df.columns:
+        return df
+    query = st.text_input(f'Search {column}', key=f'{key}_search')
+    if not query:
+        return df
+    return df[df[column].astype(str).str.contains(query, case=False, regex=False, na=False)]
+
+
+def paged_dataframe(df, key, page_size=DEFAULT_PAGE_SIZE, searchable=False, **kwargs):
+    if searchable:
+        df = search_rows(df, key)
+    start, stop = page_controls(len(df), key, page_size)
+    page_df = df.iloc[start:stop]
+    st.dataframe(page_df, **kwargs)
+    return page_df
+
+
+def paged_aggrid(df, key, page_size=DEFAULT_PAGE_SIZE, **kwargs):
+    # Returns (start, grid result) for the page shown; start is the page's row offset in df
+    start, stop = page_controls(len(df), key, page_size)
+    grid_result = AgGrid(df.iloc[start:stop], key=f'{key}_{start}', **kwargs)
+    return start, grid_result
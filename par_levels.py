@@ -0,0 +1,132 @@
+# par_levels.py
+
+import numpy as np
+import pandas as pd
+
+# Smoothing weight given to the newest count
+DEFAULT_ALPHA = 0.3
+
+# Standard deviations of demand held as safety stock (1.65 ~ 95% service level)
+DEFAULT_SAFETY_FACTOR = 1.65
+
+# Counts between two deliveries being placed, on top of the supplier lead time
+DEFAULT_REVIEW_PERIODS = 1.0
+
+# Days from placing an order to it arriving behind the bar
+SUPPLIER_LEAD_TIME_DAYS = {
+    'Amathus': 2,
+    'Biercraft': 3,
+    'Lost and Grounded': 5,
+    'Stores Supply Warehouse': 2,
+}
+DEFAULT_LEAD_TIME_DAYS = 3
+
+# SKUs with fewer counts than this keep their catalog par level
+MIN_COUNTS = 4
+
+PAR_COLUMNS = ['Item', 'par_level', 'supplier', 'case_size', 'Catalog Par', 'Usage Par', 'Counts']
+
+
+########################################################################################################
+##########################                    USAGE MATRIX              ################################
+########################################################################################################
+
+def usage_matrix(history):
+    # history: one row per SKU and count, with Name, count_date, Usage Qty and Wastage Qty.
+    # Returns (names, dates, matrix) with NaN where a SKU was not counted.
+    usage = history['Usage Qty'].to_numpy(dtype=np.float64) if 'Usage Qty' in history else np.nan
+    wastage = history['Wastage Qty'].to_numpy(dtype=np.float64) if 'Wastage Qty' in history else np.nan
+    consumption = np.nansum(np.vstack(np.broadcast_arrays(usage, wastage)), axis=0)
+    consumption[np.isnan(usage) & np.isnan(wastage)] = np.nan
+
+    name_codes, names = pd.factorize(history['Name'])
+    date_codes, dates = pd.factorize(history['count_date'], sort=True)
+
+    matrix = np.full((len(names), len(dates)), np.nan)
+    matrix[name_codes, date_codes] = consumption
+    return np.asarray(names, dtype=object), np.asarray(dates, dtype=object), matrix
+
+
+def period_days(dates, default=7.0):
+    # Typical spacing between counts, used to turn lead times into count periods
+    if len(dates) < 2:
+        return default
+    days = np.diff(pd.to_datetime(pd.Series(dates)).to_numpy()).astype('timedelta64[D]').astype(np.float64)
+    days = days[days > 0]
+    return float(np.median(days)) if len(days) else default
+
+
+########################################################################################################
+##########################                    SMOOTHING ENGINE          ################################
+########################################################################################################
+
+def smooth_demand(matrix, alpha=DEFAULT_ALPHA):
+    # Exponential smoothing of every SKU at once: the loop runs over counts, each step is
+    # a vector operation over all SKUs. Uncounted periods (NaN) leave a SKU's state unchanged.
+    n_skus = matrix.shape[0]
+    level = np.full(n_skus, np.nan)
+    variance = np.zeros(n_skus)
+    counts = np.zeros(n_skus, dtype=np.int64)
+
+    for column in matrix.T:
+        seen = ~np.isnan(column)
+        first = seen & (counts == 0)
+        update = seen & ~first
+
+        level[first] = column[first]
+
+        error = column[update] - level[update]
+        level[update] += alpha * error
+        variance[update] = (1 - alpha) * (variance[update] + alpha * error * error)
+
+        counts += seen
+    return level, np.sqrt(variance), counts
+
+
+def compute_par_levels(matrix, lead_periods, alpha=DEFAULT_ALPHA, safety_factor=DEFAULT_SAFETY_FACTOR,
+                       review_periods=DEFAULT_REVIEW_PERIODS):
+    # Par = expected demand over the lead time plus review period, plus safety stock
+    level, sigma, counts = smooth_demand(matrix, alpha)
+    cover = np.asarray(lead_periods, dtype=np.float64) + review_periods
+    par = np.maximum(level, 0) * cover + safety_factor * sigma * np.sqrt(cover)
+    return par, counts
+
+
+########################################################################################################
+##########################                    PAR TABLE                 ################################
+########################################################################################################
+
+def usage_par_table(par_table, history, lead_time_days=None, alpha=DEFAULT_ALPHA,
+                    safety_factor=DEFAULT_SAFETY_FACTOR, min_counts=MIN_COUNTS):
+    # Same shape as the catalog par table, with usage-derived par levels where there is enough history
+    lead_time_days = dict(SUPPLIER_LEAD_TIME_DAYS, **(lead_time_days or {}))
+    result = par_table[['Item', 'par_level', 'supplier']].copy()
+    result['case_size'] = par_table['case_size'] if 'case_size' in par_table.columns else 1.0
+    result['Catalog Par'] = result['par_level']
+    result['Usage Par'] = np.nan
+    result['Counts'] = 0
+
+    if history is None or history.empty:
+        return result[PAR_COLUMNS]
+
+    names, dates, matrix = usage_matrix(history)
+    rows = pd.Index(names).get_indexer(result['Item'])
+    known = rows >= 0
+    if not known.any():
+        return result[PAR_COLUMNS]
+
+    days_per_period = period_days(dates)
+    lead_days = result['supplier'].map(lead_time_days).fillna(DEFAULT_LEAD_TIME_DAYS).to_numpy(dtype=np.float64)
+    par, counts = compute_par_levels(matrix[rows[known]], lead_days[known] / days_per_period,
+                                     alpha=alpha, safety_factor=safety_factor)
+
+    usage_par = np.full(len(result), np.nan)
+    usage_par[known] = par
+    all_counts = np.zeros(len(result), dtype=np.int64)
+    all_counts[known] = counts
+
+    result['Usage Par'] = usage_par
+    result['Counts'] = all_counts
+    enough = (all_counts >= min_counts) & ~np.isnan(usage_par)
+    result['par_level'] = np.where(enough, np.round(usage_par, 2), result['Catalog Par'].to_numpy())
+    return result[PAR_COLUMNS]
@@ -0,0 +1,170 @@
+# reconcile.py
+
+import json
+import os
+import threading
+import weakref
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAPPINGS_PATH = os.environ.get(
+    'INVENTORY_MAPPINGS', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'name_mappings.json'))
+
+# Suggestions scoring below this Dice similarity are not proposed
+MIN_SCORE = 0.5
+
+RECONCILE_COLUMNS = ['Name', 'Suggested Match', 'Score', 'Accept']
+
+
+def ngrams(text, n=3):
+    # Character n-grams of the lower-cased name, padded so short names still produce grams
+    padded = f'{" " * (n - 1)}{text.lower()} '
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+########################################################################################################
+##########################                    N-GRAM INDEX              ################################
+########################################################################################################
+
+class NameMatcher:
+    def __init__(self, names, n=3):
+        self.n = n
+        self.names = np.asarray(list(names), dtype=object)
+
+        # Inverted index: n-gram -> catalog rows containing it
+        postings = defaultdict(list)
+        self.sizes = np.empty(len(self.names), dtype=np.float64)
+        for row, name in enumerate(self.names):
+            grams = ngrams(name, n)
+            self.sizes[row] = len(grams)
+            for gram in grams:
+                postings[gram].append(row)
+        self.postings = {gram: np.array(rows, dtype=np.int32) for gram, rows in postings.items()}
+
+    def best_match(self, query):
+        grams = ngrams(query, self.n)
+        hits = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not hits:
+            return None, 0.0
+
+        # Shared n-gram counts against every candidate at once, scored with the Dice coefficient
+        shared = np.bincount(np.concatenate(hits), minlength=len(self.names))
+        scores = 2.0 * shared / (len(grams) + self.sizes)
+        row = int(np.argmax(scores))
+        return self.names[row], float(scores[row])
+
+    def best_matches(self, queries, min_score=MIN_SCORE):
+        matches = []
+        for query in queries:
+            match, score = self.best_match(query)
+            if score < min_score:
+                match = None
+            matches.append((query, match, round(score, 3)))
+        return pd.DataFrame(matches, columns=['Name', 'Suggested Match', 'Score'])
+
+
+# One matcher per catalog object, dropped together with the catalog it indexes
+_matchers = weakref.WeakKeyDictionary()
+_matchers_lock = threading.Lock()
+
+
+def get_matcher(catalog):
+    with _matchers_lock:
+        matcher = _matchers.get(catalog)
+        if matcher is None:
+            matcher = NameMatcher(catalog.names)
+            _matchers[catalog] = matcher
+    return matcher
+
+
+########################################################################################################
+##########################                    ACCEPTED MAPPINGS         ################################
+########################################################################################################
+
+class MappingStore:
+    def __init__(self, path=DEFAULT_MAPPINGS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mappings = None
+
+    def mappings(self):
+        with self._lock:
+            if self._mappings is None:
+                self._mappings = self._read()
+            return dict(self._mappings)
+
+    def accept(self, pairs):
+        # pairs: iterable of (export name, catalog name)
+        with self._lock:
+            if self._mappings is None:
+                self._mappings = self._read()
+            self._mappings.update(pairs)
+            self._write(self._mappings)
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding='utf-8') as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, mappings):
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump(mappings, handle, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+# Shared by every session so one manager's accepted matches help the next upload
+mapping_store = MappingStore()
+
+
+########################################################################################################
+##########################                    RECONCILIATION            ################################
+########################################################################################################
+
+def apply_mappings(df, mappings):
+    # Rename export names to their accepted catalog names; only the Name column is rebuilt
+    if not mappings:
+        return df
+    names = df['Name']
+    if isinstance(names.dtype, pd.CategoricalDtype):
+        # Rename the categories rather than every row; names mapped together share one category
+        categories = names.cat.categories.to_series(index=None)
+        mapped = categories.map(mappings)
+        if mapped.isna().all():
+            return df
+        codes = names.cat.codes.to_numpy()
+        renamed = mapped.fillna(categories).to_numpy(dtype=object)[codes]
+        renamed[codes < 0] = None
+        df = df.copy(deep=False)
+        df['Name'] = pd.Categorical(renamed)
+        return df
+
+    mapped = names.map(mappings)
+    if mapped.isna().all():
+        return df
+    df = df.copy(deep=False)
+    df['Name'] = mapped.fillna(names)
+    return df
+
+
+def reconcile_names(df, catalog, mappings=None, min_score=MIN_SCORE):
+    # Unmatched stocktake names with the most likely catalog item for each
+    if mappings is None:
+        mappings = {}
+    names = pd.unique(df['Name'].astype(str))
+    unmatched = [name for name in names if name not in catalog.by_normalized and name not in mappings]
+
+    proposals = get_matcher(catalog).best_matches(unmatched, min_score=min_score)
+    proposals['Accept'] = False
+    return proposals[RECONCILE_COLUMNS]
+
+
+def missing_from_stocktake(df, catalog):
+    present = set(df['Name'].astype(str))
+    return [name for name in catalog.names if name not in present]
@@ -0,0 +1,147 @@
+# recount.py
+#
+# Corrected stocktakes are often uploaded minutes after the first one. Instead of recomputing
+# everything, the new upload is joined to the previous one by Name and only the rows whose
+# 'Close Qty' or 'Diff Cost' changed are re-banded and re-ordered.
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import get_logger
+from reorder import compute_reorder, patch_reorder
+from variance import DEFAULT_THRESHOLDS, VarianceBands, check_thresholds
+
+logger = get_logger('recount')
+
+# Columns that feed the variance bands and the order quantities
+RECOUNT_COLUMNS = ['Close Qty', 'Diff Cost']
+
+# Past this share of changed rows a full recompute is as cheap as patching
+MAX_CHANGED_RATIO = 0.25
+
+
+########################################################################################################
+##########################                    DIFF                      ################################
+########################################################################################################
+
+def row_keys(names):
+    # Join keys: the name plus its occurrence number, so an export that repeats a name still matches row for row
+    names = pd.Series(names.to_numpy(dtype=object))
+    return pd.MultiIndex.from_arrays([names, names.groupby(names, sort=False).cumcount()])
+
+
+def match_rows(previous_names, current_names):
+    # Row of the previous upload for every current row, -1 for rows that are new
+    if previous_names.equals(current_names):
+        # Same layout, the usual case for a corrected export: no join needed
+        return np.arange(len(current_names), dtype=np.intp)
+    return row_keys(previous_names).get_indexer(row_keys(current_names))
+
+
+def recount_values(df, column):
+    if column not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+class StocktakeDiff:
+    def __init__(self, previous, current, columns=RECOUNT_COLUMNS):
+        self.matched = match_rows(previous['Name'], current['Name'])
+
+        # New rows, plus carried rows where any recount column differs (<NA> equals <NA>)
+        changed = self.matched < 0
+        carried = np.flatnonzero(~changed)
+        for column in columns:
+            before = recount_values(previous, column)[self.matched[carried]]
+            after = recount_values(current, column)[carried]
+            same = (before == after) | (np.isnan(before) & np.isnan(after))
+            changed[carried[~same]] = True
+        self.changed = np.flatnonzero(changed)
+
+        seen = np.zeros(len(previous), dtype=bool)
+        seen[self.matched[self.matched >= 0]] = True
+        self.removed = np.flatnonzero(~seen)
+
+        # Items whose order line may differ: names on changed rows and on rows that disappeared
+        self.names = pd.unique(np.concatenate([
+            current['Name'].take(self.changed).to_numpy(dtype=object),
+            previous['Name'].take(self.removed).to_numpy(dtype=object),
+        ]))
+
+    def __len__(self):
+        return len(self.changed) + len(self.removed)
+
+
+########################################################################################################
+##########################                    SESSION STATE             ################################
+########################################################################################################
+
+def same_par_table(left, right):
+    return left is right or (left is not None and right is not None and left.equals(right))
+
+
+class RecountSession:
+    # Derived results of the last upload in one session. When a different upload arrives it is diffed
+    # against the previous one, and bands and orders are patched from the previous results.
+    def __init__(self, incremental=True, max_changed_ratio=MAX_CHANGED_RATIO):
+        self.incremental = incremental
+        self.max_changed_ratio = max_changed_ratio
+        self.df = None
+        self.key = None
+        self.diff = None
+        self._bands = {}
+        self._orders = None
+        self._previous = None
+
+    def load(self, df, key):
+        # key identifies the upload and whatever renamed its rows (e.g. accepted name mappings)
+        if key == self.key:
+            return self.df
+
+        self.diff = None
+        if self.incremental and self.df is not None:
+            diff = StocktakeDiff(self.df, df)
+            if len(diff) <= self.max_changed_ratio * max(len(df), 1):
+                self.diff = diff
+            logger.debug('recount diff', extra={'rows': len(df), 'changed': len(diff.changed),
+                                                'removed': len(diff.removed), 'patched': self.diff is not None})
+
+        self._previous = (self._bands, self._orders) if self.diff is not None else None
+        self.df, self.key = df, key
+        self._bands, self._orders = {}, None
+        return df
+
+    def bands(self, thresholds=DEFAULT_THRESHOLDS):
+        bands = self._bands.get(tuple(check_thresholds(thresholds)))
+        if bands is None:
+            bands = self.store_bands(thresholds, self.compute_bands(thresholds))
+        return bands
+
+    def compute_bands(self, thresholds=DEFAULT_THRESHOLDS):
+        # Patched from the previous upload's bands when possible; leaves the session unchanged, so it can
+        # run inside a shared cache and the result be stored with store_bands wherever it came from
+        thresholds = tuple(check_thresholds(thresholds))
+        previous = self._previous[0].get(thresholds) if self._previous else None
+        if previous is not None:
+            return previous.patched(self.df, self.diff.matched, self.diff.changed)
+        return VarianceBands(self.df, thresholds)
+
+    def store_bands(self, thresholds, bands):
+        # Bands of the current upload, kept so the next recount can be patched from them
+        self._bands[tuple(check_thresholds(thresholds))] = bands
+        return bands
+
+    def orders(self, par_table):
+        if self._orders is not None and same_par_table(self._orders[0], par_table):
+            return self._orders[1]
+        return self.store_orders(par_table, self.compute_orders(par_table))
+
+    def compute_orders(self, par_table):
+        previous = self._previous[1] if self._previous else None
+        if previous is not None and same_par_table(previous[0], par_table):
+            return patch_reorder(previous[1], self.df, self.diff.names, par_table)
+        return compute_reorder(self.df, None, par_table=par_table)
+
+    def store_orders(self, par_table, orders):
+        self._orders = (par_table, orders)
+        return orders
@@ -0,0 +1,104 @@
+# reorder.py
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import get_logger
+from packs import order_multiples, parse_pack_sizes, round_up
+
+logger = get_logger('reorder')
+
+# Columns of the order tables shown per supplier
+ORDER_COLUMNS = ['Item', 'Quantity Needed', 'Supplier']
+
+
+########################################################################################################
+##########################                   PAR LEVEL TABLE            ################################
+########################################################################################################
+
+def build_par_table(items_info):
+    # Flatten the catalog dict into one frame, keeping the catalog order
+    par_table = pd.DataFrame.from_dict(items_info, orient='index', columns=['par_level', 'supplier'])
+    par_table.index.name = 'Item'
+    par_table = par_table.reset_index()
+
+    # Skip items with missing par_level or supplier, as the per-item loop did
+    par_table['par_level'] = pd.to_numeric(par_table['par_level'], errors='coerce')
+    par_table = par_table.dropna(subset=['par_level', 'supplier'])
+
+    # Whole cases, kegs or units per supplier, from the pack sizes in the names
+    par_table['case_size'] = order_multiples(parse_pack_sizes(par_table['Item'])['case_size'], par_table['supplier'])
+    return par_table
+
+
+########################################################################################################
+##########################                   REORDER ENGINE             ################################
+########################################################################################################
+
+def compute_reorder(df, items_info, par_table=None):
+    if par_table is None:
+        par_table = build_par_table(items_info)
+
+    if df is None or df.empty or par_table.empty:
+        return pd.DataFrame(columns=ORDER_COLUMNS)
+
+    # Only the first row per name counts, matching the old iloc[0] lookup.
+    # to_numeric accepts NumPy scalars too, so int64 quantities are no longer skipped.
+    stock = df[['Name', 'Close Qty']].drop_duplicates(subset='Name', keep='first')
+    close_qty = pd.to_numeric(stock['Close Qty'], errors='coerce')
+    stock = pd.DataFrame({'Item': stock['Name'].to_numpy(dtype=object),
+                          'Close Qty': close_qty.to_numpy(dtype=np.float64, na_value=np.nan)})
+
+    # One hash join of the catalog against the stocktake, in catalog order
+    merged = par_table.merge(stock, on='Item', how='inner')
+    matched = len(merged)
+    merged = merged[merged['Close Qty'].notna() & (merged['Close Qty'] < merged['par_level'])]
+    logger.debug('reorder computed', extra={'catalog_items': len(par_table), 'matched': matched,
+                                            'to_order': len(merged)})
+
+    # Round up to what the supplier actually sells (whole cases, kegs or bottles) when the par table says so
+    needed = (merged['par_level'] - merged['Close Qty']).to_numpy()
+    if 'case_size' in merged.columns:
+        needed = round_up(needed, merged['case_size'].to_numpy(dtype=np.float64))
+
+    return pd.DataFrame({
+        'Item': merged['Item'].to_numpy(),
+        'Quantity Needed': needed,
+        'Supplier': merged['supplier'].to_numpy(),
+    }, columns=ORDER_COLUMNS)
+
+
+def patch_reorder(orders, df, names, par_table):
+    # Recompute the order lines of `names` only and splice them into an existing order table,
+    # keeping the catalog order compute_reorder produces
+    if len(names) == 0:
+        return orders
+    names = pd.Index(names)
+    subset = df[df['Name'].isin(names)]
+    updated = compute_reorder(subset, None, par_table=par_table)
+    kept = orders[~orders['Item'].isin(names)]
+
+    patched = pd.concat([kept, updated], ignore_index=True)
+    position = pd.Index(par_table['Item']).get_indexer(patched['Item'])
+    patched = patched.take(np.argsort(position, kind='stable')).reset_index(drop=True)
+    logger.debug('reorder patched', extra={'names': len(names), 'to_order': len(patched)})
+    return patched
+
+
+def group_orders_by_supplier(orders, suppliers):
+    # Split the single order table per supplier; suppliers with nothing to order get an empty table
+    grouped = {supplier: orders.iloc[0:0] for supplier in suppliers}
+    for supplier, supplier_orders in orders.groupby('Supplier', sort=False):
+        grouped[supplier] = supplier_orders.reset_index(drop=True)
+    return grouped
+
+
+def orders_by_supplier(df, par_table, suppliers):
+    orders = compute_reorder(df, None, par_table=par_table)
+    return group_orders_by_supplier(orders, suppliers)
+
+
+def reorder_by_supplier(df, items_info):
+    # Keep every supplier from the catalog, in first-seen order
+    suppliers = list(dict.fromkeys(info.get('supplier') for info in items_info.values()))
+    return orders_by_supplier(df, build_par_table(items_info), [s for s in suppliers if s is not None])
@@ -0,0 +1,143 @@
+# result_cache.py
+#
+# Derived results (variance bands and table, orders, name reconciliation) shared by every session
+# in the process, so several managers opening the same morning's file cost one computation.
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import get_logger
+from upload_cache import frame_nbytes
+
+logger = get_logger('result_cache')
+
+DEFAULT_RESULT_BYTES = int(os.environ.get('INVENTORY_RESULT_CACHE_BYTES', 256 * 1024 * 1024))
+
+# Every caller gets its own shallow copy of a cached frame (see handout). Under copy-on-write, writing
+# to that copy, in place or not, copies the data it touches, so the cached frame never changes;
+# pandas 3 always works this way.
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+
+def freeze(value):
+    # Read-only containers around the cached frames, so no session can swap out a shared entry
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def handout(value):
+    # Shallow copies are cheap: they share the cached data until someone writes to them
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, MappingProxyType):
+        return MappingProxyType({key: handout(item) for key, item in value.items()})
+    if isinstance(value, tuple):
+        return tuple(handout(item) for item in value)
+    return value
+
+
+def result_nbytes(value):
+    if isinstance(value, pd.DataFrame):
+        return frame_nbytes(value)
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, (dict, MappingProxyType)):
+        return sum(result_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(result_nbytes(item) for item in value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    # Result objects such as VarianceBands: their arrays and the frame they point into, which the cache
+    # keeps alive as long as the object
+    parts = [item for item in getattr(value, '__dict__', {}).values()
+             if isinstance(item, (np.ndarray, pd.DataFrame, pd.Series))]
+    return sys.getsizeof(value) + sum(result_nbytes(item) for item in parts)
+
+
+class ResultCache:
+    def __init__(self, max_bytes=DEFAULT_RESULT_BYTES):
+        self.max_bytes = max_bytes
+
+        # (upload id, catalog version, artifact) -> (value, nbytes), least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # Keys being computed right now, so concurrent sessions wait instead of repeating the work
+        self._pending = {}
+        self._catalog_version = None
+        self._lock = threading.Lock()
+
+        self.stats = {'hits': 0, 'misses': 0, 'waits': 0, 'evictions': 0}
+
+    def get_or_compute(self, upload_id, catalog_version, artifact, compute):
+        # artifact names the result and everything else it depends on, e.g. ('orders', mappings, par table)
+        key = (upload_id, catalog_version, artifact)
+        while True:
+            with self._lock:
+                if catalog_version != self._catalog_version:
+                    self._invalidate(catalog_version)
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return handout(entry[0])
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    self.stats['misses'] += 1
+                    break
+                self.stats['waits'] += 1
+            # Another session is computing this result; if it fails, the next pass computes it here
+            pending.wait()
+
+        try:
+            value = freeze(compute())
+            nbytes = result_nbytes(value)
+            with self._lock:
+                if nbytes <= self.max_bytes and catalog_version == self._catalog_version:
+                    self._entries[key] = (value, nbytes)
+                    self._bytes += nbytes
+                    self._evict()
+            logger.debug('result computed', extra={'artifact': str(artifact[0]), 'bytes': nbytes})
+            return handout(value)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            pending.set()
+
+    def hit_counts(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self._bytes)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _invalidate(self, catalog_version):
+        # A new catalog version makes every result built from the old one stale
+        stale = [key for key in self._entries if key[1] != catalog_version]
+        for key in stale:
+            self._bytes -= self._entries.pop(key)[1]
+        if stale:
+            logger.info('result cache invalidated', extra={'catalog_version': catalog_version, 'dropped': len(stale)})
+        self._catalog_version = catalog_version
+
+    def _evict(self):
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_bytes) = self._entries.popitem(last=False)
+            self._bytes -= evicted_bytes
+            self.stats['evictions'] += 1
+
+
+# Shared by every Streamlit session in the process
+result_cache = ResultCache()
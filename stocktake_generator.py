@@ -0,0 +1,174 @@
+# stocktake_generator.py
+#
+# Synthetic stocktake exports in the layout load_and_filter_excel expects:
+# 'Products - <category>' section headers, item rows and a 'SUBTOTAL (this section)' row per section.
+#
+#     python stocktake_generator.py stocktake.xlsx --rows 100000 --seed 1
+
+import argparse
+import hashlib
+import os
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+# Column order of the export; 'Unit' is never read by the app and checks column pruning
+EXPORT_COLUMNS = ['Name', 'Unit', 'Open Val', 'Req', 'Usage Qty', 'Wastage Qty', 'Close Qty', 'Close Val',
+                  'Diff Qty Last', 'Diff Weight AVG', 'Diff Cost']
+
+CATEGORIES = ['Spirits', 'Liqueurs', 'Beer', 'Cider', 'Wine', 'Soft Drinks', 'Mixers', 'Bar Supplies']
+SIZES_ML = [175, 200, 275, 330, 440, 500, 700, 750, 1000]
+
+# Generated workbooks and benchmark baselines, next to this file whatever the working directory
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.benchmarks')
+
+SECTION_PREFIX = 'Products - '
+SUBTOTAL_NAME = 'SUBTOTAL (this section)'
+
+
+def synthetic_names(rng, n):
+    # Names shaped like the real catalog, e.g. 'GIN - Brand 123 700ML (1 x 700ML)'
+    categories = rng.choice(['GIN', 'RUM', 'VODKA', 'LIQUEUR', 'Ale', 'Lager', 'Juice', 'Cordial'], n)
+    sizes = rng.choice(SIZES_ML, n)
+    brands = rng.integers(0, max(n, 1000), n)
+    styles = rng.random(n) < 0.5
+    return np.array([
+        f'{category} - Brand {brand} {size}ML (1 x {size}ML)' if style else f'{category} - Brand {brand} {size}ML, {size}ML'
+        for category, brand, size, style in zip(categories, brands, sizes, styles)
+    ], dtype=object)
+
+
+def messy(rng, names, ratio=0.05):
+    # Stray whitespace the loader has to clean up
+    names = names.copy()
+    picked = np.flatnonzero(rng.random(len(names)) < ratio)
+    for row in picked:
+        names[row] = f'  {names[row].replace(" ", "  ", 1)}\t'
+    return names
+
+
+########################################################################################################
+##########################                    GENERATOR                 ################################
+########################################################################################################
+
+def generate_stocktake(n_rows, seed=0, names=None, match_ratio=0.5, bad_qty_ratio=0.002):
+    # n_rows item rows, split into sections with a header and a subtotal row each.
+    # match_ratio of the items reuse `names` (e.g. the catalog) so reorder and reconciliation have work to do.
+    rng = np.random.default_rng(seed)
+
+    item_names = synthetic_names(rng, n_rows)
+    if names is not None and len(names):
+        reuse = rng.random(n_rows) < match_ratio
+        item_names[reuse] = rng.choice(np.asarray(names, dtype=object), int(reuse.sum()))
+    item_names = messy(rng, item_names)
+
+    close_qty = np.round(rng.gamma(2.0, 6.0, n_rows), 2)
+    unit_cost = np.round(rng.uniform(0.5, 40.0, n_rows), 2)
+    usage = np.round(rng.gamma(1.5, 4.0, n_rows), 2)
+    wastage = np.where(rng.random(n_rows) < 0.15, np.round(rng.gamma(1.0, 0.5, n_rows), 2), 0.0)
+    diff_qty = np.round(rng.standard_t(3, n_rows) * 0.8, 2)
+    open_qty = close_qty + usage + wastage - diff_qty
+
+    items = pd.DataFrame({
+        'Name': item_names,
+        'Unit': rng.choice(['BTL', 'CAN', 'KEG', 'EACH'], n_rows),
+        'Open Val': np.round(open_qty * unit_cost, 2),
+        'Req': rng.integers(0, 24, n_rows).astype(np.float64),
+        'Usage Qty': usage,
+        'Wastage Qty': wastage,
+        'Close Qty': close_qty.astype(object),
+        'Close Val': np.round(close_qty * unit_cost, 2),
+        'Diff Qty Last': np.round(rng.standard_t(3, n_rows) * 0.8, 2),
+        'Diff Weight AVG': np.round(rng.normal(0, 0.05, n_rows), 3),
+        'Diff Cost': np.round(diff_qty * unit_cost, 2),
+    }, columns=EXPORT_COLUMNS)
+
+    # A few uncountable lines the loader must drop
+    bad = np.flatnonzero(rng.random(n_rows) < bad_qty_ratio)
+    items.iloc[bad, items.columns.get_loc('Close Qty')] = rng.choice(['', 'n/a', 'TBC'], len(bad))
+
+    # Section sizes, then interleave header and subtotal rows around each block of items
+    sizes = []
+    while sum(sizes) < n_rows:
+        sizes.append(int(rng.integers(50, 300)))
+    sizes[-1] -= sum(sizes) - n_rows
+    sizes = [size for size in sizes if size > 0]
+
+    blocks = []
+    start = 0
+    numeric = ['Open Val', 'Usage Qty', 'Wastage Qty', 'Close Val', 'Diff Cost']
+    for section, size in enumerate(sizes):
+        block = items.iloc[start:start + size]
+        start += size
+        header = dict.fromkeys(EXPORT_COLUMNS)
+        header['Name'] = f'{SECTION_PREFIX}{CATEGORIES[section % len(CATEGORIES)]}'
+        subtotal = dict.fromkeys(EXPORT_COLUMNS)
+        subtotal['Name'] = SUBTOTAL_NAME
+        subtotal['Close Qty'] = float(pd.to_numeric(block['Close Qty'], errors='coerce').sum())
+        for column in numeric:
+            subtotal[column] = round(float(block[column].sum()), 2)
+        blocks.extend([pd.DataFrame([header], columns=EXPORT_COLUMNS), block,
+                       pd.DataFrame([subtotal], columns=EXPORT_COLUMNS)])
+
+    return pd.concat(blocks, ignore_index=True)
+
+
+########################################################################################################
+##########################                    WRITER                    ################################
+########################################################################################################
+
+def write_stocktake(df, target):
+    # Streaming .xlsx writer (openpyxl write-only mode), so 1M-row workbooks do not build a sheet in memory
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Stocktake')
+    sheet.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        sheet.append([None if value is None or value != value else value for value in row])
+    workbook.save(target)
+
+
+def stocktake_bytes(n_rows, seed=0, names=None, **kwargs):
+    buffer = BytesIO()
+    write_stocktake(generate_stocktake(n_rows, seed=seed, names=names, **kwargs), buffer)
+    return buffer.getvalue()
+
+
+def names_digest(names):
+    # Names are part of the cache key: another catalog of the same size must not reuse a workbook
+    if names is None:
+        return 'synthetic'
+    return hashlib.sha256('\n'.join(str(name) for name in names).encode('utf-8')).hexdigest()[:16]
+
+
+def cached_stocktake_bytes(n_rows, seed=0, names=None, cache_dir=BENCHMARK_DIR):
+    # Large workbooks are slow to write, so keep them between benchmark runs
+    path = os.path.join(cache_dir, f'stocktake_{n_rows}_{seed}_{names_digest(names)}.xlsx')
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(path + '.tmp', 'wb') as handle:
+            handle.write(stocktake_bytes(n_rows, seed=seed, names=names))
+        os.replace(path + '.tmp', path)
+    with open(path, 'rb') as handle:
+        return handle.read()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a synthetic stocktake export.')
+    parser.add_argument('output', help='.xlsx file to write')
+    parser.add_argument('--rows', type=int, default=1000, help='number of item rows')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-catalog', action='store_true', help='do not reuse catalog names')
+    args = parser.parse_args(argv)
+
+    names = None
+    if not args.no_catalog:
+        from catalog import get_catalog
+        names = get_catalog().names
+    write_stocktake(generate_stocktake(args.rows, seed=args.seed, names=names), args.output)
+
+
+if __name__ == '__main__':
+    main()
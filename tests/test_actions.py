@@ -0,0 +1,69 @@
+# test_actions.py
+
+import numpy as np
+import pandas as pd
+
+from actions import apply_actions, group_by_action, record_actions
+
+
+def shown(names, actions=None):
+    return apply_actions(pd.DataFrame({'Name': pd.Series(names, dtype='category'),
+                                       'Diff Cost': np.arange(len(names), dtype=np.float64)}), actions or {})
+
+
+def test_unchanged_grid_records_nothing():
+    actions = {'a': 'Recount'}
+    page = shown(['a', 'b', 'c'], actions)
+    assert record_actions(actions, page, page.copy()) == 0
+    assert actions == {'a': 'Recount'}
+
+
+def test_sorted_grid_keeps_actions_on_their_items():
+    actions = {'a': 'Recount'}
+    page = shown(['a', 'b', 'c'], actions)
+    grid = page.iloc[::-1].reset_index(drop=True)
+    assert record_actions(actions, page, grid) == 0
+    assert actions == {'a': 'Recount'}
+
+
+def test_filtered_grid_records_edits_by_name():
+    actions = {'a': 'Recount'}
+    page = shown(['a', 'b', 'c', 'd'], actions)
+    grid = page[page['Name'].isin(['c', 'a'])].iloc[::-1].reset_index(drop=True)
+    grid.loc[grid['Name'] == 'c', 'Action'] = 'Wastage'
+    grid.loc[grid['Name'] == 'a', 'Action'] = ''
+    assert record_actions(actions, page, grid) == 2
+    assert actions == {'c': 'Wastage'}
+
+
+def test_edit_on_one_of_repeated_rows_wins():
+    actions = {}
+    page = shown(['a', 'b', 'a'], actions)
+    grid = page.copy()
+    grid.iloc[2, grid.columns.get_loc('Action')] = ' Transfer '
+    assert record_actions(actions, page, grid) == 1
+    assert actions == {'a': 'Transfer'}
+
+
+def test_spacer_rows_are_ignored():
+    page = pd.concat([shown(['a']), shown(['a']).iloc[:0].reindex(range(2))], ignore_index=True)
+    page['Action'] = page['Action'].fillna('')
+    grid = page.copy()
+    grid['Action'] = 'Recount'
+    actions = {}
+    assert record_actions(actions, page, grid) == 1
+    assert actions == {'a': 'Recount'}
+
+
+def test_empty_grid_result():
+    actions = {'a': 'Recount'}
+    assert record_actions(actions, shown(['a']), None) == 0
+    assert record_actions(actions, shown(['a']), shown([])) == 0
+    assert actions == {'a': 'Recount'}
+
+
+def test_group_by_action_splits_in_first_seen_order():
+    page = shown(['a', 'b', 'c'], {'b': 'Recount', 'c': 'Wastage'})
+    groups = group_by_action(page)
+    assert [action for action, _ in groups] == ['', 'Recount', 'Wastage']
+    assert list(groups[1][1]['Name']) == ['b']
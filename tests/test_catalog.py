@@ -0,0 +1,92 @@
+# test_catalog.py
+
+import os
+import sqlite3
+
+import numpy as np
+
+from catalog import SQLITE_TABLE, Catalog, get_catalog, read_catalog_records
+
+RECORDS = [
+    ('Fever-Tree - Tonic  24 x 200ML (1 x 200ML)', '2', 'Amathus'),
+    ('GIN - Tanqueray 70CL, 700ML', '3', 'Amathus'),
+    (' Bar - Lemons ', '10', ''),
+    ('Ale - Neck Oil - 30L, 1LT', 'n/a', 'Biercraft'),
+    # Same item once whitespace is collapsed: keeps the first position and the last values
+    ('GIN -  Tanqueray 70CL,  700ML', '4', 'Biercraft'),
+]
+
+
+def test_repeated_names_are_merged_and_reported():
+    catalog = Catalog(RECORDS)
+
+    assert len(catalog) == 4
+    assert catalog.duplicates == ['GIN - Tanqueray 70CL, 700ML']
+    assert list(catalog.names) == ['Fever-Tree - Tonic 24 x 200ML (1 x 200ML)', 'GIN - Tanqueray 70CL, 700ML',
+                                   'Bar - Lemons', 'Ale - Neck Oil - 30L, 1LT']
+    assert catalog.lookup('GIN - Tanqueray 70CL, 700ML') == {
+        'name': 'GIN - Tanqueray 70CL, 700ML', 'par_level': 4.0, 'supplier': 'Biercraft'}
+    # The first spelling is the one kept for exact lookups
+    assert catalog.raw_names[1] == 'GIN - Tanqueray 70CL, 700ML'
+
+
+def test_lookup_by_exact_or_normalized_name():
+    catalog = Catalog(RECORDS)
+
+    assert catalog.by_normalized['Bar - Lemons'] == 2
+    assert catalog.lookup(' Bar - Lemons ')['name'] == 'Bar - Lemons'
+    assert catalog.lookup('Bar -   Lemons') == {'name': 'Bar - Lemons', 'par_level': 10.0, 'supplier': None}
+    assert catalog.lookup('Fever-Tree - Tonic 24 x 200ML (1 x 200ML)')['par_level'] == 2.0
+    assert 'Ale -  Neck Oil - 30L, 1LT' in catalog
+    assert catalog.lookup('Bar - Limes') is None
+    assert 'Bar - Limes' not in catalog
+
+
+def test_par_table_keeps_items_with_a_par_and_supplier():
+    catalog = Catalog(RECORDS)
+
+    assert list(catalog.par_table['Item']) == ['Fever-Tree - Tonic 24 x 200ML (1 x 200ML)',
+                                               'GIN - Tanqueray 70CL, 700ML']
+    np.testing.assert_array_equal(catalog.par_table['par_level'], [2.0, 4.0])
+    np.testing.assert_array_equal(catalog.par_table['case_size'], [24.0, 1.0])
+    assert np.isnan(catalog.par_levels[3])
+
+
+def test_supplier_index():
+    catalog = Catalog(RECORDS)
+
+    assert catalog.suppliers == ['Amathus', 'Biercraft']
+    assert [item['name'] for item in catalog.supplier_items('Biercraft')] == ['GIN - Tanqueray 70CL, 700ML',
+                                                                              'Ale - Neck Oil - 30L, 1LT']
+    assert [item['name'] for item in catalog.supplier_items('Amathus')] == ['Fever-Tree - Tonic 24 x 200ML (1 x 200ML)']
+    assert catalog.items_info()['Bar - Lemons'] == {'par_level': 10.0, 'supplier': None}
+
+
+def test_csv_and_sqlite_sources_agree(tmp_path):
+    csv_path = tmp_path / 'catalog.csv'
+    csv_path.write_text('name,par_level,supplier\n' + ''.join(f'"{name}",{par},{supplier}\n'
+                                                              for name, par, supplier in RECORDS), encoding='utf-8')
+    db_path = tmp_path / 'catalog.db'
+    connection = sqlite3.connect(db_path)
+    connection.execute(f'CREATE TABLE {SQLITE_TABLE} (name TEXT, par_level TEXT, supplier TEXT)')
+    connection.executemany(f'INSERT INTO {SQLITE_TABLE} VALUES (?, ?, ?)', RECORDS)
+    connection.commit()
+    connection.close()
+
+    assert read_catalog_records(str(csv_path)) == RECORDS
+    assert read_catalog_records(str(db_path)) == RECORDS
+
+
+def test_shared_catalog_is_rebuilt_when_the_file_changes(tmp_path):
+    path = tmp_path / 'catalog.csv'
+    path.write_text('name,par_level,supplier\nBar - Lemons,10,\n', encoding='utf-8')
+
+    first = get_catalog(str(path))
+    assert get_catalog(str(path)) is first
+
+    path.write_text('name,par_level,supplier\nBar - Lemons,12,\nBar - Limes,6,\n', encoding='utf-8')
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    second = get_catalog(str(path))
+    assert second is not first
+    assert second.lookup('Bar - Lemons')['par_level'] == 12.0
+    assert len(second) == 2
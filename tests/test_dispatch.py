@@ -0,0 +1,185 @@
+# test_dispatch.py
+#
+# Deliveries against the local webhook and SMTP stand-ins, which run on their own event loop thread.
+
+import asyncio
+import json
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+import dispatch
+from dispatch import build_dispatcher, dispatch_orders
+from dispatch_standins import LocalSmtpServer, LocalWebhookServer
+
+
+class StandIns:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.servers = []
+
+    def start(self, server):
+        self.servers.append(server)
+        return asyncio.run_coroutine_threadsafe(server.start(), self.loop).result(5)
+
+    def close(self):
+        for server in self.servers:
+            asyncio.run_coroutine_threadsafe(server.stop(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+
+
+@pytest.fixture
+def standins():
+    standins = StandIns()
+    yield standins
+    standins.close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff_wait(monkeypatch):
+    # Record each backoff ceiling and retry at once
+    ceilings = []
+
+    def uniform(low, high):
+        ceilings.append(high)
+        return 0.0
+
+    monkeypatch.setattr(dispatch.random, 'uniform', uniform)
+    return ceilings
+
+
+def orders(*items, supplier='Biercraft'):
+    return pd.DataFrame({'Item': list(items), 'Quantity Needed': [float(i + 1) for i in range(len(items))],
+                         'Supplier': supplier})
+
+
+def config(tmp_path, suppliers, smtp_port=None):
+    transports = {'webhook': {'type': 'webhook', 'timeout': 5.0}}
+    if smtp_port is not None:
+        transports['email'] = {'type': 'smtp', 'host': '127.0.0.1', 'port': smtp_port, 'sender': 'orders@example.com'}
+    return {'defaults': {'max_attempts': 4, 'base_delay': 0.5, 'max_delay': 1.0,
+                         'log_path': str(tmp_path / 'deliveries.jsonl')},
+            'transports': transports, 'suppliers': suppliers}
+
+
+def by_supplier(records):
+    return {record['Supplier']: record for record in records}
+
+
+def test_server_errors_are_retried_with_capped_backoff(standins, tmp_path, no_backoff_wait):
+    server = standins.start(LocalWebhookServer(fail_first=3))
+    cfg = config(tmp_path, {'Biercraft': {'transport': 'webhook', 'url': server.url('/biercraft')}})
+
+    [record] = dispatch_orders({'Bar': {'Biercraft': orders('Lager', 'Stout')}}, '2024-05-01', cfg)
+
+    assert (record['Status'], record['Attempts']) == ('sent', 4)
+    assert no_backoff_wait == [0.5, 1.0, 1.0]
+    assert len(server.received) == 1
+    assert server.received[0]['key'] == record['Key']
+    assert server.received[0]['body']['items'] == [{'item': 'Lager', 'quantity': 1.0}, {'item': 'Stout', 'quantity': 2.0}]
+
+
+def test_server_errors_stop_after_max_attempts(standins, tmp_path):
+    server = standins.start(LocalWebhookServer(fail_first=10))
+    cfg = config(tmp_path, {'Biercraft': {'transport': 'webhook', 'url': server.url('/biercraft')}})
+
+    [record] = dispatch_orders({'Bar': {'Biercraft': orders('Lager')}}, '2024-05-01', cfg)
+
+    assert (record['Status'], record['Attempts']) == ('failed', 4)
+    assert record['Detail'].startswith('HTTP 503')
+    assert server.received == []
+
+
+def test_client_errors_are_not_retried(standins, tmp_path, no_backoff_wait):
+    server = standins.start(LocalWebhookServer(fail_first=10, fail_status='422 Unprocessable Entity'))
+    cfg = config(tmp_path, {'Biercraft': {'transport': 'webhook', 'url': server.url('/biercraft')}})
+
+    [record] = dispatch_orders({'Bar': {'Biercraft': orders('Lager')}}, '2024-05-01', cfg)
+
+    assert (record['Status'], record['Attempts']) == ('failed', 1)
+    assert record['Detail'].startswith('HTTP 422')
+    assert no_backoff_wait == []
+
+
+def test_refused_recipients_fail_without_retry(standins, tmp_path, no_backoff_wait):
+    smtp = standins.start(LocalSmtpServer(refuse={'nobody@example.com'}))
+    cfg = config(tmp_path, {
+        'Amathus': {'transport': 'email', 'to': ['orders@amathus.example']},
+        'Stores Supply Warehouse': {'transport': 'email', 'to': ['nobody@example.com']},
+        'Mixed': {'transport': 'email', 'to': ['orders@mixed.example', 'nobody@example.com']},
+    }, smtp_port=smtp.port)
+    site_orders = {supplier: orders('Gin', supplier=supplier) for supplier in ('Amathus', 'Stores Supply Warehouse', 'Mixed')}
+
+    records = by_supplier(dispatch_orders({'Bar': site_orders}, '2024-05-01', cfg))
+
+    assert records['Amathus']['Status'] == 'sent'
+    for supplier in ('Stores Supply Warehouse', 'Mixed'):
+        assert (records[supplier]['Status'], records[supplier]['Attempts']) == ('failed', 1)
+        assert records[supplier]['Detail'] == 'refused recipients: nobody@example.com'
+    assert no_backoff_wait == []
+    # Partly refused mail still reaches the recipients that were accepted
+    assert sorted(tuple(mail['to']) for mail in smtp.received) == [('orders@amathus.example',), ('orders@mixed.example',)]
+
+
+def test_orders_already_sent_are_skipped_unless_resent(standins, tmp_path):
+    server = standins.start(LocalWebhookServer())
+    cfg = config(tmp_path, {'Biercraft': {'transport': 'webhook', 'url': server.url('/biercraft')}})
+    site_orders = {'Bar': {'Biercraft': orders('Lager')}}
+
+    [first] = dispatch_orders(site_orders, '2024-05-01', cfg)
+    [second] = dispatch_orders(site_orders, '2024-05-01', cfg)
+    [changed] = dispatch_orders({'Bar': {'Biercraft': orders('Lager', 'Stout')}}, '2024-05-01', cfg)
+    [resent] = dispatch_orders(site_orders, '2024-05-01', cfg, resend=True)
+
+    assert first['Status'] == 'sent'
+    assert second['Status'] == 'skipped' and second['Detail'].startswith('already sent at')
+    assert changed['Status'] == 'sent' and changed['Key'] != first['Key']
+    assert resent['Status'] == 'sent' and resent['Key'] == first['Key']
+    assert len(server.received) == 3
+
+    with open(tmp_path / 'deliveries.jsonl', encoding='utf-8') as handle:
+        logged = [json.loads(line)['Status'] for line in handle]
+    assert logged == ['sent', 'skipped', 'sent', 'sent']
+
+
+def test_concurrent_dispatches_send_an_order_once(standins, tmp_path):
+    server = standins.start(LocalWebhookServer(delay=0.1))
+    cfg = config(tmp_path, {'Biercraft': {'transport': 'webhook', 'url': server.url('/biercraft')}})
+    site_orders = {'Bar': {'Biercraft': orders('Lager')}}
+    records = []
+
+    def click():
+        records.extend(dispatch_orders(site_orders, '2024-05-01', cfg))
+
+    threads = [threading.Thread(target=click) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert sorted(record['Status'] for record in records) == ['sent', 'skipped', 'skipped', 'skipped']
+    assert len(server.received) == 1
+
+
+def test_unrouted_and_empty_orders_are_skipped(tmp_path):
+    cfg = config(tmp_path, {'Biercraft': {'transport': 'webhook', 'url': 'http://127.0.0.1:9/biercraft'}})
+
+    records = by_supplier(dispatch_orders({'Bar': {'Biercraft': orders(), 'Nowhere': orders('Gin', supplier='Nowhere')}},
+                                          '2024-05-01', cfg))
+
+    assert records['Biercraft']['Detail'] == 'nothing to order'
+    assert records['Nowhere']['Detail'] == 'no route configured'
+
+
+def test_relative_log_path_is_kept_next_to_the_app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dispatcher = build_dispatcher({'defaults': {'log_path': 'deliveries.jsonl'}})
+
+    assert dispatcher.log_path == os.path.join(dispatch.BASE_DIR, 'deliveries.jsonl')
+    assert build_dispatcher({'defaults': {'log_path': str(tmp_path / 'log.jsonl')}}).log_path == str(tmp_path / 'log.jsonl')
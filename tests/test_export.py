@@ -0,0 +1,127 @@
+# test_export.py
+
+import io
+import re
+
+import pandas as pd
+import pytest
+
+from export import (EXPORT_FORMATS, ExportCache, orders_key, sheet_title, write_orders_csv, write_orders_pdf,
+                    write_orders_xlsx)
+
+
+def orders(supplier, *items):
+    return pd.DataFrame({'Item': list(items), 'Quantity Needed': [float(i) + 1.5 for i in range(len(items))],
+                         'Supplier': supplier})
+
+
+SUPPLIER_ORDERS = {
+    'Amathus': orders('Amathus', 'GIN - Tanqueray 70CL, 700ML', 'Cider - sassy 0%, 275ML'),
+    'Biercraft/Kegs': orders('Biercraft/Kegs', 'Ale - Neck Oil - 30L, 1LT'),
+    'Empty': orders('Empty'),
+}
+
+
+def written(writer, supplier_orders=SUPPLIER_ORDERS):
+    buffer = io.BytesIO()
+    writer(supplier_orders, buffer)
+    return buffer
+
+
+def test_xlsx_round_trip():
+    sheets = pd.read_excel(written(write_orders_xlsx), sheet_name=None)
+
+    assert list(sheets) == ['Amathus', 'Biercraft Kegs', 'Empty']
+    for (supplier, expected), sheet in zip(SUPPLIER_ORDERS.items(), sheets.values()):
+        assert list(sheet.columns) == ['Item', 'Quantity Needed']
+        assert sheet['Item'].tolist() == expected['Item'].tolist()
+        assert sheet['Quantity Needed'].tolist() == expected['Quantity Needed'].tolist()
+
+
+def test_csv_round_trip():
+    buffer = written(write_orders_csv)
+    assert not buffer.closed
+
+    table = pd.read_csv(io.BytesIO(buffer.getvalue()))
+    expected = pd.concat([frame for frame in SUPPLIER_ORDERS.values() if len(frame)], ignore_index=True)
+    assert list(table.columns) == ['Supplier', 'Item', 'Quantity Needed']
+    assert table['Supplier'].tolist() == expected['Supplier'].tolist()
+    assert table['Item'].tolist() == expected['Item'].tolist()
+    assert table['Quantity Needed'].tolist() == expected['Quantity Needed'].tolist()
+
+
+def pdf_objects(data):
+    # Check the cross-reference table points at every object, then return the page and text commands
+    xref_at = int(re.search(rb'startxref\n(\d+)\n%%EOF\n$', data).group(1))
+    assert data[xref_at:].startswith(b'xref\n')
+    count = int(re.match(rb'xref\n0 (\d+)\n', data[xref_at:]).group(1))
+    offsets = [int(offset) for offset in re.findall(rb'(\d{10}) 00000 n', data[xref_at:])]
+    assert len(offsets) == count - 1
+    for number, offset in enumerate(offsets, start=1):
+        assert data[offset:].startswith(f'{number} 0 obj\n'.encode())
+    pages = int(re.search(rb'/Type /Pages /Kids \[[^\]]*\] /Count (\d+)', data).group(1))
+    return pages, re.findall(rb'\(((?:[^()\\]|\\.)*)\) Tj', data)
+
+
+def test_pdf_round_trip():
+    data = written(write_orders_pdf).getvalue()
+    assert data.startswith(b'%PDF-1.4')
+
+    pages, text = pdf_objects(data)
+    assert pages == 3
+    assert b'Order list - Amathus' in text
+    assert b'Cider - sassy 0%, 275ML' in text
+    assert b'2.5' in text
+    assert b'Nothing to order' in text
+
+
+def test_long_pdf_orders_span_pages():
+    items = [f'Item {i}' for i in range(120)]
+    pages, text = pdf_objects(written(write_orders_pdf, {'Amathus': orders('Amathus', *items)}).getvalue())
+
+    assert pages > 1
+    assert [line for line in text if line.startswith(b'Item ')] == [item.encode() for item in items]
+
+
+@pytest.mark.parametrize('file_format', sorted(EXPORT_FORMATS))
+def test_no_orders_still_make_a_file(file_format):
+    writer, _ = EXPORT_FORMATS[file_format]
+    assert len(written(writer, {}).getvalue()) > 0
+
+
+def test_sheet_titles_are_valid_and_unique():
+    used = set()
+    titles = [sheet_title(name, used) for name in ['A' * 40, 'A' * 40, 'a:b', '[]', 'A:B']]
+    assert titles == ['A' * 31, 'A' * 28 + ' 2', 'a b', 'Supplier', 'A B 2']
+
+
+def test_orders_key_follows_content():
+    same = {supplier: frame.copy() for supplier, frame in SUPPLIER_ORDERS.items()}
+    changed = dict(SUPPLIER_ORDERS, Amathus=orders('Amathus', 'GIN - Tanqueray 70CL, 700ML'))
+
+    assert orders_key(same) == orders_key(SUPPLIER_ORDERS)
+    assert orders_key(changed) != orders_key(SUPPLIER_ORDERS)
+
+
+def test_export_cache_builds_each_download_once(monkeypatch):
+    calls = []
+    writer, mime = EXPORT_FORMATS['csv']
+    monkeypatch.setitem(EXPORT_FORMATS, 'csv', (lambda *args: calls.append(1) or writer(*args), mime))
+    cache = ExportCache()
+
+    first = cache.get_or_build(SUPPLIER_ORDERS, 'csv')
+    assert cache.get_or_build(dict(SUPPLIER_ORDERS), 'csv') is first
+    assert len(calls) == 1
+    assert first == written(writer).getvalue()
+
+
+def test_export_cache_evicts_the_oldest_download():
+    cache = ExportCache(max_bytes=len(written(write_orders_csv).getvalue()) * 2)
+    for key in ('one', 'two', 'three'):
+        cache.get_or_build(SUPPLIER_ORDERS, 'csv', key=key)
+
+    assert list(cache._entries) == [('two', 'csv'), ('three', 'csv')]
+    assert cache._bytes <= cache.max_bytes
+    # An evicted download is built again from the orders it is asked for
+    other = {'Amathus': orders('Amathus', 'Bar - Lemons')}
+    assert cache.get_or_build(other, 'csv', key='one') == written(write_orders_csv, other).getvalue()
@@ -0,0 +1,111 @@
+# test_history.py
+
+import os
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from history import HistoryStore, count_date_value, count_snapshot, partition_value
+
+
+def stocktake(diff_cost, names=('a', 'b', 'c')):
+    return pd.DataFrame({'Name': pd.Series(names, dtype='category'),
+                         'Close Qty': pd.array(np.ones(len(names)), dtype='Float32'),
+                         'Diff Cost': pd.array(diff_cost, dtype='Float32'),
+                         'Usage Qty': pd.array(np.full(len(names), 2.0), dtype='Float32')})
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path), window=3)
+
+
+def test_count_dates_are_iso():
+    assert count_date_value('2024-01-05') == '2024-01-05'
+    assert count_date_value(date(2024, 1, 5)) == '2024-01-05'
+    assert count_date_value(datetime(2024, 1, 5, 18, 30)) == '2024-01-05'
+    assert count_date_value(None) == date.today().isoformat()
+    for bad in ('2024/01/05', '05-01-2024', '../2024-01-05'):
+        with pytest.raises(ValueError):
+            count_date_value(bad)
+
+
+def test_partition_values_are_safe_directory_names():
+    assert partition_value('Soho / Upstairs') == 'Soho_Upstairs'
+    assert partition_value('../etc') == '.._etc'
+    assert partition_value('') == 'default'
+
+
+def test_snapshot_sums_repeated_names():
+    snapshot = count_snapshot(stocktake([1.0, 2.0, None], names=('a', 'a', 'b')))
+    assert list(snapshot['Name']) == ['a', 'b']
+    assert list(snapshot['Diff Cost'][:1]) == [3.0] and np.isnan(snapshot['Diff Cost'][1])
+
+
+def test_same_upload_is_stored_once(store, tmp_path):
+    df = stocktake([1.0, -2.0, 3.0])
+    assert store.append(df, 'Soho', '2024-01-05')
+    assert not store.append(df, 'Soho', date(2024, 1, 5))
+    assert os.listdir(tmp_path / 'counts' / 'site=Soho') == ['count_date=2024-01-05']
+    assert list(store.aggregates('Soho')['Counts']) == [1, 1, 1]
+
+
+def test_bad_count_date_writes_nothing(store, tmp_path):
+    with pytest.raises(ValueError):
+        store.append(stocktake([1.0, 2.0, 3.0]), 'Soho', '2024/01/05')
+    assert not os.path.exists(tmp_path / 'counts')
+
+
+def test_recount_replaces_the_earlier_upload(store):
+    store.append(stocktake([1.0, 2.0, 3.0]), 'Soho', '2024-01-05')
+    store.append(stocktake([10.0, 20.0, 30.0]), 'Soho', '2024-01-05')
+    history = store.load(site='Soho')
+    assert sorted(history['Diff Cost']) == [10.0, 20.0, 30.0]
+    assert list(store.aggregates('Soho')['Total Diff Cost']) == [10.0, 20.0, 30.0]
+
+
+def test_back_filled_counts_give_the_same_aggregates(tmp_path):
+    counts = {f'2024-01-0{day}': stocktake(np.arange(3.0) * day) for day in range(1, 6)}
+    in_order = HistoryStore(str(tmp_path / 'in_order'), window=3)
+    for count_date in sorted(counts):
+        in_order.append(counts[count_date], 'Soho', count_date)
+    back_filled = HistoryStore(str(tmp_path / 'back_filled'), window=3)
+    for count_date in ['2024-01-03', '2024-01-05', '2024-01-01', '2024-01-04', '2024-01-02']:
+        back_filled.append(counts[count_date], 'Soho', count_date)
+    pd.testing.assert_frame_equal(in_order.aggregates('Soho'), back_filled.aggregates('Soho'))
+
+
+def test_trends_use_the_last_n_counts(store):
+    for day, cost in enumerate([1.0, 2.0, 4.0, 8.0], start=1):
+        store.append(stocktake([cost, -cost, 0.0]), 'Soho', f'2024-01-0{day}')
+    trends = store.sku_trends('Soho', last_n=2).set_index('Name')
+    assert trends.loc['a', 'Counts'] == 4
+    assert trends.loc['a', 'Window Diff Cost'] == 12.0
+    assert trends.loc['b', 'Mean Diff Cost'] == -6.0
+    assert trends.loc['a', 'Last Count'] == '2024-01-04'
+    assert trends.loc['a', 'Total Usage Qty'] == 8.0
+
+
+def test_load_prunes_by_site_and_date(store):
+    for site in ('Soho', 'Camden'):
+        for day in (1, 2, 3):
+            store.append(stocktake([float(day)] * 3), site, f'2024-01-0{day}')
+    history = store.load(site='Camden', start='2024-01-02', end=date(2024, 1, 3), columns=['Diff Cost'])
+    assert set(history['site']) == {'Camden'}
+    assert sorted(set(history['count_date'])) == ['2024-01-02', '2024-01-03']
+    assert list(history.columns) == ['Name', 'Diff Cost', 'site', 'count_date']
+
+
+def test_temp_files_are_invisible_to_loads(store, tmp_path):
+    store.append(stocktake([1.0, 2.0, 3.0]), 'Soho', '2024-01-05')
+    partition = tmp_path / 'counts' / 'site=Soho' / 'count_date=2024-01-05'
+    # What a crash mid-save leaves behind
+    (partition / '.abc.parquet.123.tmp').write_bytes(b'partial')
+    assert sorted(store.load(site='Soho')['Diff Cost']) == [1.0, 2.0, 3.0]
+
+    # A recount replaces the stored upload but leaves another writer's temp file alone
+    store.append(stocktake([4.0, 5.0, 6.0]), 'Soho', '2024-01-05')
+    assert sorted(store.load(site='Soho')['Diff Cost']) == [4.0, 5.0, 6.0]
+    assert (partition / '.abc.parquet.123.tmp').exists()
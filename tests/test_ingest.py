@@ -0,0 +1,108 @@
+# test_ingest.py
+
+import sys
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ingest import NAME_DTYPE, NUMERIC_DTYPE, read_stocktake
+
+HEADER = ['Name', 'Unit', 'Open Val', 'Close Qty', 'Diff Cost']
+ROWS = [
+    ['Products - Spirits', None, None, None, None],
+    ['  GIN -  Tanqueray  ', 'btl', 10, 3, -12.5],
+    ['Tonic', 'btl', 5, 'n/a', 2],
+    ['Cola', 'btl', None, '4', None],
+    [None, None, None, None, None],
+    ['SUBTOTAL (this section)', None, 15, 7, -12.5],
+    ['Lemons', 'kg', 1, 0, 0],
+]
+
+
+def xlsx_bytes(header=HEADER, rows=ROWS):
+    import openpyxl
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def xls_bytes(header=HEADER, rows=ROWS):
+    xlwt = pytest.importorskip('xlwt')
+
+    workbook = xlwt.Workbook()
+    sheet = workbook.add_sheet('Stocktake')
+    for r, row in enumerate([header] + rows):
+        for c, value in enumerate(row):
+            if value is not None:
+                sheet.write(r, c, value)
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture(params=['xlsx-calamine', 'xlsx-openpyxl', 'xls'])
+def workbook(request, monkeypatch):
+    # Workbook writer for each reader path
+    if request.param == 'xlsx-calamine':
+        pytest.importorskip('python_calamine')
+    if request.param == 'xlsx-openpyxl':
+        monkeypatch.setitem(sys.modules, 'python_calamine', None)
+    return xls_bytes if request.param == 'xls' else xlsx_bytes
+
+
+def test_item_rows_are_kept_with_the_compact_schema(workbook):
+    df = read_stocktake(BytesIO(workbook()))
+    assert list(df.columns) == ['Name', 'Open Val', 'Close Qty', 'Diff Cost']
+    assert list(df['Name']) == ['GIN - Tanqueray', 'Cola', 'Lemons']
+    assert str(df['Name'].dtype) == NAME_DTYPE
+    assert all(str(df[column].dtype) == NUMERIC_DTYPE for column in ['Open Val', 'Close Qty', 'Diff Cost'])
+    assert list(df['Close Qty']) == [3, 4, 0]
+    assert df['Diff Cost'].isna().tolist() == [False, True, False]
+    assert df['Diff Cost'][0] == -12.5
+
+
+def test_only_requested_columns_are_read(workbook):
+    df = read_stocktake(BytesIO(workbook()), usecols=['Diff Cost'])
+    assert list(df.columns) == ['Name', 'Close Qty', 'Diff Cost']
+
+
+def test_missing_required_column(workbook):
+    header = ['Name', 'Unit', 'Open Val', 'Stock', 'Diff Cost']
+    with pytest.raises(ValueError, match="'Close Qty' column does not exist"):
+        read_stocktake(BytesIO(workbook(header=header)))
+
+
+def test_truncated_file_is_a_value_error(workbook):
+    data = workbook()
+    with pytest.raises(ValueError, match='corrupt or truncated'):
+        read_stocktake(BytesIO(data[:len(data) // 2]))
+
+
+def test_other_files_are_rejected():
+    with pytest.raises(ValueError, match='not an .xls or .xlsx workbook'):
+        read_stocktake(BytesIO(b'Name,Close Qty\nGin,1\n'))
+
+
+def test_reads_from_a_path(tmp_path):
+    path = tmp_path / 'stocktake.xlsx'
+    path.write_bytes(xlsx_bytes())
+    assert len(read_stocktake(str(path))) == 3
+
+
+def test_generated_export_matches_between_readers(monkeypatch):
+    pytest.importorskip('python_calamine')
+    from stocktake_generator import stocktake_bytes
+
+    data = stocktake_bytes(500, seed=3)
+    calamine = read_stocktake(BytesIO(data))
+    monkeypatch.setitem(sys.modules, 'python_calamine', None)
+    pd.testing.assert_frame_equal(calamine, read_stocktake(BytesIO(data)))
+    assert np.isfinite(calamine['Close Qty'].to_numpy(dtype=np.float64)).all()
@@ -0,0 +1,54 @@
+# test_packs.py
+
+import sys
+
+import numpy as np
+import pytest
+
+from packs import extract_parts, order_multiples, parse_pack_sizes, round_up
+
+NAMES = [
+    'Fever-Tree - Tonic 24 x 200ML (1 x 200ML)',
+    'Ale - Neck Oil - 30L, 1LT',
+    'Lager - Lost and Grounded Helles 30L, 30LT',
+    'Cider - sassy 0%, 275ML',
+    'GIN - Tanqueray 70CL, 700ML',
+    'Bar - Luxardo Cherries 400g, 400GR',
+    'Bar - Lemons',
+]
+
+
+def test_case_sizes_from_names():
+    packs = parse_pack_sizes(NAMES)
+    np.testing.assert_array_equal(packs['case_size'], [24, 30, 1, 1, 1, 1, 1])
+    np.testing.assert_array_equal(packs['stock_size'][:6], [200, 1000, 30000, 275, 700, 400])
+    assert list(packs['unit'][:6]) == ['ml', 'ml', 'ml', 'ml', 'ml', 'g']
+    assert np.isnan(packs['stock_size'][6])
+
+
+def test_regex_fallback_matches_pyarrow(monkeypatch):
+    with_pyarrow = extract_parts(NAMES)
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    monkeypatch.setitem(sys.modules, 'pyarrow.compute', None)
+    without_pyarrow = extract_parts(NAMES)
+    assert with_pyarrow.keys() == without_pyarrow.keys()
+    for field, values in with_pyarrow.items():
+        if values.dtype == np.float64:
+            np.testing.assert_array_equal(values, without_pyarrow[field])
+        else:
+            assert [value if isinstance(value, str) else None for value in values] == \
+                   [value if isinstance(value, str) else None for value in without_pyarrow[field]]
+
+
+def test_order_multiples_follow_supplier_rounding():
+    multiples = order_multiples([24, 24, 24], ['Amathus', 'Corner Shop', 'Loose Supplier'],
+                                rounding={'Loose Supplier': None})
+    np.testing.assert_array_equal(multiples[:2], [24, 1])
+    assert np.isnan(multiples[2])
+
+
+@pytest.mark.parametrize('quantity, multiple, expected', [
+    (20, 24, 24), (24.0000001, 24, 24), (25, 24, 48), (0.3, 1, 1), (3.5, 1, 4), (0.3, np.nan, 0.3), (5, 0, 5),
+])
+def test_round_up(quantity, multiple, expected):
+    assert round_up([quantity], [multiple])[0] == pytest.approx(expected)
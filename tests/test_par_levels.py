@@ -0,0 +1,102 @@
+# test_par_levels.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from par_levels import (MIN_COUNTS, PAR_COLUMNS, period_days, smooth_demand, usage_matrix, usage_par_table)
+
+DATES = pd.date_range('2024-01-01', periods=6, freq='7D').date
+
+
+def history(usage_by_name):
+    rows = [{'Name': name, 'count_date': date, 'Usage Qty': usage, 'Wastage Qty': 0.0}
+            for name, usages in usage_by_name.items() for date, usage in zip(DATES, usages) if usage is not None]
+    return pd.DataFrame(rows)
+
+
+PAR_TABLE = pd.DataFrame({
+    'Item': ['Steady', 'New', 'Uncounted'],
+    'par_level': [5.0, 7.0, 9.0],
+    'supplier': ['Amathus', 'Biercraft', 'Amathus'],
+    'case_size': [1.0, 24.0, 1.0],
+})
+
+
+def test_usage_matrix_adds_wastage_and_leaves_gaps():
+    df = pd.DataFrame({'Name': ['A', 'A', 'B'], 'count_date': [DATES[1], DATES[0], DATES[1]],
+                       'Usage Qty': [4.0, 3.0, np.nan], 'Wastage Qty': [1.0, np.nan, np.nan]})
+
+    names, dates, matrix = usage_matrix(df)
+
+    assert list(names) == ['A', 'B']
+    assert list(dates) == [DATES[0], DATES[1]]
+    np.testing.assert_array_equal(matrix, [[3.0, 5.0], [np.nan, np.nan]])
+
+
+def test_period_days_is_the_typical_gap():
+    assert period_days(DATES) == 7.0
+    assert period_days(DATES[:1]) == 7.0
+    assert period_days([DATES[0], DATES[0], DATES[2]]) == 14.0
+
+
+def test_smoothing_skips_uncounted_periods():
+    level, sigma, counts = smooth_demand(np.array([[10.0, np.nan, 10.0], [np.nan, np.nan, np.nan], [2.0, 4.0, np.nan]]),
+                                         alpha=0.5)
+
+    np.testing.assert_allclose(level, [10.0, np.nan, 3.0])
+    np.testing.assert_allclose(sigma[[0, 2]], [0.0, np.sqrt(0.5 * 0.5 * 4.0)])
+    np.testing.assert_array_equal(counts, [2, 0, 2])
+
+
+def test_usage_par_needs_enough_counts():
+    counted = [10.0] * MIN_COUNTS
+    result = usage_par_table(PAR_TABLE, history({'Steady': counted, 'New': counted[:MIN_COUNTS - 1]}))
+
+    assert list(result.columns) == PAR_COLUMNS
+    steady, new, uncounted = result.to_dict('records')
+
+    # Constant demand: no safety stock, cover is the 2 day lead time in weeks plus one review period
+    assert steady['Counts'] == MIN_COUNTS
+    assert steady['Usage Par'] == pytest.approx(10.0 * (2 / 7 + 1))
+    assert steady['par_level'] == round(10.0 * (2 / 7 + 1), 2)
+    assert steady['Catalog Par'] == 5.0
+
+    # Below MIN_COUNTS the usage par is reported but the catalog par is kept
+    assert new['Counts'] == MIN_COUNTS - 1
+    assert new['Usage Par'] == pytest.approx(10.0 * (3 / 7 + 1))
+    assert new['par_level'] == 7.0
+    assert new['case_size'] == 24.0
+
+    assert uncounted['Counts'] == 0
+    assert np.isnan(uncounted['Usage Par'])
+    assert uncounted['par_level'] == 9.0
+
+
+def test_usage_par_counts_only_periods_with_a_count():
+    gappy = [10.0, None, 10.0, None, 10.0, None]
+    result = usage_par_table(PAR_TABLE, history({'Steady': gappy, 'New': [1.0] * 6}), min_counts=3)
+
+    assert result['Counts'].tolist() == [3, 6, 0]
+    assert result['par_level'][0] == round(10.0 * (2 / 7 + 1), 2)
+
+
+def test_lead_times_can_be_overridden():
+    result = usage_par_table(PAR_TABLE, history({'Steady': [7.0] * 5}), lead_time_days={'Amathus': 7})
+    assert result['Usage Par'][0] == pytest.approx(14.0)
+
+
+@pytest.mark.parametrize('past', [None, pd.DataFrame(columns=['Name', 'count_date', 'Usage Qty']),
+                                  history({'Elsewhere': [1.0] * 6})], ids=['none', 'empty', 'unrelated'])
+def test_catalog_par_without_usable_history(past):
+    result = usage_par_table(PAR_TABLE, past)
+
+    assert result['par_level'].tolist() == PAR_TABLE['par_level'].tolist()
+    assert result['Catalog Par'].tolist() == PAR_TABLE['par_level'].tolist()
+    assert result['Counts'].tolist() == [0, 0, 0]
+    assert result['Usage Par'].isna().all()
+
+
+def test_par_table_without_case_sizes():
+    result = usage_par_table(PAR_TABLE.drop(columns='case_size'), None)
+    assert result['case_size'].tolist() == [1.0, 1.0, 1.0]
@@ -0,0 +1,116 @@
+# test_reconcile.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from catalog import Catalog
+from reconcile import (NameMatcher, MappingStore, apply_mappings, get_matcher, missing_from_stocktake, ngrams,
+                       reconcile_names)
+
+CATALOG_NAMES = ['GIN - Tanqueray 70CL, 700ML', 'GIN - Bombay Sapphire 70CL, 700ML', 'Bar - Lemons',
+                 'Lager - Lost and Grounded Helles 30L, 30LT']
+
+
+@pytest.fixture
+def catalog():
+    return Catalog([(name, '1', 'Amathus') for name in CATALOG_NAMES])
+
+
+def test_ngrams_are_padded_and_case_blind():
+    assert ngrams('Ab') == {'  a', ' ab', 'ab '}
+    assert ngrams('GIN') == ngrams('gin')
+
+
+def test_best_match_scores_with_dice():
+    matcher = NameMatcher(CATALOG_NAMES)
+
+    assert matcher.best_match('Bar - Lemons') == ('Bar - Lemons', 1.0)
+    match, score = matcher.best_match('gin tanqueray 70cl')
+    assert match == 'GIN - Tanqueray 70CL, 700ML'
+    assert 0.5 < score < 1.0
+    assert matcher.best_match('zzz') == (None, 0.0)
+
+
+def test_weak_matches_are_not_suggested():
+    matches = NameMatcher(CATALOG_NAMES).best_matches(['Bar - Lemon', 'Crisps - Salted'])
+
+    assert list(matches['Name']) == ['Bar - Lemon', 'Crisps - Salted']
+    assert matches['Suggested Match'][0] == 'Bar - Lemons'
+    assert pd.isna(matches['Suggested Match'][1])
+
+
+def test_reconcile_proposes_only_unmatched_and_unmapped_names(catalog):
+    df = pd.DataFrame({'Name': pd.Categorical(['Bar - Lemons', 'Tanqueray Gin 70CL', 'Bombay Sapphire',
+                                               'Tanqueray Gin 70CL'])})
+
+    proposals = reconcile_names(df, catalog, mappings={'Bombay Sapphire': 'GIN - Bombay Sapphire 70CL, 700ML'})
+
+    assert list(proposals.columns) == ['Name', 'Suggested Match', 'Score', 'Accept']
+    assert list(proposals['Name']) == ['Tanqueray Gin 70CL']
+    assert proposals['Suggested Match'][0] == 'GIN - Tanqueray 70CL, 700ML'
+    assert not proposals['Accept'][0]
+
+
+def test_matcher_is_built_once_per_catalog(catalog):
+    assert get_matcher(catalog) is get_matcher(catalog)
+    assert get_matcher(Catalog([('Bar - Lemons', '1', 'Amathus')])) is not get_matcher(catalog)
+
+
+def test_missing_from_stocktake(catalog):
+    df = pd.DataFrame({'Name': ['Bar - Lemons', 'GIN - Tanqueray 70CL, 700ML']})
+    assert missing_from_stocktake(df, catalog) == ['GIN - Bombay Sapphire 70CL, 700ML',
+                                                   'Lager - Lost and Grounded Helles 30L, 30LT']
+
+
+def test_apply_mappings_renames_categories():
+    df = pd.DataFrame({'Name': pd.Categorical(['Tanq Gin', 'Bar - Lemons', None, 'Tanqueray', 'Tanq Gin']),
+                       'Close Qty': [1.0, 2.0, 3.0, 4.0, 5.0]})
+    mappings = {'Tanq Gin': 'GIN - Tanqueray 70CL, 700ML', 'Tanqueray': 'GIN - Tanqueray 70CL, 700ML'}
+
+    renamed = apply_mappings(df, mappings)
+
+    assert isinstance(renamed['Name'].dtype, pd.CategoricalDtype)
+    assert list(renamed['Name'].cat.categories) == ['Bar - Lemons', 'GIN - Tanqueray 70CL, 700ML']
+    assert renamed['Name'].tolist()[:2] == ['GIN - Tanqueray 70CL, 700ML', 'Bar - Lemons']
+    assert pd.isna(renamed['Name'][2])
+    assert renamed['Name'].tolist()[3:] == ['GIN - Tanqueray 70CL, 700ML'] * 2
+    np.testing.assert_array_equal(renamed['Close Qty'], df['Close Qty'])
+    # The input frame is left as it was
+    assert df['Name'].tolist()[0] == 'Tanq Gin'
+
+
+def test_apply_mappings_on_plain_names():
+    df = pd.DataFrame({'Name': ['Tanq Gin', 'Bar - Lemons']})
+
+    renamed = apply_mappings(df, {'Tanq Gin': 'GIN - Tanqueray 70CL, 700ML'})
+
+    assert renamed['Name'].tolist() == ['GIN - Tanqueray 70CL, 700ML', 'Bar - Lemons']
+    assert df['Name'].tolist() == ['Tanq Gin', 'Bar - Lemons']
+
+
+@pytest.mark.parametrize('names', [pd.Categorical(['Bar - Lemons']), ['Bar - Lemons']], ids=['categorical', 'object'])
+def test_apply_mappings_without_a_hit_returns_the_frame(names):
+    df = pd.DataFrame({'Name': names})
+    assert apply_mappings(df, {'Tanq Gin': 'GIN - Tanqueray 70CL, 700ML'}) is df
+    assert apply_mappings(df, {}) is df
+
+
+def test_mapping_store_round_trip(tmp_path):
+    path = str(tmp_path / 'mappings.json')
+    store = MappingStore(path)
+    assert store.mappings() == {}
+
+    store.accept([('Tanq Gin', 'GIN - Tanqueray 70CL, 700ML')])
+    store.accept({'Lemons': 'Bar - Lemons'}.items())
+
+    expected = {'Tanq Gin': 'GIN - Tanqueray 70CL, 700ML', 'Lemons': 'Bar - Lemons'}
+    assert store.mappings() == expected
+    assert MappingStore(path).mappings() == expected
+    assert list(tmp_path.iterdir()) == [tmp_path / 'mappings.json']
+
+
+def test_unreadable_mapping_file_starts_empty(tmp_path):
+    path = tmp_path / 'mappings.json'
+    path.write_text('{not json', encoding='utf-8')
+    assert MappingStore(str(path)).mappings() == {}
@@ -0,0 +1,115 @@
+# test_recount.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from recount import RecountSession, StocktakeDiff, match_rows
+from reorder import build_par_table, compute_reorder
+from variance import VarianceBands
+
+NAMES = [f'Item {i}' for i in range(40)]
+
+
+def stocktake(names, close_qty, diff_cost):
+    return pd.DataFrame({
+        'Name': pd.Series(names, dtype='category'),
+        'Close Qty': pd.array(close_qty, dtype='Float32'),
+        'Diff Cost': pd.array(diff_cost, dtype='Float32'),
+    })
+
+
+def first_count(rng, rows=200):
+    # Whole-pound variances so many rows tie on Diff Cost; some names repeat, some costs are missing
+    names = rng.choice(NAMES, rows)
+    diff_cost = rng.integers(-40, 41, rows).astype(float)
+    diff_cost[rng.random(rows) < 0.05] = np.nan
+    return stocktake(names, rng.integers(0, 30, rows).astype(float), diff_cost)
+
+
+def recount_of(rng, df, changed=20, shuffle=False, removed=0, added=0):
+    names = df['Name'].astype(object).to_numpy()
+    close_qty = df['Close Qty'].to_numpy(dtype=np.float64, na_value=np.nan)
+    diff_cost = df['Diff Cost'].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    rows = rng.choice(len(df), changed, replace=False)
+    diff_cost[rows] = rng.integers(-40, 41, changed)
+    close_qty[rows[::2]] += 1
+
+    order = rng.permutation(len(df)) if shuffle else np.arange(len(df))
+    order = order[removed:]
+    names, close_qty, diff_cost = names[order], close_qty[order], diff_cost[order]
+    if added:
+        names = np.concatenate([names, rng.choice(NAMES + ['New item'], added)])
+        close_qty = np.concatenate([close_qty, rng.integers(0, 30, added).astype(float)])
+        diff_cost = np.concatenate([diff_cost, rng.integers(-40, 41, added).astype(float)])
+    return stocktake(names, close_qty, diff_cost)
+
+
+def assert_same_bands(patched, full):
+    np.testing.assert_array_equal(patched.codes, full.codes)
+    np.testing.assert_array_equal(patched.negative_rows, full.negative_rows)
+    np.testing.assert_array_equal(patched.positive_rows, full.positive_rows)
+
+
+def test_match_rows_pairs_repeated_names_in_order():
+    previous = pd.Series(['a', 'b', 'a', 'c'], dtype='category')
+    current = pd.Series(['c', 'a', 'a', 'd'], dtype='category')
+    np.testing.assert_array_equal(match_rows(previous, current), [3, 0, 2, -1])
+
+
+def test_diff_lists_changed_and_removed_rows():
+    previous = stocktake(['a', 'b', 'c'], [1, 2, 3], [5, np.nan, 7])
+    current = stocktake(['a', 'b', 'd'], [1, 2, 3], [6, np.nan, 7])
+    diff = StocktakeDiff(previous, current)
+    np.testing.assert_array_equal(diff.changed, [0, 2])
+    np.testing.assert_array_equal(diff.removed, [2])
+    assert set(diff.names) == {'a', 'c', 'd'}
+
+
+def test_patched_bands_order_ties_by_row():
+    previous = stocktake(['a', 'b', 'c', 'd'], [1, 1, 1, 1], [-100, -50, -50, 20])
+    current = stocktake(['a', 'b', 'c', 'd'], [1, 1, 1, 1], [-50, -50, -50, 20])
+    patched = VarianceBands(previous).patched(current, np.arange(4), np.array([0]))
+    assert_same_bands(patched, VarianceBands(current))
+    assert list(patched.negative_rows) == [0, 1, 2]
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('shuffle', [False, True])
+def test_recount_matches_full_recompute(seed, shuffle):
+    rng = np.random.default_rng(seed)
+    previous = first_count(rng)
+    current = recount_of(rng, previous, changed=25, shuffle=shuffle, removed=3 if shuffle else 0,
+                         added=4 if shuffle else 0)
+    par_table = build_par_table({name: {'par_level': 15, 'supplier': 'Amathus' if i % 2 else 'Biercraft'}
+                                 for i, name in enumerate(NAMES)})
+
+    session = RecountSession(max_changed_ratio=1.0)
+    session.load(previous, 'first')
+    session.bands()
+    session.orders(par_table)
+    session.load(current, 'second')
+    assert session.diff is not None
+
+    assert_same_bands(session.bands(), VarianceBands(current))
+    pd.testing.assert_frame_equal(session.orders(par_table), compute_reorder(current, None, par_table=par_table))
+
+
+def test_large_recount_falls_back_to_full_recompute():
+    rng = np.random.default_rng(0)
+    previous = first_count(rng)
+    session = RecountSession(max_changed_ratio=0.1)
+    session.load(previous, 'first')
+    session.load(recount_of(rng, previous, changed=100), 'second')
+    assert session.diff is None
+
+
+def test_same_key_keeps_results():
+    rng = np.random.default_rng(0)
+    previous = first_count(rng)
+    session = RecountSession()
+    session.load(previous, 'first')
+    bands = session.bands()
+    session.load(previous.copy(), 'first')
+    assert session.bands() is bands
@@ -0,0 +1,71 @@
+# test_reorder.py
+
+import numpy as np
+import pandas as pd
+
+from reorder import ORDER_COLUMNS, build_par_table, compute_reorder, group_orders_by_supplier, reorder_by_supplier
+
+ITEMS_INFO = {
+    'Fever-Tree - Tonic 24 x 200ML (1 x 200ML)': {'par_level': 48, 'supplier': 'Amathus'},
+    'GIN - Tanqueray 70CL, 700ML': {'par_level': 2, 'supplier': 'Corner Shop'},
+    'Ale - Neck Oil - 30L, 1LT': {'par_level': 60, 'supplier': 'Biercraft'},
+    'Bar - Lemons': {'par_level': None, 'supplier': 'Amathus'},
+    'Bar - Limes': {'par_level': 10, 'supplier': None},
+}
+
+
+def stocktake(rows):
+    names, close_qty = zip(*rows)
+    return pd.DataFrame({'Name': pd.Series(names, dtype='category'),
+                         'Close Qty': pd.array(close_qty, dtype='Float32')})
+
+
+def test_par_table_skips_incomplete_items_and_adds_case_sizes():
+    par_table = build_par_table(ITEMS_INFO)
+    assert list(par_table['Item']) == list(ITEMS_INFO)[:3]
+    np.testing.assert_array_equal(par_table['case_size'], [24, 1, 30])
+
+
+def test_orders_are_rounded_up_to_what_the_supplier_sells():
+    df = stocktake([
+        ('Ale - Neck Oil - 30L, 1LT', 20),
+        ('GIN - Tanqueray 70CL, 700ML', 1.7),
+        ('Fever-Tree - Tonic 24 x 200ML (1 x 200ML)', 28),
+        ('Fever-Tree - Tonic 24 x 200ML (1 x 200ML)', 0),
+        ('Not in the catalog', 0),
+    ])
+    orders = compute_reorder(df, ITEMS_INFO)
+    assert list(orders.columns) == ORDER_COLUMNS
+    # Catalog order; only the first row of a repeated name counts
+    assert list(orders['Item']) == list(ITEMS_INFO)[:3]
+    np.testing.assert_allclose(orders['Quantity Needed'], [24, 1, 60])
+
+
+def test_items_at_or_above_par_and_missing_counts_are_not_ordered():
+    df = stocktake([('GIN - Tanqueray 70CL, 700ML', 2), ('Ale - Neck Oil - 30L, 1LT', None)])
+    assert compute_reorder(df, ITEMS_INFO).empty
+
+
+def test_empty_stocktake():
+    orders = compute_reorder(stocktake([('x', 1)]).iloc[:0], ITEMS_INFO)
+    assert orders.empty and list(orders.columns) == ORDER_COLUMNS
+
+
+def test_par_table_without_case_sizes_is_not_rounded():
+    par_table = build_par_table(ITEMS_INFO).drop(columns='case_size')
+    orders = compute_reorder(stocktake([('Fever-Tree - Tonic 24 x 200ML (1 x 200ML)', 28)]), None, par_table=par_table)
+    assert list(orders['Quantity Needed']) == [20]
+
+
+def test_every_supplier_gets_a_table():
+    grouped = reorder_by_supplier(stocktake([('GIN - Tanqueray 70CL, 700ML', 0)]), ITEMS_INFO)
+    assert list(grouped) == ['Amathus', 'Corner Shop', 'Biercraft']
+    assert grouped['Amathus'].empty and list(grouped['Amathus'].columns) == ORDER_COLUMNS
+    assert list(grouped['Corner Shop']['Quantity Needed']) == [2]
+
+
+def test_group_orders_keeps_suppliers_without_orders():
+    orders = pd.DataFrame({'Item': ['a', 'b'], 'Quantity Needed': [1.0, 2.0], 'Supplier': ['X', 'X']})
+    grouped = group_orders_by_supplier(orders, ['Y', 'X'])
+    assert list(grouped) == ['Y', 'X']
+    assert grouped['Y'].empty and list(grouped['X']['Item']) == ['a', 'b']
@@ -0,0 +1,161 @@
+# test_result_cache.py
+
+import threading
+import time
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from recount import RecountSession
+from result_cache import ResultCache, freeze, result_nbytes
+from variance import DEFAULT_THRESHOLDS, VarianceBands
+
+
+def frame(rows=100):
+    return pd.DataFrame({'x': np.arange(rows, dtype=np.float64)})
+
+
+def test_second_get_is_a_hit():
+    cache = ResultCache()
+    first = cache.get_or_compute('upload', 1, ('orders',), frame)
+    pd.testing.assert_frame_equal(cache.get_or_compute('upload', 1, ('orders',), lambda: pytest.fail('recomputed')),
+                                  first)
+    stats = cache.hit_counts()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+
+def test_concurrent_sessions_compute_once():
+    cache = ResultCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return frame()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('upload', 1, ('orders',), compute)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    for result in results:
+        pd.testing.assert_frame_equal(result, results[0])
+
+
+def test_failed_computation_is_retried_by_a_waiter():
+    cache = ResultCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        if len(calls) == 1:
+            raise RuntimeError('boom')
+        return 'ok'
+
+    results = []
+
+    def run():
+        try:
+            results.append(cache.get_or_compute('upload', 1, ('orders',), compute))
+        except RuntimeError as error:
+            results.append(str(error))
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == ['boom', 'ok', 'ok']
+    assert len(calls) == 2
+
+
+def test_catalog_change_drops_old_results():
+    cache = ResultCache()
+    cache.get_or_compute('upload', 1, ('orders',), frame)
+    cache.get_or_compute('upload', 2, ('orders',), frame)
+    assert cache.hit_counts()['entries'] == 1
+    assert cache.hit_counts()['misses'] == 2
+
+
+def test_least_recently_used_results_are_evicted():
+    size = result_nbytes(frame())
+    cache = ResultCache(max_bytes=2 * size)
+    for upload in ('a', 'b'):
+        cache.get_or_compute(upload, 1, ('orders',), frame)
+    cache.get_or_compute('a', 1, ('orders',), frame)
+    cache.get_or_compute('c', 1, ('orders',), frame)
+    stats = cache.hit_counts()
+    assert (stats['entries'], stats['evictions'], stats['bytes']) == (2, 1, 2 * size)
+    cache.get_or_compute('a', 1, ('orders',), frame)
+    assert cache.hit_counts()['hits'] == 2
+
+
+def test_results_are_read_only():
+    frozen = freeze({'Amathus': frame(), 'lines': [1, 2]})
+    assert isinstance(frozen, MappingProxyType)
+    assert frozen['lines'] == (1, 2)
+    with pytest.raises(TypeError):
+        frozen['Amathus'] = None
+
+
+
+def test_writes_to_a_handed_out_frame_do_not_reach_the_cache():
+    cache = ResultCache()
+    first = cache.get_or_compute('upload', 1, ('orders',), frame)
+    first.loc[0, 'x'] = 99.0
+    first['y'] = 1.0
+    grouped = cache.get_or_compute('upload', 1, ('grouped',), lambda: {'Amathus': frame()})
+    grouped['Amathus'].iloc[1, 0] = -1.0
+
+    again = cache.get_or_compute('upload', 1, ('orders',), frame)
+    assert again.loc[0, 'x'] == 0.0 and list(again.columns) == ['x']
+    assert cache.get_or_compute('upload', 1, ('grouped',), frame)['Amathus'].iloc[1, 0] == 1.0
+
+
+def test_result_bytes_count_arrays_and_frame_of_result_objects():
+    df = pd.DataFrame({'Name': [f'Item {i}' for i in range(1000)], 'Diff Cost': np.linspace(-50, 50, 1000)})
+    bands = VarianceBands(df)
+    arrays = bands.diff_cost.nbytes + bands.codes.nbytes + bands.positive_rows.nbytes + bands.negative_rows.nbytes
+    assert result_nbytes(bands) >= arrays + result_nbytes(df)
+
+
+def stocktake(diff_cost):
+    return pd.DataFrame({'Name': pd.Series([f'Item {i}' for i in range(len(diff_cost))], dtype='category'),
+                         'Close Qty': pd.array(np.ones(len(diff_cost)), dtype='Float32'),
+                         'Diff Cost': pd.array(diff_cost, dtype='Float32')})
+
+
+def session_bands(cache, session, df, upload_id):
+    # What the app does on every rerun: load into the session, share the bands, keep them in the session
+    session.load(df, upload_id)
+    bands = cache.get_or_compute(upload_id, 1, ('bands', DEFAULT_THRESHOLDS),
+                                 lambda: session.compute_bands(DEFAULT_THRESHOLDS))
+    return session.store_bands(DEFAULT_THRESHOLDS, bands)
+
+
+def test_session_served_from_cache_can_still_patch_its_next_recount(monkeypatch):
+    patched = []
+    original = VarianceBands.patched
+    monkeypatch.setattr(VarianceBands, 'patched', lambda self, *args: patched.append(1) or original(self, *args))
+    cache = ResultCache()
+    first = stocktake(np.arange(-60.0, 60.0))
+    session_bands(cache, RecountSession(), first, 'first')
+
+    # A second session opens the same file and is served from the cache
+    session = RecountSession()
+    hits = cache.hit_counts()['hits']
+    session_bands(cache, session, first, 'first')
+    assert cache.hit_counts()['hits'] == hits + 1
+
+    recount = first.copy()
+    recount.loc[3, 'Diff Cost'] = 45.0
+    bands = session_bands(cache, session, recount, 'recount')
+    assert session.diff is not None and len(session.diff) == 1
+    assert patched == [1]
+    np.testing.assert_array_equal(bands.positive_rows, VarianceBands(recount).positive_rows)
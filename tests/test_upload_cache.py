@@ -0,0 +1,114 @@
+# test_upload_cache.py
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from upload_cache import UploadCache, frame_nbytes
+
+
+def parsed(rows=100, seed=0):
+    return pd.DataFrame({'Name': pd.Series([f'Item {i}' for i in range(rows)], dtype='category'),
+                         'Close Qty': pd.array(np.arange(rows, dtype=np.float64) + seed, dtype='Float32')})
+
+
+class Loader:
+    def __init__(self, df):
+        self.df = df
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.df
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return UploadCache(cache_dir=str(tmp_path / 'cache'))
+
+
+def test_memory_hit_returns_an_independent_copy(cache):
+    loader = Loader(parsed())
+    first = cache.get_or_load(b'upload', loader)
+    first.loc[0, 'Close Qty'] = -1
+    second = cache.get_or_load(b'upload', loader)
+    assert loader.calls == 1
+    assert second.loc[0, 'Close Qty'] == 0
+    assert cache.hit_counts() == {'memory_hits': 1, 'disk_hits': 0, 'misses': 1, 'hits': 1}
+
+
+def test_disk_tier_survives_a_new_process(cache, tmp_path):
+    cache.get_or_load(b'upload', Loader(parsed()))
+    restarted = UploadCache(cache_dir=str(tmp_path / 'cache'))
+    df = restarted.get_or_load(b'upload', lambda: pytest.fail('parsed again'))
+    pd.testing.assert_frame_equal(df, parsed())
+    restarted.get_or_load(b'upload', lambda: pytest.fail('parsed again'))
+    assert restarted.hit_counts() == {'memory_hits': 1, 'disk_hits': 1, 'misses': 0, 'hits': 2}
+
+
+def test_failed_parses_are_not_cached(cache):
+    assert cache.get_or_load(b'broken', lambda: None) is None
+    loader = Loader(parsed())
+    cache.get_or_load(b'broken', loader)
+    assert loader.calls == 1
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    size = frame_nbytes(parsed())
+    cache = UploadCache(cache_dir=str(tmp_path), max_memory_bytes=2 * size, max_disk_bytes=0)
+    for upload in (b'a', b'b'):
+        cache.get_or_load(upload, Loader(parsed()))
+    cache.get_or_load(b'a', Loader(parsed()))
+    cache.get_or_load(b'c', Loader(parsed()))
+
+    cache.get_or_load(b'a', lambda: pytest.fail('recently used frame was evicted'))
+    loader = Loader(parsed())
+    cache.get_or_load(b'b', loader)
+    assert loader.calls == 1
+    assert not os.listdir(tmp_path)
+
+
+def test_disk_tier_evicts_oldest_files(tmp_path):
+    cache = UploadCache(cache_dir=str(tmp_path), max_memory_bytes=0)
+    cache.get_or_load(b'a', Loader(parsed(seed=1)))
+    entry_bytes = sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path))
+    cache.max_disk_bytes = int(entry_bytes * 1.5)
+    os.utime(tmp_path / os.listdir(tmp_path)[0], (1, 1))
+    cache.get_or_load(b'b', Loader(parsed(seed=2)))
+
+    assert len(os.listdir(tmp_path)) == 1
+    loader = Loader(parsed(seed=1))
+    cache.get_or_load(b'a', loader)
+    assert loader.calls == 1
+
+
+def test_corrupt_disk_entry_is_parsed_again(cache, tmp_path):
+    cache.get_or_load(b'upload', Loader(parsed()))
+    for name in os.listdir(tmp_path / 'cache'):
+        (tmp_path / 'cache' / name).write_bytes(b'not parquet')
+    restarted = UploadCache(cache_dir=str(tmp_path / 'cache'))
+    loader = Loader(parsed())
+    pd.testing.assert_frame_equal(restarted.get_or_load(b'upload', loader), parsed())
+    assert loader.calls == 1
+
+
+def test_unwritable_cache_directory_does_not_fail_the_upload(tmp_path):
+    blocker = tmp_path / 'cache'
+    blocker.write_bytes(b'a file where the directory should be')
+    cache = UploadCache(cache_dir=str(blocker))
+    pd.testing.assert_frame_equal(cache.get_or_load(b'upload', Loader(parsed())), parsed())
+    assert cache.get_or_load(b'upload', lambda: pytest.fail('parsed again')) is not None
+
+
+def test_failed_disk_write_leaves_no_temp_file(cache, tmp_path, monkeypatch):
+    def full_disk(self, path, *args, **kwargs):
+        with open(path, 'wb') as handle:
+            handle.write(b'partial')
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(pd.DataFrame, 'to_parquet', full_disk)
+    monkeypatch.setattr(pd.DataFrame, 'to_pickle', full_disk)
+    pd.testing.assert_frame_equal(cache.get_or_load(b'upload', Loader(parsed())), parsed())
+    assert os.listdir(tmp_path / 'cache') == []
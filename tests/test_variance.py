@@ -0,0 +1,60 @@
+# test_variance.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from variance import VarianceBands, band_codes, band_labels, band_profiles, check_thresholds
+
+
+def test_band_edges_match_the_old_masks():
+    diff_cost = [4.99, 5, 10, 10.01, 20, 30, 30.5, -4.99, -5, -9.99, -10, -20, -30, -31, np.nan]
+    np.testing.assert_array_equal(band_codes(diff_cost), [0, 1, 1, 2, 2, 3, 4, 0, -1, -1, -2, -3, -4, -4, 0])
+
+
+def test_band_labels():
+    labels = band_labels((5, 10))
+    assert labels == {0: '', 1: '+5 to +10', -1: '-5 to -10', 2: 'over +10', -2: '-10 or below'}
+
+
+@pytest.mark.parametrize('thresholds', [(), (0, 5), (10, 5), (5, 5), [[5, 10]]])
+def test_bad_thresholds_are_rejected(thresholds):
+    with pytest.raises(ValueError):
+        check_thresholds(thresholds)
+
+
+def test_views_are_ordered_largest_first():
+    df = pd.DataFrame({'Name': list('abcdef'), 'Diff Cost': [12.0, -40.0, 3.0, 12.0, -6.0, 50.0]})
+    bands = VarianceBands(df)
+    assert list(bands.positive()['Name']) == ['f', 'd', 'a']
+    assert list(bands.negative()['Name']) == ['b', 'e']
+    assert list(bands.positive(['Name']).columns) == ['Name']
+
+
+def test_bands_read_nullable_and_text_costs_without_modifying_the_frame():
+    df = pd.DataFrame({'Name': list('abc'), 'Diff Cost': pd.array([7.5, None, -25.0], dtype='Float32')})
+    before = df.copy()
+    bands = VarianceBands(df)
+    np.testing.assert_array_equal(bands.codes, [1, 0, -3])
+    pd.testing.assert_frame_equal(df, before)
+
+    text = pd.DataFrame({'Name': list('ab'), 'Diff Cost': ['7.5', 'n/a']})
+    np.testing.assert_array_equal(VarianceBands(text).codes, [1, 0])
+
+
+def test_missing_diff_cost_column_gives_empty_bands():
+    bands = VarianceBands(pd.DataFrame({'Name': list('ab')}))
+    assert len(bands.positive()) == 0 and len(bands.negative()) == 0
+
+
+def test_labels_per_row():
+    bands = VarianceBands(pd.DataFrame({'Diff Cost': [6.0, 0.0, -35.0]}))
+    assert list(bands.labels()) == ['+5 to +10', '', '-30 or below']
+
+
+def test_band_profiles_share_one_frame():
+    df = pd.DataFrame({'Diff Cost': [6.0, 15.0, -15.0]})
+    profiles = band_profiles(df, {'strict': (1, 2), 'default': (5, 10, 20, 30)})
+    np.testing.assert_array_equal(profiles['strict'].codes, [2, 2, -2])
+    np.testing.assert_array_equal(profiles['default'].codes, [1, 2, -2])
+    assert profiles['strict'].diff_cost is profiles['default'].diff_cost
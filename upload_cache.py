@@ -0,0 +1,202 @@
+# upload_cache.py
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from instrumentation import get_logger
+
+logger = get_logger('upload_cache')
+
+# Bump whenever the ingest logic changes so stale parses are not served from disk
+PARSER_VERSION = 3
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'INVENTORY_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.stocktake_cache'))
+DEFAULT_MEMORY_BYTES = int(os.environ.get('INVENTORY_CACHE_MEMORY_BYTES', 256 * 1024 * 1024))
+DEFAULT_DISK_BYTES = int(os.environ.get('INVENTORY_CACHE_DISK_BYTES', 1024 * 1024 * 1024))
+
+
+def hash_upload(data):
+    # Key on the uploaded bytes plus the parser version
+    digest = hashlib.blake2b(data, digest_size=20)
+    digest.update(f'parser-v{PARSER_VERSION}'.encode())
+    return digest.hexdigest()
+
+
+def frame_nbytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+########################################################################################################
+##########################                   TWO-TIER CACHE             ################################
+########################################################################################################
+
+class UploadCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_memory_bytes=DEFAULT_MEMORY_BYTES,
+                 max_disk_bytes=DEFAULT_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+
+        # key -> (DataFrame, nbytes), least recently used first
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+    # ---------------------------------------------------------------- public API
+
+    def get_or_load(self, data, loader):
+        key = hash_upload(data)
+
+        df = self._get_memory(key)
+        if df is not None:
+            self._count('memory_hits')
+            logger.debug('upload cache hit', extra={'tier': 'memory', 'key': key})
+            return df.copy()
+
+        df = self._get_disk(key)
+        if df is not None:
+            self._count('disk_hits')
+            logger.debug('upload cache hit', extra={'tier': 'disk', 'key': key})
+            self._put_memory(key, df)
+            return df.copy()
+
+        self._count('misses')
+        logger.debug('upload cache miss', extra={'key': key, 'bytes': len(data)})
+        df = loader()
+        # Failed parses (None) are not cached so a fixed loader gets another go
+        if df is not None:
+            self._put_memory(key, df)
+            self._put_disk(key, df)
+            df = df.copy()
+        return df
+
+    def hit_counts(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['hits'] = stats['memory_hits'] + stats['disk_hits']
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        for path, _, _ in self._disk_entries():
+            self._remove(path)
+
+    # ---------------------------------------------------------------- memory tier
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            self._memory.move_to_end(key)
+            return entry[0]
+
+    def _put_memory(self, key, df):
+        nbytes = frame_nbytes(df)
+        if nbytes > self.max_memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= self._memory.pop(key)[1]
+            self._memory[key] = (df.copy(), nbytes)
+            self._memory_bytes += nbytes
+            # Evict least recently used frames until under the byte budget
+            while self._memory_bytes > self.max_memory_bytes:
+                _, (_, evicted_bytes) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_bytes
+
+    # ---------------------------------------------------------------- disk tier
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.parquet', base + '.pkl'
+
+    def _get_disk(self, key):
+        for path in self._paths(key):
+            if not os.path.exists(path):
+                continue
+            try:
+                df = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_pickle(path)
+            except Exception:
+                # Corrupt or unreadable entry, drop it and re-parse
+                self._remove(path)
+                continue
+            # Touch the file so eviction treats it as recently used
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+            return df
+        return None
+
+    def _put_disk(self, key, df):
+        # Best effort: a full disk or read-only cache directory costs the next re-parse, never the upload
+        if self.max_disk_bytes <= 0:
+            return
+        parquet_path, pickle_path = self._paths(key)
+        tmp_path = parquet_path + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            try:
+                df.to_parquet(tmp_path, index=True)
+                target = parquet_path
+            except Exception:
+                # Mixed-type object columns (e.g. '' next to floats) cannot be written
+                # to Parquet, so fall back to pickle for those frames
+                df.to_pickle(tmp_path)
+                target = pickle_path
+            os.replace(tmp_path, target)
+            self._evict_disk()
+        except Exception as error:
+            logger.warning('upload cache write failed', extra={'key': key, 'error': f'{type(error).__name__}: {error}'})
+            self._remove(tmp_path)
+
+    def _disk_entries(self):
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return []
+        entries = []
+        for name in names:
+            if not name.endswith(('.parquet', '.pkl')):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _evict_disk(self):
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.max_disk_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Shared by every Streamlit session in the process
+upload_cache = UploadCache()
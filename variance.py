@@ -0,0 +1,145 @@
+# variance.py
+
+import numpy as np
+import pandas as pd
+
+# Variance bands in pounds of 'Diff Cost', applied symmetrically to gains and losses
+DEFAULT_THRESHOLDS = (5, 10, 20, 30)
+
+# Columns left out of the variance table, in the app and in the batch reports
+VARIANCE_DROP_COLUMNS = ['Open Val', 'Req', 'Close Val', 'Diff Qty Last', 'Diff Weight AVG', 'Wastage Qty', 'Usage Qty']
+
+
+def check_thresholds(thresholds):
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    if thresholds.ndim != 1 or thresholds.size == 0:
+        raise ValueError("Variance thresholds must be a non-empty list of numbers.")
+    if thresholds[0] <= 0 or np.any(np.diff(thresholds) <= 0):
+        raise ValueError("Variance thresholds must be positive and strictly increasing.")
+    return thresholds
+
+
+def diff_cost_values(df):
+    # Coerce without writing back, so the caller's frame is left untouched
+    if 'Diff Cost' not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df['Diff Cost'], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+########################################################################################################
+##########################                    BAND ASSIGNMENT           ################################
+########################################################################################################
+
+def band_codes(diff_cost, thresholds=DEFAULT_THRESHOLDS):
+    # One binned pass: +k / -k for the k-th band above / below zero, 0 for rows outside every band.
+    # Gains use (lo, hi] with the first band closed at its lower edge (5 <= x <= 10, 10 < x <= 20, ...),
+    # losses use [lo, hi) on the magnitude (-10 < x <= -5, -20 < x <= -10, ...), as the old masks did.
+    thresholds = check_thresholds(thresholds)
+    diff_cost = np.asarray(diff_cost, dtype=np.float64)
+
+    codes = np.zeros(diff_cost.shape, dtype=np.int8)
+    positive = diff_cost >= thresholds[0]
+    negative = diff_cost <= -thresholds[0]
+
+    codes[positive] = np.maximum(np.searchsorted(thresholds, diff_cost[positive], side='left'), 1)
+    codes[negative] = -np.searchsorted(thresholds, -diff_cost[negative], side='right')
+    return codes
+
+
+def band_labels(thresholds=DEFAULT_THRESHOLDS):
+    thresholds = check_thresholds(thresholds)
+    edges = [f'{edge:g}' for edge in thresholds]
+
+    labels = {0: ''}
+    for k in range(1, len(edges) + 1):
+        upper = edges[k] if k < len(edges) else None
+        labels[k] = f'+{edges[k - 1]} to +{upper}' if upper else f'over +{edges[k - 1]}'
+        labels[-k] = f'-{edges[k - 1]} to -{upper}' if upper else f'-{edges[k - 1]} or below'
+    return labels
+
+
+class VarianceBands:
+    def __init__(self, df, thresholds=DEFAULT_THRESHOLDS, diff_cost=None):
+        self.df = df
+        self.thresholds = tuple(check_thresholds(thresholds))
+        if diff_cost is None:
+            diff_cost = diff_cost_values(df)
+        self.diff_cost = diff_cost
+        self.codes = band_codes(diff_cost, self.thresholds)
+
+        # A single stable sort serves both views: losses ascending from the front,
+        # gains descending from the back
+        order = np.argsort(diff_cost, kind='stable')
+        ordered_codes = self.codes[order]
+        self.negative_rows = order[ordered_codes < 0]
+        self.positive_rows = order[ordered_codes > 0][::-1]
+
+    def patched(self, df, matched, changed, diff_cost=None):
+        # Bands for a recount of the same stocktake without re-sorting it. `matched` maps every row of df
+        # to its row in self.df (-1 for new rows); `changed` lists the rows of df whose Diff Cost changed.
+        # Only those rows are re-banded and merged into the carried-over orderings.
+        if diff_cost is None:
+            diff_cost = diff_cost_values(df)
+        matched = np.asarray(matched, dtype=np.intp)
+        changed = np.asarray(changed, dtype=np.intp)
+
+        carried = matched >= 0
+        carried[changed] = False
+        codes = np.zeros(len(df), dtype=np.int8)
+        codes[carried] = self.codes[matched[carried]]
+        codes[changed] = band_codes(diff_cost[changed], self.thresholds)
+
+        # Old row -> new row for the carried rows, so the old orderings can be reused
+        new_row = np.full(len(self.df), -1, dtype=np.intp)
+        new_row[matched[carried]] = np.flatnonzero(carried)
+
+        def merge(old_rows, added):
+            # Rows ordered by (Diff Cost, row) as the full stable sort orders them, ties included
+            kept = new_row[old_rows]
+            kept = kept[kept >= 0]
+            kept_cost = diff_cost[kept]
+            if np.any((kept_cost[1:] == kept_cost[:-1]) & (kept[1:] < kept[:-1])):
+                # Rows moved within the sheet, so ties carried over from the old order are out of row order
+                kept = kept[np.lexsort((kept, kept_cost))]
+                kept_cost = diff_cost[kept]
+
+            added = added[np.lexsort((added, diff_cost[added]))]
+            added_cost = diff_cost[added]
+            at = np.searchsorted(kept_cost, added_cost, side='left')
+            tied_end = np.searchsorted(kept_cost, added_cost, side='right')
+            for i in np.flatnonzero(tied_end > at):
+                # Equal Diff Cost: place the row among the tied rows by row number
+                at[i] += np.searchsorted(kept[at[i]:tied_end[i]], added[i])
+            return np.insert(kept, at, added)
+
+        bands = object.__new__(VarianceBands)
+        bands.df = df
+        bands.thresholds = self.thresholds
+        bands.diff_cost = diff_cost
+        bands.codes = codes
+        bands.negative_rows = merge(self.negative_rows, changed[codes[changed] < 0])
+        bands.positive_rows = merge(self.positive_rows[::-1], changed[codes[changed] > 0])[::-1]
+        return bands
+
+    def labels(self):
+        labels = band_labels(self.thresholds)
+        codes = sorted(labels)
+        return pd.Categorical.from_codes(np.searchsorted(codes, self.codes),
+                                         categories=[labels[code] for code in codes])
+
+    # Views are positional takes of the source frame, built only when asked for
+    def positive(self, columns=None):
+        return self._view(self.positive_rows, columns)
+
+    def negative(self, columns=None):
+        return self._view(self.negative_rows, columns)
+
+    def _view(self, rows, columns):
+        df = self.df if columns is None else self.df[columns]
+        return df.take(rows)
+
+
+def band_profiles(df, profiles):
+    # Several threshold profiles (per venue, per category, ...) over one coerced 'Diff Cost' column
+    diff_cost = diff_cost_values(df)
+    return {name: VarianceBands(df, thresholds, diff_cost=diff_cost) for name, thresholds in profiles.items()}